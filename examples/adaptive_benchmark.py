@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+adaptive_benchmark.py
+
+Values game put options of several strikes with gcc.valuation.value_adaptive,
+to a target standard error or within a deadline, and shows the number of paths
+and the time each contract needed, against the time of valuing all contracts
+with the number of paths the most demanding one needed.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import getopt
+import gcc.security_simulation
+import gcc.valuation
+from gcc.claims import game_put_option
+from datetime import datetime
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python adaptive_benchmark.py [-e/--error e] [-d/--deadline s] [-K/--strikes k1,k2,...] [-L/--steps l] [-m/--lse m]
+
+-e/--error e       the target standard error of the prices (default 0.01)
+
+-d/--deadline s    the deadline of each valuation in seconds (default none)
+
+-K/--strikes       comma separated strikes (default 90,110,130)
+
+-L/--steps l       number of time steps (default 50)
+
+-m/--lse m         use the LSE method with m basis functions (default no LSE)
+'''
+
+
+r          = 0.06
+T          = 0.5
+S0         = 100
+volatility = 0.4
+delta      = 20
+
+
+def seconds(t0):
+    dt = datetime.now() - t0
+    return dt.seconds + dt.microseconds/1e6
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "he:d:K:L:m:",
+                ["help", "error=", "deadline=", "strikes=", "steps=", "lse="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        tolerance = 0.01
+        deadline  = None
+        K_tuple   = (90, 110, 130)
+        L         = 50
+        params    = {}
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-e", "--error"):
+                tolerance = float(value.strip())
+            if option in ("-d", "--deadline"):
+                deadline = float(value.strip())
+            if option in ("-K", "--strikes"):
+                K_tuple = [float(v) for v in value.split(",")]
+            if option in ("-L", "--steps"):
+                L = int(value.strip())
+            if option in ("-m", "--lse"):
+                params["m"] = int(value.strip())
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    def simulate(n, k):
+        return gcc.security_simulation.black_scholes(S0, r, volatility, T, n, L)[0]
+
+    # Compile the kernels, or load them from the cache
+    S = simulate(1000, 0)
+    gcc.valuation.value_gcc(S, *game_put_option.payoffs(S, K_tuple[0], delta), r=r, T=T, **dict(params))
+
+    print "L =", L, "  m =", params.get("m", "no LSE"), "  target error =", tolerance, "  deadline =", deadline
+    print "%8s %11s %10s %10s %11s %10s %10s" % ("K", "V", "std error", "N", "increments", "converged", "time (s)")
+    adaptive_time = 0
+    N_max         = 0
+    for K in K_tuple:
+        payoffs = lambda S: game_put_option.payoffs(S, K, delta)
+        t0 = datetime.now()
+        valuation = gcc.valuation.value_adaptive(simulate, payoffs, r, T, tolerance, deadline, **dict(params))
+        t = seconds(t0)
+        adaptive_time += t
+        N_max          = max(N_max, valuation["N"])
+        print "%8.1f %11.5f %10.5f %10i %11i %10s %10.3f" % (K, valuation["V"], valuation["std_error"],
+            valuation["N"], valuation["increments"], valuation["converged"], t)
+
+    # Valuing every contract with the paths of the most demanding one
+    t0 = datetime.now()
+    for K in K_tuple:
+        S = simulate(N_max, 0)
+        X, Y = game_put_option.payoffs(S, K, delta)
+        gcc.valuation.value_gcc(S, X, Y, r, T, **dict(params))
+        del S, X, Y
+    print "adaptive: %.3f s,  fixed N = %i: %.3f s" % (adaptive_time, N_max, seconds(t0))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+backend_benchmark.py
+
+Compares the NumPy and Numba backends of gcc.valuation.value_gcc, for the
+running stopped payoff, the materialised stopping times, and the no-lse
+method of the worker processes. The first call of each Numba kernel compiles
+it, or loads it from the cache, and is timed separately.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import getopt
+import numpy as np
+import gcc.kernels
+import gcc.security_simulation
+import gcc.valuation
+from gcc.claims import game_put_option
+from datetime import datetime
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python backend_benchmark.py [-N/--paths n1,n2,...] [-L/--steps l] [-m/--lse m] [-r/--repeat k]
+
+-N/--paths        comma separated path counts (default 2000,8000,32000)
+
+-L/--steps l      number of time steps (default 201)
+
+-m/--lse m        also time the LSE method with m basis functions (default 3)
+
+-r/--repeat k     number of valuations per measurement (default 3)
+'''
+
+
+def seconds(t0):
+    dt = datetime.now() - t0
+    return dt.seconds + dt.microseconds/1e6
+
+
+def time_valuation(repeat, func, *args, **params):
+    t0 = datetime.now()
+    for i in range(repeat):
+        result = func(*args, **params)
+    return result, seconds(t0)/repeat
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hN:L:m:r:",
+                ["help", "paths=", "steps=", "lse=", "repeat="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        N_tuple = (2000, 8000, 32000)
+        L       = 201
+        m       = 3
+        repeat  = 3
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-N", "--paths"):
+                N_tuple = [int(v) for v in value.split(",")]
+            if option in ("-L", "--steps"):
+                L = int(value.strip())
+            if option in ("-m", "--lse"):
+                m = int(value.strip())
+            if option in ("-r", "--repeat"):
+                repeat = int(value.strip())
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    if not gcc.kernels.available():
+        print >> sys.stderr, "Numba is not installed, so there is only the numpy backend to time."
+        return 1
+
+    r = 0.06
+    T = 0.5
+
+    # Compile the kernels, or load them from the cache
+    S, rand_gen_state = gcc.security_simulation.black_scholes(S0=100, r=r, volatility=0.4, T=T, N=100, L=10)
+    X, Y = game_put_option.payoffs(S, 100, 5)
+    t0 = datetime.now()
+    gcc.valuation.value_gcc(S, X, Y, r, T, backend="numba")
+    gcc.valuation.value_gcc(S, X, Y, r, T, backend="numba", m=m)
+    gcc.valuation.value_gcc(S, X, Y, r, T, backend="numba", stopping_times=True)
+    gcc.valuation.value_no_lse_block((X, Y, gcc.valuation.discount_factors(r, T/10, 10), "numba"))
+    print "numba compilation or cache load: %.3f s" % seconds(t0)
+    print
+
+    cases = [
+        ("running payoff",  gcc.valuation.value_gcc, {}),
+        ("running, m = %i" % m, gcc.valuation.value_gcc, {"m": m}),
+        ("stopping times",  gcc.valuation.value_gcc, {"stopping_times": True}),
+        ("stopping, m = %i" % m, gcc.valuation.value_gcc, {"stopping_times": True, "m": m}),
+    ]
+
+    print "L =", L, "  valuations =", repeat
+    print "%-20s %7s %12s %12s %9s %s" % ("engine", "N", "numpy (s)", "numba (s)", "speedup", "identical")
+    for N in N_tuple:
+        S, rand_gen_state = gcc.security_simulation.black_scholes(S0=100, r=r, volatility=0.4, T=T, N=N, L=L)
+        X, Y = game_put_option.payoffs(S, 100, 5)
+
+        for name, func, params in cases:
+            numpy_result, t_numpy = time_valuation(repeat, func, S, X, Y, r, T, backend="numpy", **params)
+            numba_result, t_numba = time_valuation(repeat, func, S, X, Y, r, T, backend="numba", **params)
+            identical = numpy_result["V"] == numba_result["V"] and numpy_result["var"] == numba_result["var"]
+            print "%-20s %7i %12.4f %12.4f %8.1fx %s" % (name, N, t_numpy, t_numba, t_numpy/t_numba, identical)
+
+        # The no-lse method of the worker processes, on the whole set of paths as one block
+        discount = gcc.valuation.discount_factors(r, T/L, L)
+        numpy_values, t_numpy = time_valuation(repeat, gcc.valuation.value_no_lse_block, (X, Y, discount, "numpy"))
+        numba_values, t_numba = time_valuation(repeat, gcc.valuation.value_no_lse_block, (X, Y, discount, "numba"))
+        identical = np.array_equal(numpy_values, numba_values)
+        print "%-20s %7i %12.4f %12.4f %8.1fx %s" % ("worker block", N, t_numpy, t_numba, t_numpy/t_numba, identical)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+control_variates_benchmark.py
+
+Compares the Monte-Carlo variance of valuations of a game put option with and
+without the control variates of gcc.control_variates, on the same paths, and
+the number of paths each needs for a target standard error of the price.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import getopt
+import numpy as np
+import gcc.security_simulation
+from gcc.claims import game_put_option
+from datetime import datetime
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python control_variates_benchmark.py [-N/--paths n1,n2,...] [-L/--steps l] [-m/--lse m] [-e/--error e]
+
+-N/--paths        comma separated path counts (default 10000,40000,160000)
+
+-L/--steps l      number of time steps (default 100)
+
+-m/--lse m        use the LSE method with m basis functions (default no LSE)
+
+-e/--error e      the target standard error of the price (default 0.01)
+'''
+
+
+r          = 0.06
+T          = 0.5
+S0         = 100
+volatility = 0.4
+K          = 110
+delta      = 20
+
+controls = (
+    ("none",      []),
+    ("stock",     [{"type": "stock"}]),
+    ("put",       [{"type": "put", "K": K, "volatility": volatility}]),
+    ("stock+put", [{"type": "stock"}, {"type": "put", "K": K, "volatility": volatility}]),
+)
+
+
+def seconds(t0):
+    dt = datetime.now() - t0
+    return dt.seconds + dt.microseconds/1e6
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hN:L:m:e:",
+                ["help", "paths=", "steps=", "lse=", "error="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        N_tuple = (10000, 40000, 160000)
+        L       = 100
+        target  = 0.01
+        params  = {}
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-N", "--paths"):
+                N_tuple = [int(v) for v in value.split(",")]
+            if option in ("-L", "--steps"):
+                L = int(value.strip())
+            if option in ("-m", "--lse"):
+                params["m"] = int(value.strip())
+            if option in ("-e", "--error"):
+                target = float(value.strip())
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    print "L =", L, "  m =", params.get("m", "no LSE"), "  target error =", target
+    print "%8s %-10s %11s %10s %10s %10s %14s" % ("N", "controls", "V", "dev", "time (s)", "var ratio", "N for target")
+    for N in N_tuple:
+        S, seed = gcc.security_simulation.black_scholes_blocks(S0, r, volatility, T, N, L, seed=1)
+        var_none = None
+        for name, control_list in controls:
+            t0        = datetime.now()
+            valuation = game_put_option.value(S, K, delta, r, T, controls=control_list, **dict(params))
+            t         = seconds(t0)
+            if var_none is None:
+                var_none = valuation["var"]
+            print "%8i %-10s %11.5f %10.4f %10.3f %9.2fx %14i" % (
+                N, name, valuation["V"], valuation["dev"], t, var_none/valuation["var"], valuation["var"]/target**2)
+
+
+if __name__ == '__main__':
+    main()
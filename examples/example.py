@@ -24,7 +24,7 @@ class Usage(Exception):
 
 help_message = '''
 Usage:
-python example.py -b/--batch-dir batch_dir_name [-n/--no-lse] -t type
+python example.py -b/--batch-dir batch_dir_name [-n/--no-lse] -t type [-c/--cache-dir dir]
 
 -t/--type type    one of game-call, game-put, callable-put or convertible-bond
 
@@ -33,6 +33,10 @@ python example.py -b/--batch-dir batch_dir_name [-n/--no-lse] -t type
 -n/--no-lse       use the LSE-free version of the algorithm
 
 -p/--parallel n   use parallel processing with n workers (forces --no-lse to be set)
+
+-c/--cache-dir    seed the paths of repetition i with i, and cache them in memory and
+                  in this directory, so that they are simulated once for all the
+                  values of m and claim types
 '''
 
 
@@ -41,8 +45,8 @@ def main(argv=None):
         argv = sys.argv
     try:
         try:
-            opts, args = getopt.getopt(argv[1:], "b:hnt:p:",
-                ["batch-dir=", "help", "no-lse", "type=", "parallel="])
+            opts, args = getopt.getopt(argv[1:], "b:hnt:p:c:",
+                ["batch-dir=", "help", "no-lse", "type=", "parallel=", "cache-dir="])
         except getopt.error, msg:
             raise Usage(msg)
 
@@ -52,6 +56,7 @@ def main(argv=None):
         option_type = None
         parallel    = False
         n_workers   = None
+        path_cache  = None
         for option, value in opts:
             if option in ("-h", "--help"):
                 raise Usage(help_message)
@@ -65,6 +70,8 @@ def main(argv=None):
                 n_workers = int(value.strip())
             if option in ("-t", "--type"):
                 option_type = value.strip()
+            if option in ("-c", "--cache-dir"):
+                path_cache = gcc.security_simulation.PathCache(directory=value.strip())
         if batch_dir is None or option_type is None:
             raise Usage(help_message)
     except Usage, err:
@@ -100,12 +107,15 @@ def main(argv=None):
                         print "K =", K, "  delta =", delta, "  T =", T, "  r = ", r, "  volatility = ", volatility
 
                         # Generate the stock paths using Black-Scholes model
-                        S, rand_gen_state = gcc.security_simulation.black_scholes(S0=S0,
-                                                                                  r=r,
-                                                                                  volatility=volatility,
-                                                                                  T=T,
-                                                                                  N=N,
-                                                                                  L=L)
+                        if path_cache is not None:
+                            S, seed_state = path_cache.black_scholes(S0, r, volatility, T, N, L, seed=i)
+                        else:
+                            S, rand_gen_state = gcc.security_simulation.black_scholes(S0=S0,
+                                                                                      r=r,
+                                                                                      volatility=volatility,
+                                                                                      T=T,
+                                                                                      N=N,
+                                                                                      L=L)
 
                         # Build parameter dictionary
                         params = {
@@ -114,6 +124,10 @@ def main(argv=None):
                             "parallel": parallel, "n_workers": n_workers
                         }
 
+                        # Record the seed of cached paths, so the saved valuation can be traced to them
+                        if path_cache is not None:
+                            params.update(seed_state)
+
                         # Valuation
                         if not no_lse:
                             params.update({"m": m})
@@ -134,6 +148,8 @@ def main(argv=None):
     t1 = datetime.now()
     print "Performed", str(n_valuations), " valuations in ", str(t1 - t0), " seconds."
     print "Valuations saved in ", batch_dir
+    if path_cache is not None:
+        print "Path cache:", path_cache.counters()
 
 
 if __name__ == '__main__':
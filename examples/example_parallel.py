@@ -25,7 +25,7 @@ class Usage(Exception):
 
 help_message = '''
 Usage:
-python example_parallel.py -b/--batch-dir batch_dir_name [-n/--no-lse] -t type [-w/--workers n]
+python example_parallel.py -b/--batch-dir batch_dir_name [-n/--no-lse] -t type [-w/--workers n] [-c/--cache-dir dir]
 
 -t/--type         one of game-call, game-put, callable-put or convertible-bond
 
@@ -34,6 +34,10 @@ python example_parallel.py -b/--batch-dir batch_dir_name [-n/--no-lse] -t type [
 -n/--no-lse       use the LSE-free version of the algorithm
 
 -w/--workers n    number of parallel processes (default 6)
+
+-c/--cache-dir    seed the paths of repetition i with i, and cache them in memory and
+                  in this directory, so that the workers and later runs for other
+                  claim types simulate them once
 '''
 
 
@@ -42,8 +46,8 @@ def main(argv=None):
         argv = sys.argv
     try:
         try:
-            opts, args = getopt.getopt(argv[1:], "b:hnt:w:",
-                ["batch-dir=", "help", "no-lse", "type=", "workers="])
+            opts, args = getopt.getopt(argv[1:], "b:hnt:w:c:",
+                ["batch-dir=", "help", "no-lse", "type=", "workers=", "cache-dir="])
         except getopt.error, msg:
             raise Usage(msg)
 
@@ -52,6 +56,7 @@ def main(argv=None):
         no_lse      = False
         option_type = None
         n_workers   = 6
+        cache_dir   = None
         for option, value in opts:
             if option in ("-h", "--help"):
                 raise Usage(help_message)
@@ -63,6 +68,8 @@ def main(argv=None):
                 option_type = value.strip()
             if option in ("-w", "--workers"):
                 n_workers = int(value.strip())
+            if option in ("-c", "--cache-dir"):
+                cache_dir = value.strip()
         if batch_dir is None or option_type is None:
             raise Usage(help_message)
     except Usage, err:
@@ -94,8 +101,11 @@ def main(argv=None):
                 #for S0 in (80, 90, 100, 110, 120):
                 for S0 in (80, 90, 110, 120):
                     for i in range(1, 14):
-                        run_specs.append((N, L, m, S0, r, volatility, K, delta, T, option_type, batch_dir))
+                        run_specs.append((N, L, m, S0, r, volatility, K, delta, T, option_type, batch_dir,
+                                          cache_dir, i))
 
+    if cache_dir is not None:
+        gcc.storage.ensure_dir_exists(cache_dir)
     pool = Pool(n_workers)
     pool.map(perform_valuation, run_specs)
     t1 = datetime.now()
@@ -116,17 +126,22 @@ def perform_valuation(run_spec):
     T           = run_spec[8]
     option_type = run_spec[9]
     batch_dir   = run_spec[10]
+    cache_dir   = run_spec[11]
+    repetition  = run_spec[12]
 
     print "N =", N, "  L =", L, "  m =", m
     print "K =", K, "  delta =", delta, "  T =", T, "  r = ", r, "  volatility = ", volatility
 
     # Generate the stock paths using Black-Scholes model
-    S, rand_gen_state = gcc.security_simulation.black_scholes(S0=S0,
-                                                              r=r,
-                                                              volatility=volatility,
-                                                              T=T,
-                                                              N=N,
-                                                              L=L)
+    if cache_dir is not None:
+        S, seed_state = worker_path_cache(cache_dir).black_scholes(S0, r, volatility, T, N, L, seed=repetition)
+    else:
+        S, rand_gen_state = gcc.security_simulation.black_scholes(S0=S0,
+                                                                  r=r,
+                                                                  volatility=volatility,
+                                                                  T=T,
+                                                                  N=N,
+                                                                  L=L)
 
     # Build parameter dictionary
     params = {
@@ -134,6 +149,10 @@ def perform_valuation(run_spec):
         "N": N, "L": L, "K": K, "delta": delta
     }
 
+    # Record the seed of cached paths, so the saved valuation can be traced to them
+    if cache_dir is not None:
+        params.update(seed_state)
+
     # Valuation
     if m is not None:
         params.update({"m": m})
@@ -151,5 +170,15 @@ def perform_valuation(run_spec):
     batch_dir, filename = gcc.storage.save_valuation_json(valuation, batch_dir)
 
 
+path_caches = {}
+
+
+def worker_path_cache(cache_dir):
+    # Each worker process keeps its own cache in memory, and they share the directory
+    if cache_dir not in path_caches:
+        path_caches[cache_dir] = gcc.security_simulation.PathCache(directory=cache_dir)
+    return path_caches[cache_dir]
+
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+jump_diffusion_benchmark.py
+
+Compares the vectorized gcc.security_simulation.jump_diffusion with the
+original loop over paths, time steps and jump times, in running time and
+in the distribution of the generated paths.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import getopt
+import numpy as np
+import scipy.stats
+import gcc.security_simulation
+from datetime import datetime
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python jump_diffusion_benchmark.py [-N/--paths n1,n2,...] [-L/--steps l] [-e/--eta eta] [-t/--theta theta]
+
+-N/--paths        comma separated path counts (default 1000,8000)
+
+-L/--steps l      number of time steps (default 365)
+
+-e/--eta eta      jump intensity (default 5)
+
+-t/--theta theta  exponential distribution parameter of the jump sizes (default 10)
+'''
+
+
+def loop_jump_diffusion(S0, r, volatility, d, eta, theta, T, N, L, rand_gen_state=None):
+    """
+    The original implementation of L{gcc.security_simulation.jump_diffusion},
+    which simulates the jump times of each path, kept as a reference.
+    """
+    if rand_gen_state is not None:
+        np.random.set_state(rand_gen_state)
+    rand_gen_state = np.random.get_state()
+    dt = np.float64(T)/L
+
+    eps = np.random.normal(size=(L, N/2))
+    eps = np.hstack((eps, -eps))
+    mu_and_W = np.cumsum((r - d - np.power(volatility, 2)/2 + eta/(1-theta))*dt + volatility*np.sqrt(dt)*eps, 0)
+
+    beta_times = 1.0/eta
+    beta_jumps = 1.0/theta
+    J = np.zeros((L, N))
+    for n in range(N):
+        cum_jumps = np.random.exponential(beta_times)
+        for j in range(L):
+            t = (j+1)*dt
+            J[j, n] = np.copy(J[j-1, n])
+            while t > cum_jumps:
+                J[j, n] += np.random.exponential(beta_jumps)
+                cum_jumps += np.random.exponential(beta_times)
+
+    S = np.vstack((S0*np.ones((1, N)), S0*np.exp(mu_and_W + J)))
+    return S, rand_gen_state
+
+
+def time_call(func, *args):
+    t0     = datetime.now()
+    result = func(*args)
+    dt     = datetime.now() - t0
+    return result, dt.seconds + dt.microseconds/1e6
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hN:L:e:t:",
+                ["help", "paths=", "steps=", "eta=", "theta="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        N_tuple = (1000, 8000)
+        L       = 365
+        eta     = 5.0
+        theta   = 10.0
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-N", "--paths"):
+                N_tuple = [int(v) for v in value.split(",")]
+            if option in ("-L", "--steps"):
+                L = int(value.strip())
+            if option in ("-e", "--eta"):
+                eta = float(value.strip())
+            if option in ("-t", "--theta"):
+                theta = float(value.strip())
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    S0         = 100
+    r          = 0.06
+    volatility = 0.4
+    d          = 0.02
+    T          = 1.0
+
+    print "%6s %6s %12s %12s %9s" % ("N", "L", "loop (s)", "vector (s)", "speedup")
+    for N in N_tuple:
+        (S_loop, state), t_loop = time_call(loop_jump_diffusion, S0, r, volatility, d, eta, theta, T, N, L)
+        (S_vec, state), t_vec   = time_call(gcc.security_simulation.jump_diffusion, S0, r, volatility, d, eta, theta, T, N, L)
+        print "%6i %6i %12.3f %12.4f %8.0fx" % (N, L, t_loop, t_vec, t_loop/t_vec)
+
+    # The two generators use the random numbers differently, so compare the distributions
+    # of log(S_T/S0), which has the mean and variance below
+    mu       = r - d - volatility**2/2 + eta/(1-theta)
+    mean     = mu*T + eta*T/theta
+    variance = volatility**2*T + 2*eta*T/theta**2
+    X_loop   = np.log(S_loop[L, :]/S0)
+    X_vec    = np.log(S_vec[L, :]/S0)
+
+    print
+    print "log(S_T/S0) with N = %i paths" % N_tuple[-1]
+    print "%-12s %10s %10s %10s %10s" % ("", "mean", "variance", "skewness", "kurtosis")
+    print "%-12s %10.5f %10.5f" % ("exact", mean, variance)
+    for name, X in (("loop", X_loop), ("vectorized", X_vec)):
+        print "%-12s %10.5f %10.5f %10.5f %10.5f" % (name, np.mean(X), np.var(X), scipy.stats.skew(X), scipy.stats.kurtosis(X))
+
+    statistic, p_value = scipy.stats.ks_2samp(X_loop, X_vec)
+    print "two-sample Kolmogorov-Smirnov test: D = %.4f, p = %.3f" % (statistic, p_value)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+multilevel_benchmark.py
+
+Compares multilevel Monte-Carlo valuations of a game put option, from
+gcc.multilevel.value_mlmc, with single level valuations on the finest grid of
+the multilevel valuation, for the same standard error. The single level
+running time is extrapolated from a valuation of fewer paths, since the paths
+it needs may not fit in memory.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import getopt
+import numpy as np
+import gcc.multilevel
+import gcc.security_simulation
+import gcc.valuation
+from gcc.claims import game_put_option
+from datetime import datetime
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python multilevel_benchmark.py [-e/--rmse e1,e2,...] [-L/--coarsest l] [-m/--lse m]
+
+-e/--rmse          comma separated target root mean square errors (default 0.1,0.05,0.025)
+
+-L/--coarsest l    number of time steps of the coarsest level (default 25)
+
+-m/--lse m         use the LSE method with m basis functions (default no LSE)
+'''
+
+
+r          = 0.06
+T          = 0.5
+S0         = 100
+volatility = 0.4
+
+
+def payoffs(S):
+    return game_put_option.payoffs(S, 110, 20)
+
+
+def seconds(t0):
+    dt = datetime.now() - t0
+    return dt.seconds + dt.microseconds/1e6
+
+
+def single_level_time(L, N, params, n=20000):
+    """
+    Extrapolates the running time of simulating and valuing N paths with L time steps
+    from that of n paths.
+    """
+    t0 = datetime.now()
+    S, seed = gcc.security_simulation.black_scholes_blocks(S0, r, volatility, T, n, L, seed=1)
+    X, Y = payoffs(S)
+    gcc.valuation.value_gcc(S, X, Y, r, T, **dict(params))
+    return seconds(t0)*N/n
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "he:L:m:",
+                ["help", "rmse=", "coarsest=", "lse="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        rmse_tuple = (0.1, 0.05, 0.025)
+        L0         = 25
+        params     = {}
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-e", "--rmse"):
+                rmse_tuple = [float(v) for v in value.split(",")]
+            if option in ("-L", "--coarsest"):
+                L0 = int(value.strip())
+            if option in ("-m", "--lse"):
+                params["m"] = int(value.strip())
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    print "L0 =", L0, "  m =", params.get("m", "no LSE")
+    for rmse in rmse_tuple:
+        t0        = datetime.now()
+        valuation = gcc.multilevel.value_mlmc(S0, r, volatility, T, payoffs, rmse, L0=L0, **dict(params))
+        t_mlmc    = seconds(t0)
+
+        L_finest = valuation["L_levels"][-1]
+        N_single = int(2*valuation["level_variances"][0]/rmse**2)
+        t_single = single_level_time(L_finest, N_single, params)
+
+        print "rmse %.4f:  V = %.5f  std error = %.5f  bias = %.5f  levels = %i" % (
+            rmse, valuation["V"], valuation["std_error"], valuation["bias"], valuation["levels"])
+        print "    %8s %10s %14s %14s" % ("L", "N", "mean", "variance")
+        for l in range(valuation["levels"]):
+            print "    %8i %10i %14.6f %14.6f" % (valuation["L_levels"][l], valuation["N_levels"][l],
+                                               valuation["level_means"][l], valuation["level_variances"][l])
+        print "    cost %.3g vs %.3g single level (%.2fx),  time %.2f s vs %.2f s single level (%.2fx)" % (
+            valuation["cost"], valuation["cost_single_level"], valuation["cost_single_level"]/valuation["cost"],
+            t_mlmc, t_single, t_single/t_mlmc)
+
+
+if __name__ == '__main__':
+    main()
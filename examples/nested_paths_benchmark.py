@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+nested_paths_benchmark.py
+
+Runs a convergence study of a game put option over a grid of path counts N
+and time steps L twice; simulating the paths of every grid point from scratch,
+and deriving them all from one simulation at the largest N and finest L with
+gcc.security_simulation.nested_paths. Shows the simulation and valuation times,
+the prices of both, and how much the prices move between neighbouring L.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import getopt
+import numpy as np
+import gcc.security_simulation
+from gcc.claims import game_put_option
+from datetime import datetime
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python nested_paths_benchmark.py [-N/--paths n1,n2,...] [-L/--steps l1,l2,...] [-m/--lse m]
+
+-N/--paths        comma separated path counts (default 1000,2000,4000,8000)
+
+-L/--steps        comma separated time steps, each dividing the largest (default 101,202,404,808,1616)
+
+-m/--lse m        use the LSE method with m basis functions (default no LSE)
+'''
+
+
+r          = 0.06
+T          = 0.5
+S0         = 100
+volatility = 0.4
+K          = 110
+delta      = 20
+
+
+def seconds(t0):
+    dt = datetime.now() - t0
+    return dt.seconds + dt.microseconds/1e6
+
+
+def study(N_tuple, L_tuple, paths, params):
+    """
+    Values the option at every grid point, on the paths of C{paths(N, L)}.
+
+    @return:    a tuple of the N x L-array of prices, the simulation time and the valuation time.
+    """
+    V            = np.empty((len(N_tuple), len(L_tuple)))
+    t_simulation = 0
+    t_valuation  = 0
+    for i, N in enumerate(N_tuple):
+        for k, L in enumerate(L_tuple):
+            t0 = datetime.now()
+            S  = paths(N, L)
+            t_simulation += seconds(t0)
+
+            t0 = datetime.now()
+            V[i, k] = game_put_option.value(S, K, delta, r, T, **dict(params))["V"]
+            t_valuation += seconds(t0)
+    return V, t_simulation, t_valuation
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hN:L:m:",
+                ["help", "paths=", "steps=", "lse="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        N_tuple = (1000, 2000, 4000, 8000)
+        L_tuple = (101, 202, 404, 808, 1616)
+        params  = {}
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-N", "--paths"):
+                N_tuple = [int(v) for v in value.split(",")]
+            if option in ("-L", "--steps"):
+                L_tuple = [int(v) for v in value.split(",")]
+            if option in ("-m", "--lse"):
+                params["m"] = int(value.strip())
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    def from_scratch(N, L):
+        return gcc.security_simulation.black_scholes(S0, r, volatility, T, N, L)[0]
+
+    t0 = datetime.now()
+    S_finest, rand_gen_state = gcc.security_simulation.black_scholes(S0, r, volatility, T, max(N_tuple), max(L_tuple),
+                                                                     antithetic="adjacent")
+    t_finest = seconds(t0)
+    def nested(N, L):
+        return gcc.security_simulation.nested_paths(S_finest, N, L, antithetic="adjacent")
+
+    print "m =", params.get("m", "no LSE")
+    for name, paths in (("from scratch", from_scratch), ("nested", nested)):
+        V, t_simulation, t_valuation = study(N_tuple, L_tuple, paths, params)
+        if name == "nested":
+            t_simulation += t_finest
+        print
+        print "%s: simulation %.3f s, valuation %.3f s" % (name, t_simulation, t_valuation)
+        print "%8s" % "N \\ L" + "".join("%10i" % L for L in L_tuple) + "   mean |V(L') - V(L)|"
+        for i, N in enumerate(N_tuple):
+            print "%8i" % N + "".join("%10.4f" % v for v in V[i]) + "   %10.4f" % np.mean(np.abs(np.diff(V[i])))
+
+
+if __name__ == '__main__':
+    main()
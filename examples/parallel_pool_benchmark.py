@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+parallel_pool_benchmark.py
+
+Compares the throughput of gcc.valuation.value_parallel using a shared
+ValuationPool with chunked tasks, with the payoffs either pickled with each
+task or read from shared memory, against the original implementation,
+which started a new pool for every valuation and sent one task per path.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import getopt
+import numpy as np
+import gcc.security_simulation
+import gcc.valuation
+from gcc.claims import game_put_option
+from datetime import datetime
+from multiprocessing import Pool
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python parallel_pool_benchmark.py [-w/--workers n] [-N/--paths n] [-L/--steps l] [-r/--repeat k] [-c/--chunks c1,c2,...]
+
+-w/--workers n     number of worker processes (default 4)
+
+-N/--paths n       number of paths (default 8000)
+
+-L/--steps l       number of time steps (default 201)
+
+-r/--repeat k      number of valuations per measurement (default 5)
+
+-c/--chunks        comma separated chunk sizes for the shared pool (default 250,1000,4000)
+'''
+
+
+def value_path(params):
+    """
+    The original worker of L{gcc.valuation.value_parallel}, which valued one path.
+    """
+    X_n               = params[0]
+    Y_n               = params[1]
+    L                 = params[2]
+    exp_holding_value = Y_n[L]
+    for j_p in range(L-1, -1, -1): # j = L-1, ..., 1
+        if Y_n[j_p] == 0:
+            continue
+
+        if Y_n[j_p] > exp_holding_value:
+            exp_holding_value = Y_n[j_p]
+            continue
+
+        if X_n[j_p] < exp_holding_value:
+            exp_holding_value = X_n[j_p]
+
+    return exp_holding_value
+
+
+def value_parallel_per_path(X, Y, L, n_workers):
+    """
+    The original task layout of L{gcc.valuation.value_parallel}: a new pool
+    for each valuation, and one task per path.
+    """
+    N          = X.shape[1]
+    parameters = [(X[:, n], Y[:, n], L, n) for n in range(0, N-1)]
+    pool       = Pool(n_workers)
+    valuations = pool.map(value_path, parameters)
+    pool.close()
+    pool.join()
+    return np.mean(valuations)
+
+
+def seconds(t0):
+    dt = datetime.now() - t0
+    return dt.seconds + dt.microseconds/1e6
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hw:N:L:r:c:",
+                ["help", "workers=", "paths=", "steps=", "repeat=", "chunks="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        n_workers = 4
+        N         = 8000
+        L         = 201
+        repeat    = 5
+        chunks    = (250, 1000, 4000)
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-w", "--workers"):
+                n_workers = int(value.strip())
+            if option in ("-N", "--paths"):
+                N = int(value.strip())
+            if option in ("-L", "--steps"):
+                L = int(value.strip())
+            if option in ("-r", "--repeat"):
+                repeat = int(value.strip())
+            if option in ("-c", "--chunks"):
+                chunks = [int(v) for v in value.split(",")]
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    r  = 0.06
+    T  = 0.5
+    S, rand_gen_state = gcc.security_simulation.black_scholes(S0=100, r=r, volatility=0.4, T=T, N=N, L=L)
+    X, Y = game_put_option.payoffs(S, 100, 5)
+
+    print "N =", N, "  L =", L, "  workers =", n_workers, "  valuations =", repeat
+    print "%-28s %10s %14s" % ("implementation", "time (s)", "paths/s")
+
+    t0 = datetime.now()
+    for i in range(repeat):
+        value_parallel_per_path(X, Y, L, n_workers)
+    t = seconds(t0)
+    print "%-28s %10.3f %14.0f" % ("new pool, task per path", t, repeat*N/t)
+
+    for transport in ("pickle", "shared"):
+        for chunk_size in chunks:
+            t0 = datetime.now()
+            with gcc.valuation.ValuationPool(n_workers, chunk_size) as pool:
+                for i in range(repeat):
+                    gcc.valuation.value_gcc(S, X, Y, r, T, parallel=True, pool=pool, transport=transport)
+            t = seconds(t0)
+            print "%-28s %10.3f %14.0f" % ("%s, chunk %i" % (transport, chunk_size), t, repeat*N/t)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+payoff_functions_benchmark.py
+
+Compares the peak memory and running time of valuing a game put option with
+its payoffs built as (L+1) x N-arrays up front, and with the payoff functions
+of gcc.claims.game_put_option.payoff_functions, which the valuation calls a
+time step at a time. Each valuation runs in its own process, so that the peak
+resident set sizes don't mix.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import getopt
+import resource
+import gcc.security_simulation
+import gcc.valuation
+from gcc.claims import game_put_option
+from datetime import datetime
+from multiprocessing import Process, Queue
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python payoff_functions_benchmark.py [-N/--paths n1,n2,...] [-L/--steps l] [-m/--lse m]
+
+-N/--paths        comma separated path counts (default 50000,200000)
+
+-L/--steps l      number of time steps (default 100)
+
+-m/--lse m        use the LSE method with m basis functions (default no LSE)
+'''
+
+
+r          = 0.06
+T          = 0.5
+K          = 110
+delta      = 20
+
+
+def value_arrays(S, params):
+    X, Y = game_put_option.payoffs(S, K, delta)
+    return gcc.valuation.value_gcc(S, X, Y, r, T, **params)
+
+
+def value_functions(S, params):
+    return game_put_option.value(S, K, delta, r, T, **params)
+
+
+def measure(queue, func, N, L, params):
+    # The paths are simulated in small blocks, so the simulation peaks at little more than S
+    baseline  = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    S, seed   = gcc.security_simulation.black_scholes_blocks(100, r, 0.4, T, N, L, seed=1)
+    t0        = datetime.now()
+    valuation = func(S, params)
+    dt        = datetime.now() - t0
+    peak      = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((valuation["V"], dt.seconds + dt.microseconds/1e6, S.nbytes/2.0**20, (peak - baseline)/1024.0))
+
+
+def run(func, N, L, params):
+    queue   = Queue()
+    process = Process(target=measure, args=(queue, func, N, L, params))
+    process.start()
+    result  = queue.get()
+    process.join()
+    return result
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hN:L:m:",
+                ["help", "paths=", "steps=", "lse="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        N_tuple = (50000, 200000)
+        L       = 100
+        params  = {}
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-N", "--paths"):
+                N_tuple = [int(v) for v in value.split(",")]
+            if option in ("-L", "--steps"):
+                L = int(value.strip())
+            if option in ("-m", "--lse"):
+                params["m"] = int(value.strip())
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    print "L =", L, "  m =", params.get("m", "no LSE")
+    print "%8s %-10s %10s %10s %10s %10s" % ("N", "payoffs", "V", "time (s)", "S (MB)", "peak (MB)")
+    for N in N_tuple:
+        for name, func in (("arrays", value_arrays), ("functions", value_functions)):
+            V, t, S_megabytes, peak = run(func, N, L, params)
+            print "%8i %-10s %10.4f %10.3f %10.1f %10.1f" % (N, name, V, t, S_megabytes, peak)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+precision_benchmark.py
+
+Compares single with double precision valuations of a game put option on the
+same random numbers; the memory of the paths, payoffs and stopping times, the
+running time of the simulation and valuation, and the deviation of the price,
+also measured in standard errors of the Monte-Carlo estimate.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import getopt
+import numpy as np
+import gcc.security_simulation
+import gcc.valuation
+from gcc.claims import game_put_option
+from datetime import datetime
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python precision_benchmark.py [-N/--paths n1,n2,...] [-L/--steps l] [-m/--lse m] [-b/--backend b]
+
+-N/--paths        comma separated path counts (default 20000,80000,320000)
+
+-L/--steps l      number of time steps (default 100)
+
+-m/--lse m        use the LSE method with m basis functions (default 4)
+
+-b/--backend b    the backend of the valuation, auto, numba or numpy (default auto)
+'''
+
+
+r          = 0.06
+T          = 0.5
+S0         = 100
+volatility = 0.4
+K          = 110
+delta      = 20
+
+
+def seconds(t0):
+    dt = datetime.now() - t0
+    return dt.seconds + dt.microseconds/1e6
+
+
+def run(N, L, precision, rand_gen_state, params):
+    """
+    Simulates and values the option in the given precision.
+
+    @return:    a tuple of the price, its standard deviation, the megabytes of the
+                paths, payoffs and stopping times, the simulation time and the
+                valuation time of the running stopped payoff and of the stopping times.
+    """
+    t0           = datetime.now()
+    S, state     = gcc.security_simulation.black_scholes(S0, r, volatility, T, N, L, rand_gen_state, precision)
+    X, Y         = game_put_option.payoffs(S, K, delta)
+    t_simulation = seconds(t0)
+
+    t0 = datetime.now()
+    running = gcc.valuation.value_gcc(S, X, Y, r, T, **dict(params))
+    t_running = seconds(t0)
+
+    t0 = datetime.now()
+    stopping = gcc.valuation.value_gcc(S, X, Y, r, T, stopping_times=True, **dict(params))
+    t_stopping = seconds(t0)
+
+    megabytes = (S.nbytes + X.nbytes + Y.nbytes + stopping["sigma"].nbytes + stopping["tau"].nbytes)/2.0**20
+    return running["V"], running["dev"], megabytes, t_simulation, t_running, t_stopping
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hN:L:m:b:",
+                ["help", "paths=", "steps=", "lse=", "backend="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        N_tuple = (20000, 80000, 320000)
+        L       = 100
+        params  = {"m": 4, "backend": "auto"}
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-N", "--paths"):
+                N_tuple = [int(v) for v in value.split(",")]
+            if option in ("-L", "--steps"):
+                L = int(value.strip())
+            if option in ("-m", "--lse"):
+                params["m"] = int(value.strip())
+            if option in ("-b", "--backend"):
+                params["backend"] = value.strip()
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    # Compile the kernels of both precisions, or load them from the cache
+    for precision in ("double", "single"):
+        run(100, 10, precision, None, params)
+
+    print "L =", L, "  m =", params["m"], "  backend =", params["backend"]
+    print "%8s %-7s %11s %9s %10s %10s %10s %10s %11s %9s" % (
+        "N", "", "V", "dev", "MB", "sim (s)", "value (s)", "stop (s)", "|dV|", "|dV|/err")
+    for N in N_tuple:
+        rand_gen_state = np.random.get_state()
+        double = run(N, L, "double", rand_gen_state, params)
+        single = run(N, L, "single", rand_gen_state, params)
+        for name, result in (("double", double), ("single", single)):
+            print "%8i %-7s %11.6f %9.4f %10.1f %10.3f %10.3f %10.3f" % ((N, name) + result)
+
+        deviation = abs(single[0] - double[0])
+        std_error = double[1]/np.sqrt(N)
+        print "%8s %-7s %11s %9s %9.1fx %9.2fx %9.2fx %9.2fx %11.2e %9.4f" % (
+            "", "ratio", "", "", double[2]/single[2], double[3]/single[3], double[4]/single[4],
+            double[5]/single[5], deviation, deviation/std_error)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+qmc_benchmark.py
+
+Compares the error per CPU second of valuations on randomised quasi-Monte Carlo
+paths, from gcc.security_simulation.black_scholes_qmc, with valuations on the
+pseudo-random paths of gcc.security_simulation.black_scholes_blocks. The error of
+the pseudo-random valuations is dev/sqrt(N), and that of the quasi-Monte Carlo
+valuations the spread of the prices of the replicates. The paths needed for the
+target error are extrapolated at the rate 1/sqrt(N), which underestimates the
+gain of quasi-Monte Carlo when it converges faster.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import time
+import getopt
+import numpy as np
+import gcc.security_simulation
+import gcc.valuation
+from gcc.claims import game_put_option
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python qmc_benchmark.py [-N/--paths n1,n2,...] [-L/--steps l] [-m/--lse m] [-R/--replicates k] [-e/--error e]
+
+-N/--paths           comma separated path counts, best powers of 2 (default 4096,16384,65536)
+
+-L/--steps l         number of time steps (default 100)
+
+-m/--lse m           use the LSE method with m basis functions (default no LSE)
+
+-R/--replicates k    number of randomised quasi-Monte Carlo replicates (default 16)
+
+-e/--error e         the target standard error of the price (default 0.01)
+'''
+
+
+r          = 0.06
+T          = 0.5
+S0         = 100
+volatility = 0.4
+seed       = 1
+
+
+def payoffs(S):
+    return game_put_option.payoffs(S, 110, 20)
+
+
+def pseudo_random(N, L, replicates, params):
+    S, seed_state = gcc.security_simulation.black_scholes_blocks(S0, r, volatility, T, N, L, seed, block_size=N)
+    X, Y = payoffs(S)
+    valuation = gcc.valuation.value_gcc(S, X, Y, r, T, **dict(params))
+    return valuation["V"], valuation["dev"]/np.sqrt(N)
+
+
+def quasi_random(N, L, replicates, params):
+    def simulate(k):
+        return gcc.security_simulation.black_scholes_qmc(S0, r, volatility, T, N/replicates, L, seed, k)[0]
+    valuation = gcc.valuation.value_rqmc(simulate, payoffs, r, T, replicates, **dict(params))
+    return valuation["V"], valuation["std_error"]
+
+
+def cpu_time(func, *args):
+    t0     = time.clock()
+    result = func(*args)
+    return result, time.clock() - t0
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hN:L:m:R:e:",
+                ["help", "paths=", "steps=", "lse=", "replicates=", "error="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        N_tuple    = (4096, 16384, 65536)
+        L          = 100
+        replicates = 16
+        target     = 0.01
+        params     = {}
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-N", "--paths"):
+                N_tuple = [int(v) for v in value.split(",")]
+            if option in ("-L", "--steps"):
+                L = int(value.strip())
+            if option in ("-m", "--lse"):
+                params["m"] = int(value.strip())
+            if option in ("-R", "--replicates"):
+                replicates = int(value.strip())
+            if option in ("-e", "--error"):
+                target = float(value.strip())
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    # Compile the kernels, or load them from the cache
+    pseudo_random(1024, L, replicates, params)
+
+    print "L =", L, "  m =", params.get("m", "no LSE"), "  replicates =", replicates, "  target error =", target
+    print "%8s %-8s %11s %10s %9s %14s %13s %13s" % (
+        "N", "paths", "V", "error", "cpu (s)", "1/(err^2 s)", "N for target", "cpu for target")
+    for N in N_tuple:
+        results = []
+        for name, func in (("pseudo", pseudo_random), ("rqmc", quasi_random)):
+            (V, error), cpu = cpu_time(func, N, L, replicates, params)
+            N_target = N*(error/target)**2
+            print "%8i %-8s %11.5f %10.5f %9.3f %14.1f %13i %13.2f" % (
+                N, name, V, error, cpu, 1/(error**2*cpu), N_target, cpu*N_target/N)
+            results.append((error, cpu))
+
+        (error_pseudo, cpu_pseudo), (error_rqmc, cpu_rqmc) = results
+        print "%8s %-8s %11s %9.2fx %8.2fx %13.1fx" % (
+            "", "gain", "", error_pseudo/error_rqmc, cpu_pseudo/cpu_rqmc,
+            (error_pseudo**2*cpu_pseudo)/(error_rqmc**2*cpu_rqmc))
+
+
+if __name__ == '__main__':
+    main()
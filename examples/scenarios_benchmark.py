@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+scenarios_benchmark.py
+
+Compares simulating the paths of a stress grid of volatilities and interest
+rates with one call of gcc.security_simulation.black_scholes per scenario, with
+one call of gcc.security_simulation.black_scholes_scenarios for the whole grid,
+both into a new array and into a reused buffer.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import getopt
+import numpy as np
+import gcc.security_simulation
+from datetime import datetime
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python scenarios_benchmark.py [-N/--paths n] [-L/--steps l] [-v/--volatilities v1,v2,...] [-r/--rates r1,r2,...]
+
+-N/--paths n          number of paths of each scenario (default 10000)
+
+-L/--steps l          number of time steps (default 100)
+
+-v/--volatilities     comma separated volatilities (default 0.2,0.3,0.4,0.5,0.6)
+
+-r/--rates            comma separated interest rates (default 0.0,0.03,0.06,0.09)
+'''
+
+
+S0 = 100
+T  = 0.5
+
+
+def seconds(t0):
+    dt = datetime.now() - t0
+    return dt.seconds + dt.microseconds/1e6
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hN:L:v:r:",
+                ["help", "paths=", "steps=", "volatilities=", "rates="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        N            = 10000
+        L            = 100
+        volatilities = (0.2, 0.3, 0.4, 0.5, 0.6)
+        rates        = (0.0, 0.03, 0.06, 0.09)
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-N", "--paths"):
+                N = int(value.strip())
+            if option in ("-L", "--steps"):
+                L = int(value.strip())
+            if option in ("-v", "--volatilities"):
+                volatilities = [float(v) for v in value.split(",")]
+            if option in ("-r", "--rates"):
+                rates = [float(v) for v in value.split(",")]
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    volatility_grid, r_grid = [a.ravel() for a in np.meshgrid(volatilities, rates)]
+    K = volatility_grid.shape[0]
+    rand_gen_state = np.random.get_state()
+    print "%i scenarios,  N = %i,  L = %i,  %.1f MB of paths" % (K, N, L, K*(L+1)*N*8/2.0**20)
+
+    t0 = datetime.now()
+    S_loop = np.empty((K, L+1, N))
+    for k in range(K):
+        S_loop[k], state = gcc.security_simulation.black_scholes(S0, r_grid[k], volatility_grid[k], T, N, L,
+                                                                 rand_gen_state)
+    t_loop = seconds(t0)
+
+    t0 = datetime.now()
+    S, state = gcc.security_simulation.black_scholes_scenarios(S0, r_grid, volatility_grid, T, N, L, rand_gen_state)
+    t_batched = seconds(t0)
+
+    t0 = datetime.now()
+    gcc.security_simulation.black_scholes_scenarios(S0, r_grid, volatility_grid, T, N, L, rand_gen_state, out=S)
+    t_buffer = seconds(t0)
+
+    print "%-36s %10s %10s" % ("", "time (s)", "speedup")
+    print "%-36s %10.3f %9.2fx" % ("black_scholes per scenario", t_loop, 1.0)
+    print "%-36s %10.3f %9.2fx" % ("black_scholes_scenarios", t_batched, t_loop/t_batched)
+    print "%-36s %10.3f %9.2fx" % ("black_scholes_scenarios into buffer", t_buffer, t_loop/t_buffer)
+    print "largest relative difference of the paths: %.2e" % np.max(np.abs(S/S_loop - 1))
+
+
+if __name__ == '__main__':
+    main()
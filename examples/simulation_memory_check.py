@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+simulation_memory_check.py
+
+Checks that gcc.security_simulation.black_scholes builds its paths in little
+more memory than the paths themselves take up. Each simulation runs in its own
+process, and its peak memory is measured as the growth of the peak resident
+set size of the process over that before the simulation. Exits with status 1
+if any simulation peaks above the allowed multiple of the size of its paths.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import getopt
+import resource
+import gcc.security_simulation
+from datetime import datetime
+from multiprocessing import Process, Queue
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python simulation_memory_check.py [-N/--paths n1,n2,...] [-L/--steps l] [-p/--precision p] [-a/--allowed x]
+
+-N/--paths          comma separated path counts (default 100000,400000)
+
+-L/--steps l        number of time steps (default 100)
+
+-p/--precision p    double or single (default double)
+
+-a/--allowed x      the allowed peak memory, as a multiple of the size of the paths (default 1.1)
+'''
+
+
+r          = 0.06
+T          = 0.5
+S0         = 100
+volatility = 0.4
+
+
+def measure(queue, N, L, precision):
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0       = datetime.now()
+    S, rand_gen_state = gcc.security_simulation.black_scholes(S0, r, volatility, T, N, L, precision=precision)
+    dt       = datetime.now() - t0
+    peak     = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((S.nbytes/2.0**20, (peak - baseline)/1024.0, dt.seconds + dt.microseconds/1e6))
+
+
+def run(N, L, precision):
+    queue   = Queue()
+    process = Process(target=measure, args=(queue, N, L, precision))
+    process.start()
+    result  = queue.get()
+    process.join()
+    return result
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hN:L:p:a:",
+                ["help", "paths=", "steps=", "precision=", "allowed="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        N_tuple   = (100000, 400000)
+        L         = 100
+        precision = "double"
+        allowed   = 1.1
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-N", "--paths"):
+                N_tuple = [int(v) for v in value.split(",")]
+            if option in ("-L", "--steps"):
+                L = int(value.strip())
+            if option in ("-p", "--precision"):
+                precision = value.strip()
+            if option in ("-a", "--allowed"):
+                allowed = float(value.strip())
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    print "L =", L, "  precision =", precision, "  allowed peak =", allowed, "x the paths"
+    print "%8s %10s %10s %8s %10s %6s" % ("N", "S (MB)", "peak (MB)", "ratio", "time (s)", "")
+    failed = False
+    for N in N_tuple:
+        S_megabytes, peak, t = run(N, L, precision)
+        ok = peak <= allowed*S_megabytes
+        failed = failed or not ok
+        print "%8i %10.1f %10.1f %7.3fx %10.3f %6s" % (N, S_megabytes, peak, peak/S_megabytes, t, "ok" if ok else "FAILED")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
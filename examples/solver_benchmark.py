@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+solver_benchmark.py
+
+Values a game put option with the LSE method for each least squares solver of
+gcc.polynomials.lse_coefficients and each basis of the projection subspace, and
+shows the prices, the running times, the solvers that were used and the median
+condition number of the regressions. Checks that the proj_type parameter takes
+effect, and that the "auto" solver agrees with QR on each of the claims in
+gcc.claims; exits with status 1 if the Hermite and Laguerre bases give the same
+price at the largest m, or if "auto" and QR differ by more than a hundredth of
+a standard error.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import getopt
+import numpy as np
+import gcc.security_simulation
+import gcc.valuation
+from gcc.claims import game_put_option, game_call_option, callable_put, convertible_bond
+from datetime import datetime
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python solver_benchmark.py [-N/--paths n] [-L/--steps l] [-m/--lse m1,m2,...]
+
+-N/--paths n      number of paths (default 8000)
+
+-L/--steps l      number of time steps (default 50)
+
+-m/--lse          comma separated numbers of basis functions (default 3,6)
+'''
+
+
+r          = 0.06
+T          = 0.5
+S0         = 100
+volatility = 0.4
+K          = 110
+delta      = 20
+
+solvers = ("auto", "cholesky", "qr", "svd")
+bases   = ("laguerre", "hermite")
+claims  = (
+    ("game put",         game_put_option.payoffs,  (K, delta)),
+    ("game call",        game_call_option.payoffs, (90, delta)),
+    ("callable put",     callable_put.payoffs,     (K, delta)),
+    ("convertible bond", convertible_bond.payoffs, (K, 1)),
+)
+
+
+def seconds(t0):
+    dt = datetime.now() - t0
+    return dt.seconds + dt.microseconds/1e6
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hN:L:m:",
+                ["help", "paths=", "steps=", "lse="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        N       = 8000
+        L       = 50
+        m_tuple = (3, 6)
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-N", "--paths"):
+                N = int(value.strip())
+            if option in ("-L", "--steps"):
+                L = int(value.strip())
+            if option in ("-m", "--lse"):
+                m_tuple = [int(v) for v in value.split(",")]
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    S, rand_gen_state = gcc.security_simulation.black_scholes(S0, r, volatility, T, N, L)
+    X, Y = game_put_option.payoffs(S, K, delta)
+
+    print "N =", N, "  L =", L
+    print "%3s %-10s %-10s %11s %10s %12s  %s" % ("m", "basis", "solver", "V", "time (s)", "median cond", "solvers used")
+    prices = {}
+    for m in m_tuple:
+        for basis in bases:
+            for solver in solvers:
+                t0        = datetime.now()
+                valuation = gcc.valuation.value_gcc(S, X, Y, r, T, m=m, proj_type=basis, solver=solver,
+                                                    lse_diagnostics=True)
+                t         = seconds(t0)
+                used      = [d["solver"] for d in valuation["lse_diagnostics"]]
+                cond      = np.median([d["cond"] for d in valuation["lse_diagnostics"]])
+                prices[(m, basis, solver)] = valuation["V"]
+                print "%3i %-10s %-10s %11.5f %10.3f %12.3g  %s" % (m, basis, solver, valuation["V"], t, cond,
+                    ", ".join("%s %i" % (s, used.count(s)) for s in solvers if s in used))
+
+    # Both bases span the polynomials of degree less than m, so their prices only differ
+    # by the rounding of the regressions, which grows with the condition number and m
+    m = max(m_tuple)
+    laguerre, hermite = prices[(m, "laguerre", "svd")], prices[(m, "hermite", "svd")]
+    print
+    print "m = %i: laguerre %.5f, hermite %.5f" % (m, laguerre, hermite)
+    failed = laguerre == hermite
+    if failed:
+        print "FAILED: the bases give the same price, so proj_type is not used"
+
+    print
+    print "%-18s %3s %-10s %11s %11s %11s" % ("claim", "m", "basis", "V auto", "V qr", "std error")
+    for name, payoffs, arguments in claims:
+        X, Y = payoffs(S, *arguments)
+        for m in m_tuple:
+            for basis in bases:
+                auto   = gcc.valuation.value_gcc(S, X, Y, r, T, m=m, proj_type=basis, solver="auto")
+                qr     = gcc.valuation.value_gcc(S, X, Y, r, T, m=m, proj_type=basis, solver="qr")
+                error  = qr["dev"]/np.sqrt(N)
+                ok     = abs(auto["V"] - qr["V"]) <= 0.01*error
+                failed = failed or not ok
+                print "%-18s %3i %-10s %11.5f %11.5f %11.5f %s" % (name, m, basis, auto["V"], qr["V"], error,
+                                                                   "ok" if ok else "FAILED")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
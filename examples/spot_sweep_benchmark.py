@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+spot_sweep_benchmark.py
+
+Compares valuing a game put option for several starting values of the
+underlying by simulating paths for each, as the example drivers do, with
+gcc.valuation.value_spot_sweep on one normalised path set. Shows the running
+times, and the standard errors of the differences between the prices of
+neighbouring starting values, which common random numbers make smaller.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import getopt
+import numpy as np
+import gcc.security_simulation
+import gcc.valuation
+from gcc.claims import game_put_option
+from datetime import datetime
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python spot_sweep_benchmark.py [-N/--paths n] [-L/--steps l] [-m/--lse m] [-S/--spots s1,s2,...]
+
+-N/--paths n       number of paths (default 100000)
+
+-L/--steps l       number of time steps (default 100)
+
+-m/--lse m         use the LSE method with m basis functions (default no LSE)
+
+-S/--spots         comma separated starting values (default 80,90,100,110,120)
+'''
+
+
+r          = 0.06
+T          = 0.5
+volatility = 0.4
+K          = 100
+delta      = 5
+
+
+def payoffs(S):
+    return game_put_option.payoffs(S, K, delta)
+
+
+def seconds(t0):
+    dt = datetime.now() - t0
+    return dt.seconds + dt.microseconds/1e6
+
+
+def simulate_each(spots, N, L, params):
+    valuations = []
+    for S0 in spots:
+        S, rand_gen_state = gcc.security_simulation.black_scholes(S0, r, volatility, T, N, L)
+        X, Y = payoffs(S)
+        valuations.append(gcc.valuation.value_gcc(S, X, Y, r, T, stopped_payoffs=True, **dict(params)))
+        del S, X, Y
+    return valuations
+
+
+def sweep(spots, N, L, params):
+    S_unit, rand_gen_state = gcc.security_simulation.black_scholes(1, r, volatility, T, N, L)
+    return gcc.valuation.value_spot_sweep(S_unit, payoffs, spots, r, T, stopped_payoffs=True, **dict(params))
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hN:L:m:S:",
+                ["help", "paths=", "steps=", "lse=", "spots="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        N      = 100000
+        L      = 100
+        spots  = (80, 90, 100, 110, 120)
+        params = {}
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-N", "--paths"):
+                N = int(value.strip())
+            if option in ("-L", "--steps"):
+                L = int(value.strip())
+            if option in ("-m", "--lse"):
+                params["m"] = int(value.strip())
+            if option in ("-S", "--spots"):
+                spots = [float(v) for v in value.split(",")]
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    # Compile the kernels, or load them from the cache
+    sweep(spots[:1], 1000, L, params)
+
+    print "N =", N, "  L =", L, "  m =", params.get("m", "no LSE")
+    results = []
+    for name, func in (("simulate each", simulate_each), ("sweep", sweep)):
+        t0         = datetime.now()
+        valuations = func(spots, N, L, params)
+        results.append((name, valuations, seconds(t0)))
+
+    print "%-14s %10s" % ("", "time (s)") + "".join("%11s" % ("V(%g)" % S0) for S0 in spots)
+    for name, valuations, t in results:
+        print "%-14s %10.3f" % (name, t) + "".join("%11.5f" % valuation["V"] for valuation in valuations)
+
+    print
+    print "standard errors of the differences of the discounted stopped payoffs of neighbouring spots"
+    print "%-14s" % "" + "".join("%16s" % ("%g-%g" % (spots[k+1], spots[k])) for k in range(len(spots) - 1))
+    for name, valuations, t in results:
+        errors = []
+        for k in range(len(spots) - 1):
+            R_a = valuations[k]["R_sigma_tau"]
+            R_b = valuations[k+1]["R_sigma_tau"]
+            if name == "sweep":
+                errors.append(np.std(R_b - R_a, ddof=1)/np.sqrt(N))
+            else:
+                errors.append(np.sqrt((np.var(R_a, ddof=1) + np.var(R_b, ddof=1))/N))
+        print "%-14s" % name + "".join("%16.5f" % error for error in errors)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+stopping_times_benchmark.py
+
+Compares the vectorized backward induction in
+gcc.valuation.calculate_optimal_stopping_times with the original
+path-by-path loop, over the N/L grid used in example.py.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import getopt
+import numpy as np
+import gcc.security_simulation
+import gcc.valuation
+from datetime import datetime
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python stopping_times_benchmark.py [-N/--paths n1,n2,...] [-L/--steps l1,l2,...] [-m/--lse m]
+
+-N/--paths        comma separated path counts (default 1000,2000,4000,8000)
+
+-L/--steps        comma separated step counts (default 101,201,401,801,1601,3201)
+
+-m/--lse m        use the LSE method with m basis functions (default no LSE)
+'''
+
+
+def loop_stopping_times(S, X, Y, lse_opts={}):
+    """
+    The original path-by-path implementation of
+    L{gcc.valuation.calculate_optimal_stopping_times}, kept as a reference.
+    """
+    L     = S.shape[0] - 1
+    N     = S.shape[1]
+    tau   = np.empty((L, N), dtype=np.int32)
+    sigma = np.empty((L, N), dtype=np.int32)
+
+    if "m" in lse_opts:
+        exp_holding_value_func = gcc.valuation.exp_holding_value_lse
+    else:
+        exp_holding_value_func = gcc.valuation.exp_holding_value_no_lse
+
+    tau[L-1, :]   = L
+    sigma[L-1, :] = L
+    for j in range(L-2,-1,-1):
+        exp_holding_value = exp_holding_value_func(S, X, Y, sigma, tau, j, lse_opts)
+
+        for n in range(N):
+            if Y[j, n] == 0:
+                tau[j, n]   = tau[j+1, n]
+                sigma[j, n] = sigma[j+1, n]
+                continue
+
+            if Y[j, n] < exp_holding_value[n]:
+                tau[j, n] = tau[j+1, n]
+            else:
+                tau[j, n] = j+1
+
+            if X[j, n] < exp_holding_value[n]:
+                sigma[j, n] = j+1
+            else:
+                sigma[j, n] = sigma[j+1, n]
+
+    return sigma, tau
+
+
+def game_put_payoffs(S, K, delta, r, T):
+    L  = S.shape[0] - 1
+    dt = np.float64(T)/L
+    X  = np.maximum(K - S, 0) + delta
+    Y  = np.maximum(K - S, 0)
+    X[L, :] = Y[L, :]
+    for j in range(1, L):
+        X[j, :] = np.exp(-r*j*dt)*X[j, :]
+        Y[j, :] = np.exp(-r*j*dt)*Y[j, :]
+    return X, Y
+
+
+def time_call(func, *args):
+    t0     = datetime.now()
+    result = func(*args)
+    dt     = datetime.now() - t0
+    return result, dt.seconds + dt.microseconds/1e6
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hN:L:m:",
+                ["help", "paths=", "steps=", "lse="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        N_tuple  = (1000, 2000, 4000, 8000)
+        L_tuple  = (101, 201, 401, 801, 1601, 3201)
+        lse_opts = {}
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-N", "--paths"):
+                N_tuple = [int(v) for v in value.split(",")]
+            if option in ("-L", "--steps"):
+                L_tuple = [int(v) for v in value.split(",")]
+            if option in ("-m", "--lse"):
+                lse_opts["m"] = int(value.strip())
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    r          = 0.06
+    volatility = 0.4
+    K          = 100
+    delta      = 5
+    T          = 0.5
+    S0         = 100
+
+    print "%6s %6s %12s %12s %9s %s" % ("N", "L", "loop (s)", "vector (s)", "speedup", "identical")
+    for N in N_tuple:
+        for L in L_tuple:
+            S, rand_gen_state = gcc.security_simulation.black_scholes(S0=S0, r=r, volatility=volatility, T=T, N=N, L=L)
+            X, Y = game_put_payoffs(S, K, delta, r, T)
+
+            # The LSE step zeroes out-of-the-money entries of S, so each engine gets its own copy
+            (sigma_loop, tau_loop), t_loop = time_call(loop_stopping_times, S.copy(), X, Y, lse_opts)
+            (sigma_vec, tau_vec), t_vec    = time_call(gcc.valuation.calculate_optimal_stopping_times, S.copy(), X, Y, lse_opts)
+
+            identical = np.array_equal(sigma_loop, sigma_vec) and np.array_equal(tau_loop, tau_vec)
+            print "%6i %6i %12.3f %12.3f %8.1fx %s" % (N, L, t_loop, t_vec, t_loop/t_vec, identical)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+streaming_benchmark.py
+
+Compares the peak memory and running time of gcc.streaming.value_streaming
+with valuing all the paths at once, on the same paths. Each valuation runs
+in its own process, so that the peak resident set sizes don't mix. With the
+LSE, the resident set of the streaming valuation includes the pages of its
+temporary path store that are mapped in; the operating system can evict these
+under memory pressure.
+"""
+
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)) + '/../')
+import getopt
+import resource
+import gcc.security_simulation
+import gcc.streaming
+import gcc.valuation
+from gcc.claims import game_put_option
+from datetime import datetime
+from multiprocessing import Process, Queue
+
+
+class Usage(Exception):
+    def __init__(self, msg):
+        self.msg = msg
+
+
+help_message = '''
+Usage:
+python streaming_benchmark.py [-N/--paths n1,n2,...] [-L/--steps l] [-b/--block-size b] [-m/--lse m]
+       [-r/--regression-blocks r]
+
+-N/--paths           comma separated path counts (default 20000,80000,320000)
+
+-L/--steps l         number of time steps (default 101)
+
+-b/--block-size b    the number of paths in each block (default 10000)
+
+-m/--lse m           use the LSE method with m basis functions (default no LSE)
+
+-r/--regression-blocks r
+                     with the LSE, also value on the paths by streaming with the
+                     regressions run on the first r blocks only, and the other
+                     blocks priced out of sample
+'''
+
+
+r          = 0.06
+T          = 0.5
+S0         = 100
+volatility = 0.4
+seed       = 1
+
+
+def payoffs(S):
+    return game_put_option.payoffs(S, 110, 20)
+
+
+def value_in_memory(N, L, block_size, params):
+    S, seed_state = gcc.security_simulation.black_scholes_blocks(S0, r, volatility, T, N, L, seed, block_size)
+    X, Y = payoffs(S)
+    return gcc.valuation.value_gcc(S, X, Y, r, T, **params)
+
+
+def value_streaming(N, L, block_size, params):
+    fill_block = gcc.security_simulation.black_scholes_block_filler(S0, r, volatility, T, L)
+    return gcc.streaming.value_streaming(fill_block, payoffs, r, T, N, L, seed, block_size, **params)
+
+
+def measure(queue, func, N, L, block_size, params):
+    baseline  = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    t0        = datetime.now()
+    valuation = func(N, L, block_size, params)
+    dt        = datetime.now() - t0
+    peak      = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put((valuation["V"], valuation["dev"], dt.seconds + dt.microseconds/1e6, (peak - baseline)/1024.0))
+
+
+def run(func, N, L, block_size, params):
+    queue   = Queue()
+    process = Process(target=measure, args=(queue, func, N, L, block_size, params))
+    process.start()
+    result  = queue.get()
+    process.join()
+    return result
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv
+    try:
+        try:
+            opts, args = getopt.getopt(argv[1:], "hN:L:b:m:r:",
+                ["help", "paths=", "steps=", "block-size=", "lse=", "regression-blocks="])
+        except getopt.error, msg:
+            raise Usage(msg)
+
+        # option processing
+        N_tuple    = (20000, 80000, 320000)
+        L          = 101
+        block_size = 10000
+        params     = {}
+        subset     = None
+        for option, value in opts:
+            if option in ("-h", "--help"):
+                raise Usage(help_message)
+            if option in ("-N", "--paths"):
+                N_tuple = [int(v) for v in value.split(",")]
+            if option in ("-L", "--steps"):
+                L = int(value.strip())
+            if option in ("-b", "--block-size"):
+                block_size = int(value.strip())
+            if option in ("-m", "--lse"):
+                params["m"] = int(value.strip())
+            if option in ("-r", "--regression-blocks"):
+                subset = int(value.strip())
+    except Usage, err:
+        print >> sys.stderr, sys.argv[0].split("/")[-1] + ": " + str(err.msg)
+        print >> sys.stderr, "\t for help use --help"
+        return 2
+
+    methods = [("in memory", value_in_memory, params), ("streaming", value_streaming, params)]
+    if subset is not None and "m" in params:
+        methods.append(("subset fit", value_streaming, dict(params, regression_blocks=subset)))
+
+    print "L =", L, "  block size =", block_size, "  m =", params.get("m", "no LSE")
+    print "%8s %-10s %10s %10s %10s %12s" % ("N", "method", "V", "dev", "time (s)", "peak (MB)")
+    for N in N_tuple:
+        for name, func, method_params in methods:
+            V, dev, t, peak = run(func, N, L, block_size, method_params)
+            print "%8i %-10s %10.4f %10.4f %10.3f %12.1f" % (N, name, V, dev, t, peak)
+
+
+if __name__ == '__main__':
+    main()
@@ -8,6 +8,7 @@ Copyright (c) 2009 Daniel Eliasson. All rights reserved.
 """
 
 from .. import valuation
+from .. import precision as prec
 import numpy as np
 
 def value(S, K, delta, r, T, **params):
@@ -31,7 +32,53 @@ def value(S, K, delta, r, T, **params):
     @return:        the output of L{gcc.valuation.value_gcc}
     """
     params.update({"S": S, "K": K, "delta": delta, "r": r, "T": T})
+    X, Y = payoff_functions(K, delta, S.shape[0] - 1)
+    return valuation.value_gcc(X=X, Y=Y, **params)
+
+
+def payoffs(S, K, delta, precision=None):
+    """
+    Builds the payoff processes of a game call option.
+
+    @type    S:            (L+1) x N-array
+    @param   S:            the simulated underlying paths,
+    @type    K:            number
+    @param   K:            the strike of the call option,
+    @type    delta:        number or (L+1) x N-array
+    @param   delta:        the penalty for terminating the option,
+    @type    precision:    string
+    @param   precision:    C{"double"} or C{"single"}, see L{gcc.precision}. By default,
+                           the precision of C{S}.
 
+    @return:        a tuple containing the (L+1) x N-arrays C{X} and C{Y}, as
+                    expected by L{gcc.valuation.value_gcc}.
+    """
+    dtype = prec.float_type(precision or prec.precision_of(S))
+    S     = np.asarray(S, dtype=dtype)
     X = np.maximum(S - K, 0) + delta
     Y = np.maximum(S - K, 0)
-    return valuation.value_gcc(X=X, Y=Y, **params)
+    return X.astype(dtype, copy=False), Y.astype(dtype, copy=False)
+
+
+def payoff_functions(K, delta, L):
+    """
+    Builds the payoff processes of a game call option as functions of the time steps of
+    the underlying, which L{gcc.valuation.value_gcc} calls as the backward induction
+    reaches each time step, rather than building the arrays of L{payoffs} up front.
+
+    @type    K:        number
+    @param   K:        the strike of the call option,
+    @type    delta:    number or (L+1) x N-array
+    @param   delta:    the penalty for terminating the option,
+    @type    L:        integer
+    @param   L:        the number of time steps.
+
+    @return:        a tuple containing the functions C{X} and C{Y}, which take the
+                    N-array C{S[j, :]} and the time step M{j}, and return the rows
+                    M{j} of the arrays of L{payoffs}.
+    """
+    def Y(S_j, j):
+        return np.maximum(S_j - K, 0)
+    def X(S_j, j):
+        return Y(S_j, j) + (delta[j] if np.ndim(delta) == 2 else delta)
+    return X, Y
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+control_variates.py
+
+Control variates for the valuations of L{gcc.valuation}. A control is a
+discounted payoff at maturity whose expectation is known in closed form under
+Black-Scholes. The discounted stopped payoffs of the paths are corrected by the
+deviations of the controls from their expectations, times the coefficients that
+minimise the variance of the correction, which are estimated by least squares
+on the same paths.
+
+A control is given as a C{dict} with a C{"type"}, and the parameters of its payoff:
+    - C{{"type": "stock"}}, the discounted terminal stock price, with the expectation M{S_0},
+    - C{{"type": "put", "K": K, "volatility": volatility}}, the discounted payoff of a
+      European put with strike M{K}, with the expectation of the Black-Scholes price,
+    - C{{"type": "call", "K": K, "volatility": volatility}}, likewise for a European call.
+
+The expectations assume risk-neutral paths without dividends, as those of
+L{gcc.security_simulation.black_scholes}.
+"""
+
+import math
+import numpy as np
+
+
+def control_values(control, S, r, T):
+    """
+    Evaluates a control on the simulated paths.
+
+    @type    control:    C{dict}
+    @param   control:    the control, as described in the module documentation,
+    @type    S:          (L+1) x N-array
+    @param   S:          the simulated underlying paths, all starting at the same M{S_0},
+    @type    r:          number
+    @param   r:          the risk-free interest rate,
+    @type    T:          number
+    @param   T:          the maturity time, measured in years.
+
+    @return:    a tuple containing the N-array of the discounted payoffs of the control
+                on the paths, and their expectation.
+    """
+    S0       = np.float64(S[0, 0])
+    S_L      = np.asarray(S[-1, :], dtype=np.float64)
+    discount = np.exp(-r*T)
+    kind     = control.get("type")
+    if kind == "stock":
+        return discount*S_L, S0
+    if kind == "put":
+        K = np.float64(control["K"])
+        return discount*np.maximum(K - S_L, 0), black_scholes_put(S0, K, r, control["volatility"], T)
+    if kind == "call":
+        K = np.float64(control["K"])
+        return discount*np.maximum(S_L - K, 0), black_scholes_call(S0, K, r, control["volatility"], T)
+    raise ValueError("Unknown control variate: %s" % kind)
+
+
+def control_matrix(controls, S, r, T):
+    """
+    Evaluates several controls on the simulated paths.
+
+    @type    controls:    sequence of C{dict}s
+    @param   controls:    the controls, as described in the module documentation,
+    @param   S, r, T:     as for L{control_values}.
+
+    @return:    a tuple containing the k x N-array of the discounted payoffs of the
+                k controls, and the k-array of their expectations.
+    """
+    Z     = np.empty((len(controls), S.shape[1]))
+    means = np.empty(len(controls))
+    for i, control in enumerate(controls):
+        Z[i, :], means[i] = control_values(control, S, r, T)
+    return Z, means
+
+
+def adjust(R_sigma_tau, Z, means):
+    """
+    Corrects the discounted stopped payoffs of the paths with the controls. The
+    coefficients minimise the sample variance of the corrected payoffs, and are
+    found by least squares on the deviations of the payoffs and the controls from
+    their sample means, which tolerates controls that are constant or collinear.
+
+    @type    R_sigma_tau:    N-array
+    @param   R_sigma_tau:    the discounted payoffs M{R(sigma_1, tau_1)} for all paths,
+    @type    Z:              k x N-array
+    @param   Z:              the discounted payoffs of the controls,
+    @type    means:          k-array
+    @param   means:          the expectations of the controls.
+
+    @return:    a tuple containing the corrected N-array of payoffs, in C{float64},
+                and the k-array of coefficients.
+    """
+    R_sigma_tau  = np.asarray(R_sigma_tau, dtype=np.float64)
+    Z_centered   = Z - np.mean(Z, axis=1)[:, np.newaxis]
+    G            = np.dot(Z_centered, Z_centered.T)
+    c            = np.dot(Z_centered, R_sigma_tau - np.mean(R_sigma_tau))
+    coefficients = np.linalg.lstsq(G, c, rcond=None)[0]
+    return R_sigma_tau - np.dot(coefficients, Z - means[:, np.newaxis]), coefficients
+
+
+def black_scholes_call(S0, K, r, volatility, T):
+    """
+    @return:    the Black-Scholes price of a European call with strike M{K} and maturity M{T}.
+    """
+    d1, d2 = black_scholes_d(S0, K, r, volatility, T)
+    return S0*normal_cdf(d1) - K*math.exp(-r*T)*normal_cdf(d2)
+
+
+def black_scholes_put(S0, K, r, volatility, T):
+    """
+    @return:    the Black-Scholes price of a European put with strike M{K} and maturity M{T}.
+    """
+    d1, d2 = black_scholes_d(S0, K, r, volatility, T)
+    return K*math.exp(-r*T)*normal_cdf(-d2) - S0*normal_cdf(-d1)
+
+
+def black_scholes_d(S0, K, r, volatility, T):
+    """
+    @return:    a tuple of the M{d_1} and M{d_2} of the Black-Scholes formula.
+    """
+    d1 = (math.log(S0/K) + (r + volatility**2/2)*T)/(volatility*math.sqrt(T))
+    return d1, d1 - volatility*math.sqrt(T)
+
+
+def normal_cdf(x):
+    """
+    @return:    the standard normal distribution function at M{x}.
+    """
+    return 0.5*math.erfc(-x/math.sqrt(2))
@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+kernels.py
+
+Compiled kernels for the per-path decisions of the backward induction in
+L{gcc.valuation}, used when the C{backend} of a valuation is C{"numba"}.
+
+Numba is optional. Without it, L{available} is C{False}, the kernels are
+plain Python functions, and the valuations use their NumPy implementations.
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+backends = ("auto", "numba", "numpy")
+
+
+def available():
+    """
+    @return:    C{True} if Numba is installed, so the kernels are compiled.
+    """
+    return numba is not None
+
+
+def resolve_backend(backend):
+    """
+    Picks the implementation of a valuation.
+
+    @type    backend:    string
+    @param   backend:    one of C{"auto"}, which is C{"numba"} if Numba is installed
+                         and C{"numpy"} otherwise, C{"numba"} or C{"numpy"}.
+
+    @return:    C{"numba"} or C{"numpy"}.
+    """
+    if backend not in backends:
+        raise ValueError("Unknown backend: %s" % backend)
+    if backend == "auto":
+        return "numba" if available() else "numpy"
+    if backend == "numba" and not available():
+        raise ImportError("The numba backend requires Numba to be installed")
+    return backend
+
+
+def jit(parallel):
+    """
+    Compiles a kernel in nopython mode, with C{prange} loops run in parallel
+    if C{parallel} is set. Without Numba, the kernel is left as it is.
+    """
+    def decorate(func):
+        if numba is None:
+            return func
+        return numba.njit(parallel=parallel, cache=True)(func)
+    return decorate
+
+
+if numba is not None:
+    prange = numba.prange
+else:
+    prange = range
+
+
+@jit(parallel=True)
+def stopped_payoffs_no_lse(X, Y, discount, out):
+    """
+    Calculates the discounted stopped payoffs M{R(sigma_1, tau_1)} without the LSE,
+    like L{gcc.valuation.calculate_stopped_payoffs}. The holding value at time step
+    M{j} is the stopped payoff M{R(sigma_{j+1}, tau_{j+1})} itself.
+
+    @type    X:           (L+1) x N-array
+    @param   X:           the payoffs to the option holder when the writer terminates,
+    @type    Y:           (L+1) x N-array
+    @param   Y:           the payoffs to the option holder when he exercises,
+    @type    discount:    (L+1)-array
+    @param   discount:    the discount factor of each time step,
+    @type    out:         N-array
+    @param   out:         the array to write the stopped payoffs into.
+
+    @return:    C{out}
+    """
+    L = X.shape[0] - 1
+    for n in prange(X.shape[1]):
+        out[n] = Y[L, n]*discount[L] # tau_L = sigma_L = L for all paths
+    for j in range(L-2, -1, -1):
+        update_stopped_payoffs(out, X, Y, j, discount, out)
+    return out
+
+
+@jit(parallel=True)
+def update_stopped_payoffs(R_sigma_tau, X, Y, j, discount, exp_holding_value):
+    """
+    Takes one step back in the running stopped payoff, like
+    L{gcc.valuation.update_stopped_payoffs}, discounting the payoffs at time
+    steps M{j} and M{j+1} on the fly.
+
+    @type    R_sigma_tau:          N-array
+    @param   R_sigma_tau:          the stopped payoffs M{R(sigma_{j+1}, tau_{j+1})}, updated in place,
+    @type    X:                    (L+1) x N-array
+    @param   X:                    the payoffs to the option holder when the writer terminates,
+    @type    Y:                    (L+1) x N-array
+    @param   Y:                    the payoffs to the option holder when he exercises,
+    @type    j:                    integer
+    @param   j:                    the time step,
+    @type    discount:             (L+1)-array
+    @param   discount:             the discount factor of each time step,
+    @type    exp_holding_value:    N-array
+    @param   exp_holding_value:    the expected holding values at time step M{j}. This
+                                   may be C{R_sigma_tau} itself.
+
+    @return:    nothing
+    """
+    discount_j    = discount[j]
+    discount_next = discount[j+1]
+    for n in prange(X.shape[1]):
+        # Each case overrides the ones before it, which compiles to selects rather than
+        # branches, so the loop is vectorized
+        holding_value = exp_holding_value[n]
+        Y_j           = Y[j, n]*discount_j
+        R_j           = R_sigma_tau[n]
+        if X[j, n]*discount_j < holding_value:
+            R_j = X[j+1, n]*discount_next
+        # Exercise takes precedence over termination
+        if not Y_j < holding_value:
+            R_j = Y[j+1, n]*discount_next
+        # Out-of-the-money paths keep the stopped payoff from j+1
+        if Y_j == 0:
+            R_j = R_sigma_tau[n]
+        R_sigma_tau[n] = R_j
+
+
+@jit(parallel=True)
+def update_stopped_payoff_rows(R_sigma_tau, X_j, Y_j, X_next, Y_next, exp_holding_value):
+    """
+    Takes one step back in the running stopped payoff, like
+    L{update_stopped_payoffs}, from the discounted payoffs at time steps M{j}
+    and M{j+1} only, e.g. when they are computed a time step at a time.
+
+    @type    R_sigma_tau:          N-array
+    @param   R_sigma_tau:          the stopped payoffs M{R(sigma_{j+1}, tau_{j+1})}, updated in place,
+    @type    X_j:                  N-array
+    @param   X_j:                  the termination payoffs at time step M{j},
+    @type    Y_j:                  N-array
+    @param   Y_j:                  the exercise payoffs at time step M{j},
+    @type    X_next:               N-array
+    @param   X_next:               the termination payoffs at time step M{j+1},
+    @type    Y_next:               N-array
+    @param   Y_next:               the exercise payoffs at time step M{j+1},
+    @type    exp_holding_value:    N-array
+    @param   exp_holding_value:    the expected holding values at time step M{j}. This
+                                   may be C{R_sigma_tau} itself.
+
+    @return:    nothing
+    """
+    for n in prange(X_j.shape[0]):
+        holding_value = exp_holding_value[n]
+        R_j           = R_sigma_tau[n]
+        if X_j[n] < holding_value:
+            R_j = X_next[n]
+        # Exercise takes precedence over termination
+        if not Y_j[n] < holding_value:
+            R_j = Y_next[n]
+        # Out-of-the-money paths keep the stopped payoff from j+1
+        if Y_j[n] == 0:
+            R_j = R_sigma_tau[n]
+        R_sigma_tau[n] = R_j
+
+
+@jit(parallel=True)
+def gather_stopped_payoffs(X, Y, sigma, tau, j, out):
+    """
+    Calculates the payoff M{R(sigma_j, tau_j)}, like L{gcc.valuation.R}.
+
+    @type    X:        (L+1) x N-array
+    @param   X:        the payoffs to the option holder when the writer terminates,
+    @type    Y:        (L+1) x N-array
+    @param   Y:        the payoffs to the option holder when he exercises,
+    @type    sigma:    L x N-array
+    @param   sigma:    the optimal stopping strategy for the writer of the option,
+    @type    tau:      L x N-array
+    @param   tau:      the optimal stopping strategy for the holder of the option,
+    @type    j:        integer
+    @param   j:        the time step to evaluate the payoff at,
+    @type    out:      N-array
+    @param   out:      the array to write the payoffs into.
+
+    @return:    C{out}
+    """
+    for n in prange(X.shape[1]):
+        if sigma[j, n] < tau[j, n]:
+            out[n] = X[sigma[j, n], n]
+        else:
+            out[n] = Y[tau[j, n], n]
+    return out
+
+
+@jit(parallel=True)
+def update_stopping_times(sigma, tau, X, Y, j, exp_holding_value):
+    """
+    Sets the optimal stopping strategies from time step M{j}, given the ones from
+    M{j+1}, like the loop body of L{gcc.valuation.calculate_optimal_stopping_times}.
+
+    @type    sigma:                L x N-array
+    @param   sigma:                the optimal stopping strategy for the writer of the option,
+    @type    tau:                  L x N-array
+    @param   tau:                  the optimal stopping strategy for the holder of the option,
+    @type    X:                    (L+1) x N-array
+    @param   X:                    the discounted payoffs to the option holder when the writer terminates,
+    @type    Y:                    (L+1) x N-array
+    @param   Y:                    the discounted payoffs to the option holder when he exercises,
+    @type    j:                    integer
+    @param   j:                    the time step,
+    @type    exp_holding_value:    N-array
+    @param   exp_holding_value:    the expected holding values at time step M{j}.
+
+    @return:    nothing
+    """
+    for n in prange(X.shape[1]):
+        tau[j, n]   = tau[j+1, n]
+        sigma[j, n] = sigma[j+1, n]
+        if Y[j, n] == 0:
+            continue
+        if not Y[j, n] < exp_holding_value[n]:
+            tau[j, n] = j+1
+        if X[j, n] < exp_holding_value[n]:
+            sigma[j, n] = j+1
+
+
+@jit(parallel=False)
+def block_stopped_payoffs_no_lse(X, Y, discount, out):
+    """
+    Calculates the discounted stopped payoffs of a block of paths without the LSE,
+    like L{stopped_payoffs_no_lse}, for L{gcc.valuation.value_no_lse_block}. This runs
+    in the worker processes of a L{gcc.valuation.ValuationPool}, which already run
+    one block each, so the paths are not split over threads.
+
+    @type    X:           (L+1) x n-array
+    @param   X:           the payoffs to the option holder when the writer terminates,
+    @type    Y:           (L+1) x n-array
+    @param   Y:           the payoffs to the option holder when he exercises,
+    @type    discount:    (L+1)-array
+    @param   discount:    the discount factor of each time step,
+    @type    out:         n-array
+    @param   out:         the array to write the stopped payoffs into.
+
+    @return:    C{out}
+    """
+    L = X.shape[0] - 1
+    N = X.shape[1]
+    for n in range(N):
+        out[n] = Y[L, n]*discount[L] # tau_L = sigma_L = L for all paths
+    for j in range(L-2, -1, -1):
+        discount_j    = discount[j]
+        discount_next = discount[j+1]
+        for n in range(N):
+            # As in update_stopped_payoffs, the holding value is the stopped payoff itself
+            Y_j = Y[j, n]*discount_j
+            if Y_j == 0:
+                continue
+            if not Y_j < out[n]:
+                out[n] = Y[j+1, n]*discount_next
+            elif X[j, n]*discount_j < out[n]:
+                out[n] = X[j+1, n]*discount_next
+    return out
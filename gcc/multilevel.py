@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+multilevel.py
+
+Multilevel Monte-Carlo valuations of GCCs across time step grids. Level 0 values
+the GCC on Black-Scholes paths with M{L_0} time steps, and each level M{l > 0}
+estimates the difference between the values with M{L_l = M*L_(l-1)} and
+M{L_(l-1)} time steps, on pairs of fine and coarse paths driven by the same
+Brownian increments. The paths are simulated exactly on the fine grid, so the
+coarse path, whose increments are the sums of M consecutive fine increments,
+is the fine path at every M-th time step. The differences on a pair of paths
+are small, so few of the expensive fine paths are needed.
+
+The levels are priced by L{gcc.valuation.value_gcc}, which gives the discounted
+stopped payoffs M{R(sigma_1, tau_1)} of each path. Their expectations telescope
+to the expectation on the finest grid, and the price is the minimum of M{X_0}
+and the maximum of M{Y_0} and that expectation, as for a single level.
+"""
+
+import numpy as np
+import valuation
+import security_simulation
+from datetime import datetime
+
+
+def value_mlmc(S0, r, volatility, T, payoffs, rmse, L0=100, M=2, levels=3, max_levels=6, N0=1000,
+               seed=0, block_size=10000, alpha=1, **params):
+    """
+    Values a GCC by multilevel Monte-Carlo, choosing the number of paths of each
+    level from the observed variances of the levels, so that the estimated root
+    mean square error of the price is at most C{rmse}, at the least cost. Half the
+    mean square error is given to the variance, and half to the bias of the finest
+    grid. Levels are added until the bias, estimated from the expectation of the
+    finest level, is small enough, or there are C{max_levels} levels.
+
+    @type        S0:            number
+    @param       S0:            the starting value of the paths,
+    @type        r:             number
+    @param       r:             the risk-free interest rate,
+    @type        volatility:    number
+    @param       volatility:    the volatility of the underlying,
+    @type        T:             number
+    @param       T:             the maturity time, measured in years,
+    @type        payoffs:       function
+    @param       payoffs:       a function taking an (L+1) x n-array of paths, and returning
+                                a tuple of the (L+1) x n-arrays C{X} and C{Y}, as for
+                                L{gcc.valuation.value_rqmc},
+    @type        rmse:          number
+    @param       rmse:          the target root mean square error of the price,
+    @type        L0:            integer
+    @param       L0:            the number of time steps of level 0,
+    @type        M:             integer
+    @param       M:             the refinement factor of the time steps between levels,
+    @type        levels:        integer
+    @param       levels:        the number of levels to start with, at least 2,
+    @type        max_levels:    integer
+    @param       max_levels:    the most levels to add,
+    @type        N0:            integer
+    @param       N0:            the even number of paths of each level in the first round,
+                                from which the variances are estimated,
+    @type        seed:          integer
+    @param       seed:          the seed of the paths. Each level and batch of paths has its
+                                own random number stream, seeded with C{[seed, l, b]},
+    @type        block_size:    integer
+    @param       block_size:    the most paths to simulate and value at once,
+    @type        alpha:         number
+    @param       alpha:         the assumed order of weak convergence in the time step,
+                                which the bias estimate is based on,
+    @param       params:        optional parameters, as for L{gcc.valuation.value_gcc}, which
+                                values each batch of paths.
+
+    @return:  a C{dict} object containing all the input parameters except C{payoffs},
+              as well as:
+                  - C{V}, the option price,
+                  - C{std_error}, the standard error of C{V},
+                  - C{bias}, the estimated bias of C{V} from the finest time step,
+                  - C{rmse_estimate}, the estimated root mean square error of C{V},
+                  - C{L_levels}, the number of time steps of each level,
+                  - C{N_levels}, the number of paths of each level,
+                  - C{level_means} and C{level_variances}, the mean and variance of the
+                    differences of the discounted stopped payoffs of each level,
+                  - C{cost}, the number of path time steps simulated and valued,
+                  - C{cost_single_level}, an estimate of the cost of the same standard
+                    error with L{gcc.valuation.value_gcc} on the finest grid alone,
+                  - C{time}, the running time of the simulation and option pricing.
+    """
+    if levels < 2:
+        raise ValueError("Multilevel Monte-Carlo takes at least 2 levels")
+    t0 = datetime.now()
+    r  = np.float64(r)
+    T  = np.float64(T)
+
+    options = dict(params)
+    options["stopped_payoffs"] = True
+    params.pop("workspace", None)
+
+    sums    = np.zeros(max_levels)
+    squares = np.zeros(max_levels)
+    N       = np.zeros(max_levels, dtype=np.int64)
+    batches = np.zeros(max_levels, dtype=np.int64)
+    payoffs_at_0 = []
+
+    def sample(l, n):
+        # Simulates and values n more fine and coarse paths of level l
+        while n > 0:
+            n_batch = min(n, block_size)
+            n_batch = n_batch + n_batch % 2
+            differences = level_differences(S0, r, volatility, T, payoffs, L0*M**l, M if l > 0 else None,
+                                            n_batch, np.random.RandomState([seed, l, batches[l]]), options,
+                                            payoffs_at_0)
+            sums[l]    += np.sum(differences)
+            squares[l] += np.sum(np.square(differences))
+            N[l]       += n_batch
+            batches[l] += 1
+            n          -= n_batch
+
+    cost_per_path = np.array([L0*M**l + (L0*M**(l-1) if l > 0 else 0) for l in range(max_levels)], dtype=np.float64)
+    dN = np.zeros(max_levels, dtype=np.int64)
+    dN[:levels] = N0
+    while True:
+        for l in range(levels):
+            if dN[l] > 0:
+                sample(l, dN[l])
+
+        means     = sums[:levels]/N[:levels]
+        variances = np.maximum(squares[:levels]/N[:levels] - np.square(means), 0)*N[:levels]/(N[:levels] - 1)
+
+        # The numbers of paths that minimise the cost for the variance rmse^2/2
+        costs  = cost_per_path[:levels]
+        N_opt  = np.ceil(2/rmse**2*np.sqrt(variances/costs)*np.sum(np.sqrt(variances*costs))).astype(np.int64)
+        dN[:levels] = np.maximum(N_opt - N[:levels], 0)
+        if np.any(dN[:levels] > 0):
+            continue
+
+        bias = estimate_bias(means, M, alpha)
+        if bias <= rmse/np.sqrt(2) or levels == max_levels:
+            break
+        dN[levels] = N0
+        levels    += 1
+
+    X_0, Y_0  = payoffs_at_0[0]
+    V         = min(X_0, max(Y_0, np.sum(means)))
+    std_error = np.sqrt(np.sum(variances/N[:levels]))
+    cost      = np.sum(N[:levels]*costs)
+    t1        = datetime.now()
+
+    params.update({
+        "S0":                S0,
+        "r":                 r,
+        "volatility":        volatility,
+        "T":                 T,
+        "rmse":              rmse,
+        "L0":                L0,
+        "M":                 M,
+        "seed":              seed,
+        "V":                 V,
+        "std_error":         std_error,
+        "bias":              bias,
+        "rmse_estimate":     np.sqrt(std_error**2 + bias**2),
+        "levels":            levels,
+        "L_levels":          [int(L0*M**l) for l in range(levels)],
+        "N_levels":          [int(n) for n in N[:levels]],
+        "level_means":       [float(mean) for mean in means],
+        "level_variances":   [float(variance) for variance in variances],
+        "cost":              float(cost),
+        "cost_single_level": float(2*variances[0]/rmse**2*L0*M**(levels-1)),
+        "time":              str(t1 - t0),
+    })
+    return params
+
+
+def level_differences(S0, r, volatility, T, payoffs, L, M, n, random_state, options, payoffs_at_0):
+    """
+    Simulates n fine paths with M{L} time steps, and values the GCC on them and on
+    the coarse paths with M{L/M} time steps made of every M-th time step.
+
+    @param   S0, r, volatility, T, payoffs:    as for L{value_mlmc},
+    @type    L:               integer
+    @param   L:               the number of time steps of the fine paths,
+    @type    M:               integer
+    @param   M:               the refinement factor, or C{None} for level 0, which has no
+                              coarse paths,
+    @type    n:               integer
+    @param   n:               the even number of paths,
+    @param   random_state:    the C{numpy.random.RandomState} of the paths,
+    @type    options:         C{dict}
+    @param   options:         the parameters of L{gcc.valuation.value_gcc},
+    @type    payoffs_at_0:    list
+    @param   payoffs_at_0:    a list that the payoffs M{X_0} and M{Y_0} are appended to.
+
+    @return:    an n-array of the discounted stopped payoffs on the fine paths, less
+                those on the coarse paths.
+    """
+    S = np.empty((L+1, n))
+    security_simulation.black_scholes_block(S0, r, volatility, T/L, random_state, S)
+    differences = stopped_payoffs(S, r, T, payoffs, options, payoffs_at_0)
+    if M is not None:
+        differences -= stopped_payoffs(S[::M, :], r, T, payoffs, options, payoffs_at_0)
+    return differences
+
+
+def stopped_payoffs(S, r, T, payoffs, options, payoffs_at_0):
+    """
+    @return:    the n-array of discounted stopped payoffs M{R(sigma_1, tau_1)} of
+                L{gcc.valuation.value_gcc} on the paths M{S}.
+    """
+    X, Y = payoffs(S)
+    if not payoffs_at_0:
+        payoffs_at_0.append((X[0, 0], Y[0, 0]))
+    return valuation.value_gcc(S, X, Y, r, T, **dict(options))["R_sigma_tau"]
+
+
+def estimate_bias(means, M, alpha):
+    """
+    Estimates the bias of the finest level from the means of the differences of
+    the two finest levels, which shrink by a factor of M{M^alpha} per level.
+
+    @return:    the estimated absolute bias.
+    """
+    refinement = M**alpha
+    return max(abs(means[-1]), abs(means[-2])/refinement)/(refinement - 1)
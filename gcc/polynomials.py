@@ -9,6 +9,18 @@ Copyright (c) 2009 Daniel Eliasson. All rights reserved.
 
 import numpy as np
 import numpy.linalg
+from timeit import default_timer
+
+try:
+    from scipy.linalg import lapack
+except ImportError:
+    lapack = None
+
+
+# Largest condition number of the basis matrix for which the "auto" solver uses the
+# Cholesky factorization of the normal equations, rather than the QR factorization.
+# Cholesky loses precision with the square of the condition number, QR linearly.
+cholesky_max_cond = 1e4
 
 
 def get_eval_func(poly_type):
@@ -27,19 +39,26 @@ def get_eval_func(poly_type):
         return hermite_eval_upto
 
 
-def laguerre_eval_upto(x, m):
+def laguerre_eval_upto(x, m, out=None):
     """
     Evaluates Laguerre polynomials 0 through M{m-1} at M{x}.
 
-    @type    x:    number
-    @param   x:    the point to evaluate the polynomials,
-    @type    m:    integer
-    @param   m:    the number of polynomials to evaluate.
+    @type    x:      number
+    @param   x:      the point to evaluate the polynomials,
+    @type    m:      integer
+    @param   m:      the number of polynomials to evaluate,
+    @type    out:    N x m-array
+    @param   out:    an optional array to write the evaluated polynomials into.
 
     @return:    an N-array of the evaluated polynomials.
     """
-    N         = x.shape[0]
-    laguerres = np.c_[np.ones((N, 1)), 1 - x, np.empty((N, m-2))]
+    N = x.shape[0]
+    if out is None:
+        laguerres = np.c_[np.ones((N, 1)), 1 - x, np.empty((N, m-2))]
+    else:
+        laguerres       = out
+        laguerres[:, 0] = 1
+        laguerres[:, 1] = 1 - x
     if m > 2:
         for i in range(2, m):
             laguerres[:, i] = (1.0/i)*(  (2*i - 1 - x) * laguerres[:, i-1]
@@ -47,49 +66,261 @@ def laguerre_eval_upto(x, m):
     return laguerres
 
 
-def hermite_eval_upto(x, m):
+def hermite_eval_upto(x, m, out=None):
     """
     Evaluates Hermite polynomials 0 through M{m-1} at M{x}.
 
-    @type    x:    number
-    @param   x:    the point to evaluate the polynomials,
-    @type    m:    integer
-    @param   m:    the number of polynomials to evaluate.
+    @type    x:      number
+    @param   x:      the point to evaluate the polynomials,
+    @type    m:      integer
+    @param   m:      the number of polynomials to evaluate,
+    @type    out:    N x m-array
+    @param   out:    an optional array to write the evaluated polynomials into.
 
     @return:    an N-array of the evaluated polynomials.
     """
-    N        = x.shape[0]
-    hermites = np.c_[np.ones((N, 1)), x, np.empty((N, m-2))]
+    N = x.shape[0]
+    if out is None:
+        hermites = np.c_[np.ones((N, 1)), x, np.empty((N, m-2))]
+    else:
+        hermites       = out
+        hermites[:, 0] = 1
+        hermites[:, 1] = x
     if m > 2:
         for i in range(2, m):
             hermites[:, i] = x * hermites[:, i-1] - (i-1) * hermites[:, i-2]
     return hermites
 
 
-def lse(S_t, Y_tau, m, poly_type):
+def lse(S_t, Y_tau, m, poly_type, solver="auto", out=None, basis=None, diagnostics=None):
     """
     Calculate LSE M{a} in M{R^m} for problem M{Y_tau = S_t*a + err},
     where M{Y_tau} is the stopped payoff at stopping time M{tau^{bar}_{t+1}}
     for all paths M{omega_n}, M{n=1, ..., N} and M{S_t} is the
     stock price for all paths.
 
-    @type    S_t:          N-array
-    @param   S_t:          the stock price at time C{t} for all paths,
-    @type    Y_tau:        N-array
-    @param   Y_tau:        the stopped payoff at stopping time M{tau},
-    @type    m:            integer
-    @param   m:            the number of polynomials to evaluate,
-    @type    poly_type:    string
-    @param   poly_type:    the type of functions in the projection subspace, as recognised
-                           by L{gcc.polynomials}; e.g. C{"hermite"} or C{"laguerre"}.
+    @type    S_t:            N-array
+    @param   S_t:            the stock price at time C{t} for all paths,
+    @type    Y_tau:          N-array
+    @param   Y_tau:          the stopped payoff at stopping time M{tau},
+    @type    m:              integer
+    @param   m:              the number of polynomials to evaluate,
+    @type    poly_type:      string
+    @param   poly_type:      the type of functions in the projection subspace, as recognised
+                             by L{gcc.polynomials}; e.g. C{"hermite"} or C{"laguerre"},
+    @type    solver:         string
+    @param   solver:         the least squares solver, as recognised by L{lse_coefficients},
+    @type    out:            N-array
+    @param   out:            an optional array to write the projection into,
+    @type    basis:          N x m-array
+    @param   basis:          an optional array to evaluate the polynomials into,
+    @type    diagnostics:    list
+    @param   diagnostics:    an optional list, which the solver details are appended to,
+                             see L{lse_coefficients}.
 
-    @return:    an array where the first element is the N-array LSE M{a}
+    @return:    an array where the first element is the m-array LSE M{a}
                 and the second element is the N-array of the projection
                 M{Y_fit = S_t*a}.
     """
     poly_func = get_eval_func(poly_type)
-    N         = S_t.shape[0]
-    L         = poly_func(S_t, m)
-    lse       = np.linalg.lstsq(L, Y_tau)
-    proj      = np.mat(L)*np.mat(lse[0]).T
-    return [lse[0], proj]
+    B         = poly_func(S_t, m, basis)
+    return lse_from_basis(B, Y_tau, solver, out, diagnostics)
+
+
+def lse_from_basis(B, Y_tau, solver="auto", out=None, diagnostics=None):
+    """
+    Calculate LSE M{a} for problem M{Y_tau = B*a + err}, where the basis
+    functions have already been evaluated into C{B}. Several right-hand
+    sides can be solved at once, sharing a single factorization of C{B}.
+
+    @type    B:              N x m-array
+    @param   B:              the evaluated basis functions for all paths,
+    @type    Y_tau:          N-array or N x k-array
+    @param   Y_tau:          the stopped payoffs, one column per right-hand side,
+    @type    solver:         string
+    @param   solver:         the least squares solver, as recognised by L{lse_coefficients},
+    @type    out:            array
+    @param   out:            an optional array, shaped like C{Y_tau}, to write the projection into,
+    @type    diagnostics:    list
+    @param   diagnostics:    an optional list, which the solver details are appended to.
+
+    @return:    an array where the first element is the LSE M{a}, an m-array
+                or m x k-array, and the second element is the projection
+                M{Y_fit = B*a}, with the same shape as C{Y_tau}.
+    """
+    a = lse_coefficients(B, Y_tau, solver, diagnostics)
+    if out is None:
+        return [a, np.dot(B, a)]
+    np.dot(B, a, out=out)
+    return [a, out]
+
+
+def lse_coefficients(B, Y_tau, solver="auto", diagnostics=None):
+    """
+    Solves the least squares problem M{Y_tau = B*a + err} for M{a}.
+
+    The solvers are
+        - C{"cholesky"}, the Cholesky factorization of the normal equations
+          M{B^T B a = B^T Y_tau}, which is the fastest, but loses precision
+          with the square of the condition number of M{B},
+        - C{"qr"}, the economy QR factorization of M{B},
+        - C{"svd"}, the SVD based C{numpy.linalg.lstsq}, which also handles
+          rank deficient M{B},
+        - C{"auto"}, which picks Cholesky when the condition number of M{B} is
+          below C{cholesky_max_cond}, and QR otherwise.
+
+    If the Cholesky or QR factorization fails, or its triangular factor is numerically
+    singular, see L{rank_deficient}, the SVD is used instead. The condition number of
+    M{B} is only computed for C{"auto"}. The factors are solved by the triangular solves
+    of LAPACK when SciPy is installed, and by C{numpy.linalg.solve} otherwise.
+
+    @type    B:              N x m-array
+    @param   B:              the evaluated basis functions for all paths,
+    @type    Y_tau:          N-array or N x k-array
+    @param   Y_tau:          the stopped payoffs, one column per right-hand side,
+    @type    solver:         string
+    @param   solver:         one of C{"auto"}, C{"cholesky"}, C{"qr"} or C{"svd"},
+    @type    diagnostics:    list
+    @param   diagnostics:    an optional list, which a C{dict} is appended to, containing
+                             the C{solver} used, the condition number C{cond} of M{B},
+                             and the C{time} taken in seconds. For an explicit C{"cholesky"}
+                             or C{"qr"}, C{cond} is the lower bound of L{diagonal_cond}.
+
+    @return:    the LSE M{a}, an m-array or m x k-array.
+    """
+    if solver not in ("auto", "cholesky", "qr", "svd"):
+        raise ValueError("Unknown least squares solver: %s" % solver)
+
+    t0   = default_timer()
+    a    = None
+    cond = None
+    if solver in ("auto", "cholesky"):
+        G = np.dot(B.T, B)
+        if solver == "auto":
+            cond = np.sqrt(np.linalg.cond(G))
+        if solver == "cholesky" or cond < cholesky_max_cond:
+            try:
+                C = cholesky_factor(G, max(B.shape))
+                a = cholesky_solve(C, np.dot(B.T, Y_tau))
+                if cond is None:
+                    cond = diagonal_cond(C)
+                solver = "cholesky"
+            except np.linalg.LinAlgError:
+                pass
+
+    # Unless the basis is rank deficient, QR is as accurate as the SVD at any condition number,
+    # and the SVD would only truncate the solution differently
+    if a is None and solver in ("auto", "qr"):
+        Q, R = np.linalg.qr(B)
+        try:
+            if rank_deficient(R, max(B.shape)):
+                raise np.linalg.LinAlgError("Rank deficient basis")
+            a = triangular_solve(R, np.dot(Q.T, Y_tau))
+            if solver == "auto":
+                cond = np.linalg.cond(R)
+            else:
+                cond = diagonal_cond(R)
+            solver = "qr"
+        except np.linalg.LinAlgError:
+            pass
+
+    # Fall back on the SVD, if the basis is rank deficient or the factorization failed
+    if a is None:
+        a, res, rank, sv = np.linalg.lstsq(B, Y_tau, rcond=-1)
+        solver           = "svd"
+        cond             = sv[0]/sv[-1] if sv[-1] > 0 else np.inf
+
+    if diagnostics is not None:
+        diagnostics.append({"solver": solver, "cond": float(cond), "time": default_timer() - t0})
+    return a
+
+
+def cholesky_factor(G, n):
+    """
+    Factors a symmetric positive definite M{G} as M{C C^T}.
+
+    @type    G:    m x m-array
+    @param   G:    the matrix of the normal equations,
+    @type    n:    integer
+    @param   n:    the larger dimension of the basis matrix M{G} was formed from, see L{rank_deficient}.
+
+    @return:    the lower triangular factor M{C}.
+
+    @raise LinAlgError:    if M{G} is not positive definite, or M{C} is numerically singular.
+    """
+    C = np.linalg.cholesky(G)
+    if rank_deficient(C, n):
+        raise np.linalg.LinAlgError("Rank deficient basis")
+    return C
+
+
+def cholesky_solve(C, c):
+    """
+    Solves M{G a = c} for M{G = C C^T}, by a forward and a backward triangular solve.
+
+    @type    C:    m x m-array
+    @param   C:    the lower triangular Cholesky factor of M{G}, see L{cholesky_factor},
+    @type    c:    m-array or m x k-array
+    @param   c:    the right-hand side.
+
+    @return:    the solution M{a}.
+    """
+    if lapack is None:
+        return np.linalg.solve(C.T, np.linalg.solve(C, c))
+    a, info = lapack.dpotrs(C, c, lower=1)
+    if info != 0:
+        raise np.linalg.LinAlgError("Cholesky solve failed")
+    return a
+
+
+def triangular_solve(R, c):
+    """
+    Solves M{R a = c} for an upper triangular M{R}.
+
+    @type    R:    m x m-array
+    @param   R:    the upper triangular matrix,
+    @type    c:    m-array or m x k-array
+    @param   c:    the right-hand side.
+
+    @return:    the solution M{a}.
+    """
+    if lapack is None:
+        return np.linalg.solve(R, c)
+    a, info = lapack.dtrtrs(R, c, lower=0)
+    if info != 0:
+        raise np.linalg.LinAlgError("Singular triangular factor")
+    return a
+
+
+def diagonal_cond(F):
+    """
+    @type    F:    m x m-array
+    @param   F:    a triangular factor of the basis matrix, M{R} of its QR or M{C} of the Cholesky
+                   factorization of its normal equations.
+
+    @return:    the ratio of the largest to the smallest absolute diagonal entry of C{F},
+                which is a lower bound of the condition number of the basis matrix.
+    """
+    d = np.abs(F.diagonal())
+    if d.min() == 0:
+        return np.inf
+    return d.max()/d.min()
+
+
+def rank_deficient(F, n):
+    """
+    Whether a triangular factor of the basis matrix is numerically singular, by the
+    tolerance of C{numpy.linalg.matrix_rank}. This happens when the basis functions
+    are evaluated at a single point, as at time step 0, where every path starts at M{S_0}.
+    The explicit solvers would otherwise return coefficients of rounding errors.
+
+    @type    F:    m x m-array
+    @param   F:    the triangular factor, see L{diagonal_cond},
+    @type    n:    integer
+    @param   n:    the larger dimension of the basis matrix.
+
+    @return:    C{True} if the smallest absolute diagonal entry of C{F} is within rounding
+                of zero, relative to the largest.
+    """
+    d = np.abs(F.diagonal())
+    return d.min() <= d.max()*n*np.finfo(F.dtype).eps
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+precision.py
+
+The floating-point precisions of the paths, payoffs and valuations. In
+C{"single"} precision, the paths and payoffs are stored as C{float32}, which
+halves their memory and bandwidth, while the regressions of the LSE and the
+averaging over the paths are still done in C{float64}.
+"""
+
+import numpy as np
+
+
+float_types = {"double": np.float64, "single": np.float32}
+
+
+def float_type(precision):
+    """
+    @type    precision:    string
+    @param   precision:    C{"double"} or C{"single"}.
+
+    @return:    the NumPy type of the paths and payoffs in the given precision.
+    """
+    if precision not in float_types:
+        raise ValueError("Unknown precision: %s" % precision)
+    return float_types[precision]
+
+
+def precision_of(array):
+    """
+    @return:    C{"single"} if C{array} is a C{float32} array, and C{"double"} otherwise.
+    """
+    if np.asarray(array).dtype == np.float32:
+        return "single"
+    return "double"
+
+
+def index_type(L, precision):
+    """
+    The integer type of the stopping times of a valuation with M{L} time steps.
+    In single precision, the stopping times are stored as C{int16} if they fit.
+
+    @type    L:            integer
+    @param   L:            the number of time steps,
+    @type    precision:    string
+    @param   precision:    C{"double"} or C{"single"}.
+
+    @return:    C{int16} or C{int32}.
+    """
+    if precision == "single" and L <= np.iinfo(np.int16).max:
+        return np.int16
+    return np.int32
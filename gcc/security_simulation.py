@@ -7,12 +7,23 @@ Created by Daniel Eliasson on 2009-04-30.
 Copyright (c) 2009 Daniel Eliasson. All rights reserved.
 """
 
+import os
+import hashlib
+import tempfile
 import numpy as np
 import numpy.random
 import storage
+import precision as prec
+import quasi_random
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 
-def black_scholes(S0, r, volatility, T, N, L, rand_gen_state=None):
+# The bytes of paths that black_scholes_block builds at a time, which are kept in cache
+simulation_chunk_bytes = 2**20
+
+
+def black_scholes(S0, r, volatility, T, N, L, rand_gen_state=None, precision="double", antithetic="halves"):
     """
     Generates paths for M{S} in risk-neutral Black-Scholes formulation:
     M{dS = r(t)*S(t)*dt + volatility*S(t)*dW_t}
@@ -34,7 +45,12 @@ def black_scholes(S0, r, volatility, T, N, L, rand_gen_state=None):
     @param   N:                the number of paths to generate,
     @type    L:                integer
     @param   L:                the number of time steps,
-    @param   rand_gen_state:   NumPy random number generator state object.
+    @param   rand_gen_state:   NumPy random number generator state object,
+    @type    precision:        string
+    @param   precision:        C{"double"}, or C{"single"} to store the paths as C{float32},
+                               see L{gcc.precision}. The random numbers are the same,
+    @type    antithetic:       string
+    @param   antithetic:       the layout of the antithetic paths, see L{antithetic_columns}.
 
     @return:    a tuple containing a (L+1) x N-array of paths, and the
                 random number generator state used to generate the paths.
@@ -46,14 +62,225 @@ def black_scholes(S0, r, volatility, T, N, L, rand_gen_state=None):
     if N % 2 != 0:
         raise "N must be divisible by 2"
 
+    S = np.empty((L+1, N), dtype=prec.float_type(precision))
+    black_scholes_block(S0, r, volatility, dt, np.random, S, antithetic)
+    return S, rand_gen_state
+
+
+def black_scholes_scenarios(S0, r, volatility, T, N, L, rand_gen_state=None, precision="double", out=None,
+                            antithetic="halves"):
+    """
+    Generates the paths of L{black_scholes} for several scenarios of the model
+    parameters at once, e.g. a grid of volatilities and interest rates for a stress
+    test. All the scenarios are driven by the same normal random numbers, which
+    are drawn and summed to a Wiener process once, so the paths of scenario M{k}
+    are those of L{black_scholes} with the parameters of the scenario and the same
+    random number generator state, up to rounding. The paths of all scenarios are
+    then built with a few vectorised operations in place in the output.
+
+    @type    S0:               number or K-array
+    @param   S0:               the starting values of the paths,
+    @type    r:                number or K-array
+    @param   r:                the risk-free interest rates,
+    @type    volatility:       number or K-array
+    @param   volatility:       the volatilities of the underlying. The parameters are
+                               broadcast to the K scenarios,
+    @type    T:                number
+    @param   T:                the maturity time, measured in years,
+    @type    N:                integer
+    @param   N:                the number of paths to generate for each scenario,
+    @type    L:                integer
+    @param   L:                the number of time steps,
+    @param   rand_gen_state:   NumPy random number generator state object,
+    @type    precision:        string
+    @param   precision:        C{"double"}, or C{"single"} to store the paths as C{float32},
+                               see L{gcc.precision}. Ignored when C{out} is given,
+    @type    out:              K x (L+1) x N-array
+    @param   out:              an optional array to write the paths into, e.g. to reuse
+                               it for the next grid of scenarios,
+    @type    antithetic:       string
+    @param   antithetic:       the layout of the antithetic paths, see L{antithetic_columns}.
+
+    @return:    a tuple containing a K x (L+1) x N-array of paths, whose M{k}-th
+                (L+1) x N-array holds the paths of scenario M{k}, and the random
+                number generator state used to generate the paths.
+    """
+    S0, r, volatility = [np.asarray(a, dtype=np.float64) for a in np.broadcast_arrays(S0, r, volatility)]
+    S0, r, volatility = S0.reshape(-1), r.reshape(-1), volatility.reshape(-1)
+    K = S0.shape[0]
+    if out is None:
+        out = np.empty((K, L+1, N), dtype=prec.float_type(precision))
+    elif out.shape != (K, L+1, N):
+        raise ValueError("out must be a %i x %i x %i-array" % (K, L+1, N))
+
+    if rand_gen_state is not None:
+        np.random.set_state(rand_gen_state)
+    rand_gen_state = np.random.get_state()
+    dt = np.float64(T)/L
+    if N % 2 != 0:
+        raise ValueError("N must be divisible by 2")
+
+    # The Wiener process at the time steps 1, ..., L, shared by all scenarios
+    paths, antithetic_paths = antithetic_columns(N, antithetic)
     eps = np.random.normal(size=(L, N/2))
-    eps = np.hstack((eps, -eps)) # Add antithetic paths
+    W   = np.empty((L, N))
+    W[:, paths]            = eps
+    W[:, antithetic_paths] = -eps # Add antithetic paths
+    del eps
+    W *= np.sqrt(dt)
+    np.cumsum(W, 0, out=W)
 
-    S = np.vstack((S0*np.ones((1, N)), S0*np.exp(np.cumsum((r - np.power(volatility, 2)/2)*dt + volatility*np.sqrt(dt)*eps, 0))))
-    return S, rand_gen_state
+    # S_t = S0*exp(volatility*W_t + (r - volatility^2/2)*t) for all scenarios
+    t     = dt*np.arange(1, L+1)
+    drift = (r - np.power(volatility, 2)/2)[:, np.newaxis]*t[np.newaxis, :]
+    increments  = out[:, 1:, :]
+    np.multiply(volatility[:, np.newaxis, np.newaxis], W[np.newaxis, :, :], out=increments)
+    increments += drift[:, :, np.newaxis]
+    np.exp(increments, out=increments)
+    increments *= S0[:, np.newaxis, np.newaxis]
+    out[:, 0, :] = S0[:, np.newaxis]
+    return out, rand_gen_state
 
 
-def jump_diffusion(S0, r, volatility, d, eta, theta, T, N, L, rand_gen_state=None):
+def rescale(S_unit, S0, out=None):
+    """
+    Rescales normalised paths, simulated with M{S_0 = 1}, to start at C{S0}. Both
+    L{black_scholes} and L{jump_diffusion} build their paths as C{S0} times a
+    process starting at 1, so the rescaled paths are exactly those simulated
+    with C{S0} from the same random numbers. The paths of several values of
+    C{S0} can so be made from one normalised set, with common random numbers.
+
+    @type    S_unit:    (L+1) x N-array
+    @param   S_unit:    the normalised paths,
+    @type    S0:        number
+    @param   S0:        the starting value of the rescaled paths,
+    @type    out:       (L+1) x N-array
+    @param   out:       an optional array to write the rescaled paths into, which
+                        may be C{S_unit} itself.
+
+    @return:    the (L+1) x N-array of rescaled paths.
+    """
+    return np.multiply(S_unit, S0, out=out)
+
+
+def black_scholes_qmc(S0, r, volatility, T, N, L, seed, replicate=0, sobol_dimensions=None,
+                      scramble=True, precision="double"):
+    """
+    Generates paths like L{black_scholes}, from a Sobol sequence rather than
+    pseudo-random numbers, see L{gcc.quasi_random}. The Wiener paths are built
+    by the Brownian bridge, which puts the end points and the coarse shape of the
+    paths in the leading dimensions of the sequence. The dimensions beyond
+    C{sobol_dimensions}, which only refine the paths between close time steps,
+    are pseudo-random.
+
+    Each replicate of a seed has its own, independent randomisation of the
+    sequence, so the spread of the prices of several replicates estimates the
+    error of their mean, see L{gcc.valuation.value_rqmc}.
+
+    @param   S0, r, volatility, T, N, L:    as for L{black_scholes}, although the number of
+                                            paths M{N} is best a power of 2, and needn't be even,
+    @type    seed:                integer
+    @param   seed:                the seed, between 0 and M{2^32-1},
+    @type    replicate:           integer
+    @param   replicate:           the number of the replicate, which is randomised by the
+                                  C{RandomState} of L{block_random_state} for the seed and replicate,
+    @type    sobol_dimensions:    integer
+    @param   sobol_dimensions:    the number of leading dimensions from the Sobol sequence;
+                                  M{L}, or C{gcc.quasi_random.max_dimension} if that is less, by default,
+    @type    scramble:            boolean
+    @param   scramble:            whether to scramble and shift the Sobol sequence. Without it,
+                                  the replicates differ in the pseudo-random dimensions only,
+    @type    precision:           string
+    @param   precision:           C{"double"} or C{"single"}, as for L{black_scholes}.
+
+    @return:    a tuple containing a (L+1) x N-array of paths, and a C{dict} of the
+                C{seed}, C{replicate} and C{sobol_dimensions}, which reproduce the paths.
+    """
+    dt = np.float64(T)/L
+    if sobol_dimensions is None:
+        sobol_dimensions = min(L, quasi_random.max_dimension)
+    random_state = block_random_state(seed, replicate)
+
+    z = np.empty((L, N))
+    quasi_random.sobol_normals(N, sobol_dimensions, random_state if scramble else None, z[:sobol_dimensions])
+    z[sobol_dimensions:] = random_state.normal(size=(L - sobol_dimensions, N))
+
+    S = np.empty((L+1, N), dtype=prec.float_type(precision))
+    quasi_random.brownian_bridge(z, dt, S)
+    del z
+    S *= volatility
+    S += (r - np.power(volatility, 2)/2)*dt*np.arange(L+1)[:, np.newaxis]
+    np.exp(S, out=S)
+    S *= S0
+    return S, {"seed": seed, "replicate": replicate, "sobol_dimensions": sobol_dimensions}
+
+
+def black_scholes_block(S0, r, volatility, dt, random_state, out, antithetic="halves"):
+    """
+    Generates a block of paths for L{black_scholes}, half of them antithetic.
+
+    @type    S0:              number
+    @param   S0:              the starting value of the generated paths,
+    @type    r:               number
+    @param   r:               the risk-free interest rate,
+    @type    volatility:      number
+    @param   volatility:      the volatility of the underlying,
+    @type    dt:              number
+    @param   dt:              the size of a time step,
+    @param   random_state:    a C{numpy.random.RandomState}, or C{numpy.random} itself,
+    @type    out:             (L+1) x n-array
+    @param   out:             the array to write the n paths into, where n is even,
+    @type    antithetic:      string
+    @param   antithetic:      the layout of the antithetic paths, see L{antithetic_columns}.
+
+    @return:    nothing
+    """
+    L = out.shape[0] - 1
+    n = out.shape[1]
+    paths, antithetic_paths = antithetic_columns(n, antithetic)
+    chunk_rows = simulation_chunk_rows(n)
+
+    # The paths are built in place a chunk of time steps at a time, drawing the normal
+    # random numbers of each chunk in turn from the same stream, so the only temporary
+    # is the random numbers of a chunk. The last time step of a chunk is kept as a
+    # logarithm until the next chunk has been summed onto it.
+    for start in range(1, L+1, chunk_rows):
+        stop       = min(start + chunk_rows, L+1)
+        eps        = random_state.normal(size=(stop - start, n/2))
+        increments = out[start:stop, :]
+        increments[:, paths] = eps
+        np.negative(eps, out=increments[:, antithetic_paths]) # Add antithetic paths
+        del eps
+
+        increments *= volatility*np.sqrt(dt)
+        increments += (r - np.power(volatility, 2)/2)*dt
+        if start > 1:
+            increments[0, :] += out[start-1, :]
+        if stop - start > 1:
+            np.cumsum(increments, 0, out=increments)
+        exponentiate(out[max(start-1, 1):stop-1, :], S0)
+    exponentiate(out[L:, :], S0)
+    out[0, :] = S0
+
+
+def exponentiate(log_S, S0):
+    """
+    Turns the logarithms of paths relative to M{S_0} into the paths, in place.
+    """
+    np.exp(log_S, out=log_S)
+    log_S *= S0
+
+
+def simulation_chunk_rows(n):
+    """
+    The number of time steps of n paths that L{black_scholes_block} builds at a time;
+    as many as take up about C{simulation_chunk_bytes}, and at least one.
+    """
+    return max(1, simulation_chunk_bytes//(8*n))
+
+
+def jump_diffusion(S0, r, volatility, d, eta, theta, T, N, L, rand_gen_state=None, precision="double",
+                   antithetic="halves"):
     """
     Generates paths for M{S} in a risk-neutral jump-diffusion with
     non-negative, exponentially distributed jumps, and continuous
@@ -82,7 +309,13 @@ def jump_diffusion(S0, r, volatility, d, eta, theta, T, N, L, rand_gen_state=Non
     @param   N:                the number of paths to generate,
     @type    L:                integer
     @param   L:                the number of time steps,
-    @param   rand_gen_state:   NumPy random number generator state object.
+    @param   rand_gen_state:   NumPy random number generator state object,
+    @type    precision:        string
+    @param   precision:        C{"double"}, or C{"single"} to store the paths as C{float32},
+                               see L{gcc.precision}. The random numbers are the same,
+    @type    antithetic:       string
+    @param   antithetic:       the layout of the paths with antithetic Wiener processes,
+                               see L{antithetic_columns}.
 
     @return:    a tuple containing a (L+1) x N-array of paths, and the
                 random number generator state used to generate the paths.
@@ -94,24 +327,503 @@ def jump_diffusion(S0, r, volatility, d, eta, theta, T, N, L, rand_gen_state=Non
     if N % 2 != 0:
         raise "N must be divisible by 2"
 
+    S = np.empty((L+1, N), dtype=prec.float_type(precision))
+    jump_diffusion_block(S0, r, volatility, d, eta, theta, dt, np.random, S, antithetic)
+    return S, rand_gen_state
+
+
+def jump_diffusion_block(S0, r, volatility, d, eta, theta, dt, random_state, out, antithetic="halves"):
+    """
+    Generates a block of paths for L{jump_diffusion}. The Wiener process of half
+    of them is antithetic.
+
+    @param   S0, r, volatility, d, eta, theta:    as for L{jump_diffusion},
+    @type    dt:              number
+    @param   dt:              the size of a time step,
+    @param   random_state:    a C{numpy.random.RandomState}, or C{numpy.random} itself,
+    @type    out:             (L+1) x n-array
+    @param   out:             the array to write the n paths into, where n is even,
+    @type    antithetic:      string
+    @param   antithetic:      the layout of the antithetic paths, see L{antithetic_columns}.
+
+    @return:    nothing
+    """
+    L = out.shape[0] - 1
+    n = out.shape[1]
+    paths, antithetic_paths = antithetic_columns(n, antithetic)
+
     # Simulate Wiener process diffusion and drift
-    eps = np.random.normal(size=(L, N/2))
-    eps = np.hstack((eps, -eps)) # Add antithetic paths
+    normals = random_state.normal(size=(L, n/2))
+    eps     = np.empty((L, n))
+    eps[:, paths]            = normals
+    eps[:, antithetic_paths] = -normals # Add antithetic paths
     mu_and_W = np.cumsum((r - d - np.power(volatility, 2)/2 + eta/(1-theta))*dt + volatility*np.sqrt(dt)*eps, 0)
 
-    # Simulate the jump process pathwise
-    beta_times = 1.0/eta
+    # Simulate the jump process for all paths and time steps at once. The number of
+    # jumps in each time step is Poisson distributed, and the sum of k exponential
+    # jump sizes is Gamma distributed with shape k.
     beta_jumps = 1.0/theta
-    J = np.zeros((L, N))
-    for n in range(N):
-        cum_jumps = np.random.exponential(beta_times)
-        for j in range(L):
-            t = (j+1)*dt
-            J[j, n] = np.copy(J[j-1, n])
-            while t > cum_jumps:
-                J[j, n] += np.random.exponential(beta_jumps)
-                cum_jumps += np.random.exponential(beta_times)
+    n_jumps    = random_state.poisson(eta*dt, size=(L, n))
+    jumps      = np.zeros((L, n))
+    has_jumps  = n_jumps > 0
+    jumps[has_jumps] = random_state.gamma(n_jumps[has_jumps], beta_jumps)
+    J = np.cumsum(jumps, 0)
 
     # Build the process S
-    S = np.vstack((S0*np.ones((1, N)), S0*np.exp(mu_and_W + J)))
-    return S, rand_gen_state
+    out[0, :]  = S0
+    out[1:, :] = S0*np.exp(mu_and_W + J)
+
+
+def antithetic_columns(n, antithetic="halves"):
+    """
+    The columns of a block of n paths that hold the paths and their antithetic paths.
+    With C{"halves"}, the antithetic path of path M{i} is path M{i + n/2}. With
+    C{"adjacent"}, the paths are in pairs, and the antithetic path of path M{2i}
+    is path M{2i + 1}, so that the first M{n'} paths for any even M{n'} hold whole
+    pairs, see L{nested_paths}.
+
+    @type    n:             integer
+    @param   n:             the even number of paths,
+    @type    antithetic:    string
+    @param   antithetic:    C{"halves"} or C{"adjacent"}.
+
+    @return:    a tuple of the slices of the columns of the paths and of their antithetic paths.
+    """
+    if antithetic == "halves":
+        return slice(0, n/2), slice(n/2, n)
+    if antithetic == "adjacent":
+        return slice(0, n, 2), slice(1, n, 2)
+    raise ValueError("Unknown antithetic layout: %s" % antithetic)
+
+
+def nested_paths(S, N, L, antithetic="halves"):
+    """
+    Derives a path set of M{N} paths with M{L} time steps from a finer and larger one,
+    so that a study of several M{N} and M{L} simulates only the paths of the largest
+    M{N} and finest M{L}, and all its results are on the same paths.
+
+    The paths of L{black_scholes} and L{black_scholes_blocks} are exact at the time
+    steps, so a path over the coarser time steps, whose Brownian increments are the
+    sums of the finer increments between them, is the finer path at every M{L_S/L}-th
+    time step. The same holds for L{jump_diffusion}. The M{N} paths hold whole
+    antithetic pairs of C{S}, according to its layout:
+        - C{"halves"}, the default layout of L{black_scholes} and L{jump_diffusion}:
+          the first M{N/2} paths of each half of C{S}. These are copied.
+        - C{"adjacent"}: the first M{N} paths of C{S}, as a view of it without copying.
+        - C{None}: the first M{N} paths of C{S} too, for paths whose first M{N} hold
+          whole pairs as they are; those of L{simulate_in_blocks} when M{N} is a
+          multiple of the block size, in which case they are exactly the first M{N}
+          paths of any larger number of paths simulated by it.
+
+    @type    S:             (L_S+1) x N_S-array
+    @param   S:             the finest and largest paths,
+    @type    N:             integer
+    @param   N:             the even number of paths, at most M{N_S},
+    @type    L:             integer
+    @param   L:             the number of time steps, which must divide M{L_S},
+    @type    antithetic:    string
+    @param   antithetic:    the layout of the antithetic pairs of C{S}, see L{antithetic_columns};
+                            C{"halves"}, C{"adjacent"} or C{None}.
+
+    @return:    an (L+1) x N-array of the paths; a view of C{S}, except with C{"halves"}.
+    """
+    L_S = S.shape[0] - 1
+    N_S = S.shape[1]
+    if L_S % L != 0:
+        raise ValueError("L = %i doesn't divide the %i time steps of the paths" % (L, L_S))
+    if N % 2 != 0 or N > N_S:
+        raise ValueError("N must be even and at most %i" % N_S)
+    if antithetic == "halves":
+        if N_S % 2 != 0:
+            raise ValueError("The antithetic halves of %i paths are uneven" % N_S)
+        return S[::L_S/L, np.r_[0:N/2, N_S/2:N_S/2 + N/2]]
+    if antithetic in ("adjacent", None):
+        return S[::L_S/L, :N]
+    raise ValueError("Unknown antithetic layout: %s" % antithetic)
+
+
+def black_scholes_blocks(S0, r, volatility, T, N, L, seed, block_size=1000, n_workers=1, out=None,
+                         precision="double"):
+    """
+    Generates paths like L{black_scholes}, in blocks with independent random number
+    streams, see L{simulate_in_blocks}.
+
+    @param   S0, r, volatility, T, N, L:    as for L{black_scholes},
+    @param   seed, block_size, n_workers, out, precision:    as for L{simulate_in_blocks}.
+
+    @return:    a tuple containing a (L+1) x N-array of paths, and a C{dict} of the
+                C{seed} and C{block_size}, which reproduce the paths.
+    """
+    fill_block = black_scholes_block_filler(S0, r, volatility, T, L)
+    return simulate_in_blocks(fill_block, N, L, seed, block_size, n_workers, out, precision)
+
+
+def jump_diffusion_blocks(S0, r, volatility, d, eta, theta, T, N, L, seed, block_size=1000, n_workers=1, out=None,
+                          precision="double"):
+    """
+    Generates paths like L{jump_diffusion}, in blocks with independent random number
+    streams, see L{simulate_in_blocks}.
+
+    @param   S0, r, volatility, d, eta, theta, T, N, L:    as for L{jump_diffusion},
+    @param   seed, block_size, n_workers, out, precision:    as for L{simulate_in_blocks}.
+
+    @return:    a tuple containing a (L+1) x N-array of paths, and a C{dict} of the
+                C{seed} and C{block_size}, which reproduce the paths.
+    """
+    fill_block = jump_diffusion_block_filler(S0, r, volatility, d, eta, theta, T, L)
+    return simulate_in_blocks(fill_block, N, L, seed, block_size, n_workers, out, precision)
+
+
+def black_scholes_block_filler(S0, r, volatility, T, L):
+    """
+    @param   S0, r, volatility, T, L:    as for L{black_scholes}.
+
+    @return:    a function taking an (L+1) x n-array and a C{RandomState}, which
+                writes n paths of L{black_scholes} into the array, as expected
+                by L{simulate_in_blocks}.
+    """
+    dt = np.float64(T)/L
+    def fill_block(block, random_state):
+        black_scholes_block(S0, r, volatility, dt, random_state, block)
+    return fill_block
+
+
+def jump_diffusion_block_filler(S0, r, volatility, d, eta, theta, T, L):
+    """
+    @param   S0, r, volatility, d, eta, theta, T, L:    as for L{jump_diffusion}.
+
+    @return:    a function taking an (L+1) x n-array and a C{RandomState}, which
+                writes n paths of L{jump_diffusion} into the array, as expected
+                by L{simulate_in_blocks}.
+    """
+    dt = np.float64(T)/L
+    def fill_block(block, random_state):
+        jump_diffusion_block(S0, r, volatility, d, eta, theta, dt, random_state, block)
+    return fill_block
+
+
+def simulate_in_blocks(fill_block, N, L, seed, block_size=1000, n_workers=1, out=None, precision="double"):
+    """
+    Generates M{N} paths in consecutive blocks of C{block_size} paths. Each block
+    has its own random number stream, a C{numpy.random.RandomState} seeded with
+    C{[seed, b]} for the block number M{b}. The paths depend on C{seed} and
+    C{block_size} only, so they are the same for any number of workers, and
+    the seed and block size can be stored with the results in place of the
+    state of the global random number generator.
+
+    @type    fill_block:    function
+    @param   fill_block:    a function taking an (L+1) x n-array and a C{RandomState},
+                            which writes n paths into the array,
+    @type    N:             integer
+    @param   N:             the number of paths to generate,
+    @type    L:             integer
+    @param   L:             the number of time steps,
+    @type    seed:          integer
+    @param   seed:          the seed, between 0 and M{2^32-1},
+    @type    block_size:    integer
+    @param   block_size:    the number of paths in each block, which must be even,
+                            as must M{N},
+    @type    n_workers:     integer
+    @param   n_workers:     the number of threads filling the blocks,
+    @type    out:           (L+1) x N-array
+    @param   out:           an optional array to write the paths into,
+    @type    precision:     string
+    @param   precision:     C{"double"}, or C{"single"} to store the paths as C{float32},
+                            see L{gcc.precision}, when no C{out} is given. The random
+                            numbers are the same.
+
+    @return:    a tuple containing a (L+1) x N-array of paths, and a C{dict} of the
+                C{seed} and C{block_size}, which reproduce the paths.
+    """
+    if N % 2 != 0 or block_size % 2 != 0:
+        raise ValueError("N and block_size must be divisible by 2")
+    if out is None:
+        out = np.empty((L+1, N), dtype=prec.float_type(precision))
+    elif out.shape != (L+1, N):
+        raise ValueError("out must be a %i x %i-array" % (L+1, N))
+
+    blocks = path_blocks(N, block_size)
+    def fill(b):
+        start, stop = blocks[b]
+        fill_block(out[:, start:stop], block_random_state(seed, b))
+
+    if n_workers > 1:
+        pool = ThreadPool(n_workers)
+        try:
+            pool.map(fill, range(len(blocks)))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for b in range(len(blocks)):
+            fill(b)
+
+    return out, {"seed": seed, "block_size": block_size}
+
+
+def path_blocks(N, block_size):
+    """
+    Splits M{N} paths into the blocks of L{simulate_in_blocks}.
+
+    @return:    a list of C{(start, stop)} tuples, one for each block.
+    """
+    return [(start, min(start + block_size, N)) for start in range(0, N, block_size)]
+
+
+def block_random_state(seed, b):
+    """
+    @return:    the random number generator of block M{b} in L{simulate_in_blocks}.
+    """
+    return np.random.RandomState([seed, b])
+
+
+def black_scholes_to_file(filename, S0, r, volatility, T, N, L, seed, block_size=1000, n_workers=1,
+                          precision="double"):
+    """
+    Generates paths like L{black_scholes_blocks}, directly into a path store on disk,
+    see L{create_path_store}.
+
+    @type    filename:    string
+    @param   filename:    the C{.npy} file of the path store,
+    @param   S0, r, volatility, T, N, L:    as for L{black_scholes},
+    @param   seed, block_size, n_workers, precision:    as for L{simulate_in_blocks}.
+
+    @return:    a tuple containing the (L+1) x N-array of paths, memory mapped from
+                the file, and the header of the store.
+    """
+    header = {"model": "black_scholes", "S0": float(S0), "r": float(r), "volatility": float(volatility),
+              "T": float(T), "N": int(N), "L": int(L), "seed": int(seed), "block_size": int(block_size)}
+    S = create_path_store(filename, N, L, header, precision)
+    simulate_in_blocks(black_scholes_block_filler(S0, r, volatility, T, L), N, L, seed, block_size, n_workers, S)
+    S.flush()
+    return S, header
+
+
+def jump_diffusion_to_file(filename, S0, r, volatility, d, eta, theta, T, N, L, seed, block_size=1000, n_workers=1,
+                           precision="double"):
+    """
+    Generates paths like L{jump_diffusion_blocks}, directly into a path store on disk,
+    see L{create_path_store}.
+
+    @type    filename:    string
+    @param   filename:    the C{.npy} file of the path store,
+    @param   S0, r, volatility, d, eta, theta, T, N, L:    as for L{jump_diffusion},
+    @param   seed, block_size, n_workers, precision:    as for L{simulate_in_blocks}.
+
+    @return:    a tuple containing the (L+1) x N-array of paths, memory mapped from
+                the file, and the header of the store.
+    """
+    header = {"model": "jump_diffusion", "S0": float(S0), "r": float(r), "volatility": float(volatility),
+              "d": float(d), "eta": float(eta), "theta": float(theta), "T": float(T), "N": int(N), "L": int(L),
+              "seed": int(seed), "block_size": int(block_size)}
+    S = create_path_store(filename, N, L, header, precision)
+    simulate_in_blocks(jump_diffusion_block_filler(S0, r, volatility, d, eta, theta, T, L),
+                       N, L, seed, block_size, n_workers, S)
+    S.flush()
+    return S, header
+
+
+def create_path_store(filename, N, L, header, precision="double"):
+    """
+    Creates a path store on disk; an (L+1) x N-array of paths in a C{.npy} file,
+    and a header with the model parameters and seed of the paths in a JSON file
+    next to it, see L{path_store_header_file}. The paths are written through a
+    memory map, so they are held by the page cache of the operating system
+    rather than in memory.
+
+    @type    filename:    string
+    @param   filename:    the C{.npy} file of the path store,
+    @type    N:           integer
+    @param   N:           the number of paths,
+    @type    L:           integer
+    @param   L:           the number of time steps,
+    @type    header:      C{dict}
+    @param   header:      the model parameters and seed of the paths, which C{precision}
+                          is added to,
+    @type    precision:   string
+    @param   precision:   C{"double"}, or C{"single"} to store the paths as C{float32},
+                          see L{gcc.precision}.
+
+    @return:    the (L+1) x N-array memory mapped from the file, for writing the paths into.
+    """
+    S = np.lib.format.open_memmap(filename, mode="w+", dtype=prec.float_type(precision), shape=(L+1, N))
+    header["precision"] = precision
+    storage.json_to_file(header, path_store_header_file(filename))
+    return S
+
+
+def open_path_store(filename, mode="r"):
+    """
+    Opens a path store created by L{create_path_store}. The paths can be passed
+    to L{gcc.valuation.value_gcc} and the claims in L{gcc.claims} as they are.
+
+    @type    filename:    string
+    @param   filename:    the C{.npy} file of the path store,
+    @type    mode:        string
+    @param   mode:        the mode of the memory map, C{"r"} for reading only by default.
+
+    @return:    a tuple containing the (L+1) x N-array of paths, memory mapped from
+                the file, and the header of the store.
+    """
+    S      = np.load(filename, mmap_mode=mode)
+    header = storage.json_from_file(path_store_header_file(filename))
+    return S, header
+
+
+def path_store_header_file(filename):
+    """
+    @return:    the name of the JSON file with the header of the path store in C{filename}.
+    """
+    return filename + ".json"
+
+
+class PathCache(object):
+    """
+    A cache of simulated paths, keyed by the model, its parameters and the seed,
+    so that valuations of several claims, or with several numbers of basis
+    functions, on the same paths simulate them only once. The paths are seeded
+    as in L{simulate_in_blocks}, so the same key always gives the same paths.
+
+    The cache has two tiers. The paths are kept in memory, up to C{max_bytes},
+    and the least recently used ones are evicted beyond it. With a C{directory},
+    the paths are also written to C{.npy} files in it as they are simulated, and
+    paths that aren't in memory are read from there, also by other processes and
+    later runs.
+
+    The cached arrays are read-only, since they are shared by all the callers.
+    The counters C{hits}, C{disk_hits}, C{misses} and C{evictions} count the
+    lookups answered from memory, answered from disk and simulated, and the
+    arrays evicted from memory.
+    """
+
+    def __init__(self, max_bytes=2**30, directory=None):
+        """
+        @type    max_bytes:    integer
+        @param   max_bytes:    the most bytes of paths to keep in memory,
+        @type    directory:    string
+        @param   directory:    an optional directory to write the paths to, and read
+                               them from when they aren't in memory.
+        """
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.entries   = OrderedDict()
+        self.nbytes    = 0
+        self.hits      = 0
+        self.disk_hits = 0
+        self.misses    = 0
+        self.evictions = 0
+        if directory is not None:
+            storage.ensure_dir_exists(directory)
+
+    def black_scholes(self, S0, r, volatility, T, N, L, seed, block_size=1000, n_workers=1):
+        """
+        Looks up or generates paths like L{black_scholes_blocks}.
+
+        @param   S0, r, volatility, T, N, L, seed, block_size, n_workers:    as for L{black_scholes_blocks}.
+
+        @return:    a tuple containing the read-only (L+1) x N-array of paths, and a
+                    C{dict} of the C{seed} and C{block_size}, which reproduce the paths.
+        """
+        key = ("black_scholes", float(S0), float(r), float(volatility), float(T), int(N), int(L),
+               int(seed), int(block_size))
+        S = self.get(key, lambda: black_scholes_blocks(S0, r, volatility, T, N, L, seed, block_size, n_workers)[0])
+        return S, {"seed": seed, "block_size": block_size}
+
+    def jump_diffusion(self, S0, r, volatility, d, eta, theta, T, N, L, seed, block_size=1000, n_workers=1):
+        """
+        Looks up or generates paths like L{jump_diffusion_blocks}.
+
+        @param   S0, r, volatility, d, eta, theta, T, N, L, seed, block_size, n_workers:
+                 as for L{jump_diffusion_blocks}.
+
+        @return:    a tuple containing the read-only (L+1) x N-array of paths, and a
+                    C{dict} of the C{seed} and C{block_size}, which reproduce the paths.
+        """
+        key = ("jump_diffusion", float(S0), float(r), float(volatility), float(d), float(eta), float(theta),
+               float(T), int(N), int(L), int(seed), int(block_size))
+        S = self.get(key, lambda: jump_diffusion_blocks(S0, r, volatility, d, eta, theta, T, N, L, seed,
+                                                        block_size, n_workers)[0])
+        return S, {"seed": seed, "block_size": block_size}
+
+    def get(self, key, simulate):
+        """
+        Looks up the paths of a key, in memory and then on disk, and simulates
+        them if they are in neither.
+
+        @type    key:         tuple
+        @param   key:         the model, its parameters and the seed of the paths,
+        @type    simulate:    function
+        @param   simulate:    a function without arguments returning the paths of the key.
+
+        @return:    the read-only array of paths.
+        """
+        if key in self.entries:
+            self.hits += 1
+            S = self.entries.pop(key)
+            self.entries[key] = S
+            return S
+
+        filename = self.filename(key)
+        if filename is not None and os.path.exists(filename):
+            self.disk_hits += 1
+            S = np.load(filename)
+        else:
+            self.misses += 1
+            S = simulate()
+            if filename is not None:
+                self.write(filename, S)
+
+        S.flags.writeable = False
+        self.insert(key, S)
+        return S
+
+    def insert(self, key, S):
+        """
+        Keeps the paths of a key in memory, evicting the least recently used
+        paths beyond C{max_bytes}. Paths larger than C{max_bytes} aren't kept.
+        """
+        if S.nbytes > self.max_bytes:
+            return
+        self.entries[key] = S
+        self.nbytes      += S.nbytes
+        while self.nbytes > self.max_bytes:
+            evicted_key, evicted = self.entries.popitem(last=False)
+            self.nbytes    -= evicted.nbytes
+            self.evictions += 1
+
+    def filename(self, key):
+        """
+        @return:    the C{.npy} file of the paths of a key in C{directory}, or C{None}
+                    without a directory.
+        """
+        if self.directory is None:
+            return None
+        return os.path.join(self.directory, hashlib.sha1(repr(key)).hexdigest() + ".npy")
+
+    def write(self, filename, S):
+        """
+        Writes paths to a temporary file next to C{filename}, and renames it into place,
+        so that other processes never read a partly written file.
+        """
+        handle, temporary = tempfile.mkstemp(suffix=".npy", dir=self.directory)
+        try:
+            with os.fdopen(handle, "wb") as f:
+                np.save(f, S)
+            os.rename(temporary, filename)
+        except:
+            os.remove(temporary)
+            raise
+
+    def counters(self):
+        """
+        @return:    a C{dict} of the counters, and of the number of arrays and bytes in memory.
+        """
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "evictions": self.evictions, "entries": len(self.entries), "nbytes": self.nbytes}
+
+    def clear(self):
+        """
+        Drops the paths held in memory. The files in C{directory} are kept.
+        """
+        self.entries.clear()
+        self.nbytes = 0
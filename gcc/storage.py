@@ -83,7 +83,9 @@ def clean_valuation(valuation):
     """
     Removes the stuff that typically gets left in the
     valuation dictionary, but shouldn't be saved to disk:
-        - The S, X, and Y arrays.
+        - The S, X, and Y arrays,
+        - The sigma and tau stopping strategies,
+        - The R_sigma_tau stopped payoffs.
 
     @type    valuation:    C{dict}
     @param   valuation:    a valuation output.
@@ -96,6 +98,12 @@ def clean_valuation(valuation):
         del valuation["X"]
     if "Y" in valuation:
         del valuation["Y"]
+    if "sigma" in valuation:
+        del valuation["sigma"]
+    if "tau" in valuation:
+        del valuation["tau"]
+    if "R_sigma_tau" in valuation:
+        del valuation["R_sigma_tau"]
     return valuation
 
 
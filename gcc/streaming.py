@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+streaming.py
+
+Values a GCC on more paths than fit in memory at once, by simulating the
+paths in blocks and pricing each block as soon as it has been simulated.
+"""
+
+import os
+import tempfile
+import numpy as np
+from datetime import datetime
+import kernels
+import polynomials as poly
+import precision as prec
+import security_simulation
+import valuation
+
+
+def value_streaming(fill_block, payoffs, r, T, N, L, seed, block_size=10000, **params):
+    """
+    Values a GCC on M{N} paths, which are simulated and priced in blocks of
+    C{block_size} paths, so that only a few blocks are held in memory at a time.
+    The blocks are those of L{gcc.security_simulation.simulate_in_blocks} for the
+    same C{seed} and C{block_size}.
+
+    Without the LSE, each block is priced by itself, and the stopped payoffs of the
+    blocks are combined by L{RunningMoments}. With the LSE, the backward induction
+    needs the stopped payoffs of every path at each time step. The blocks are then
+    simulated once into a temporary path store on disk, see L{TemporaryStore}, and
+    L{estimate_coefficients} runs the backward induction on all of them, reading one
+    block at a time and accumulating the regression of each time step across the
+    blocks. Only the stopped payoffs, M{N} numbers, are held in memory for all paths.
+
+    If C{regression_blocks} is set, the regressions are instead run on the first
+    C{regression_blocks} blocks only, held in memory together, and the remaining
+    blocks are priced out of sample with the coefficients of those regressions.
+    This is an approximation to the LSE price on all the paths, which needs no
+    disk, and whose price is biased low rather than high.
+
+    @type        fill_block:          function
+    @param       fill_block:          a function writing paths into a block, as expected by
+                                      L{gcc.security_simulation.simulate_in_blocks}, e.g. from
+                                      L{gcc.security_simulation.black_scholes_block_filler},
+    @type        payoffs:             function
+    @param       payoffs:             a function taking an (L+1) x n-array of paths, and returning
+                                      a tuple of the (L+1) x n-arrays C{X} and C{Y}; e.g. the
+                                      C{payoffs} function of a claim in L{gcc.claims} with its
+                                      parameters bound,
+    @type        r:                   number
+    @param       r:                   the risk-free interest rate,
+    @type        T:                   number
+    @param       T:                   the maturity time, measured in years,
+    @type        N:                   integer
+    @param       N:                   the number of paths,
+    @type        L:                   integer
+    @param       L:                   the number of time steps,
+    @type        seed:                integer
+    @param       seed:                the seed of the paths,
+    @type        block_size:          integer
+    @param       block_size:          the number of paths in each block,
+    @param       params:              optional parameters, as for L{gcc.valuation.value_single_threaded},
+    @type        precision:           string
+    @keyword     precision:           C{"double"} or C{"single"}, the precision of the paths and
+                                      payoffs, see L{gcc.precision}. C{"double"} by default,
+    @type        regression_blocks:   integer
+    @keyword     regression_blocks:   the number of blocks that the LSE regressions are run on, if
+                                      they are not to be run on all the blocks. It must leave at
+                                      least one block to price,
+    @type        store_dir:           string
+    @keyword     store_dir:           the directory of the temporary path store of the LSE,
+                                      defaulting to the temporary directory.
+
+    @note:    The price and variance are those of L{gcc.valuation.value_single_threaded}
+              on the same paths, up to floating-point differences, unless
+              C{regression_blocks} is set.
+
+    @return:  a C{dict} object containing all the input parameters except the functions,
+              as well as:
+                  - C{V}, the option price,
+                  - C{var}, the Monte-Carlo variance
+                  - C{dev}, the square root of var,
+                  - C{N_priced}, the number of paths that the price is averaged over,
+                    which is less than M{N} if C{regression_blocks} is set,
+                  - C{dt}, the size of a timestep, equal to T/L
+                  - C{time}, the running time of the option pricing,
+                  - C{lse_diagnostics}, if C{lse_diagnostics} was set.
+    """
+    t0 = datetime.now()
+    r  = np.float64(r)
+    T  = np.float64(T)
+    dt = T/L
+
+    lse_opts  = valuation.lse_options(params)
+    backend   = kernels.resolve_backend(params.get("backend", "auto"))
+    precision = params.get("precision", "double")
+    dtype     = prec.float_type(precision)
+    blocks    = security_simulation.path_blocks(N, block_size)
+
+    workspaces = {}
+    def workspace(n):
+        if n not in workspaces:
+            workspaces[n] = valuation.ValuationWorkspace(n, L, lse_opts.get("m"), dtype)
+        return workspaces[n]
+
+    def simulate(b, S=None):
+        start, stop = blocks[b]
+        if S is None:
+            S = np.empty((L+1, stop - start), dtype)
+        fill_block(S, security_simulation.block_random_state(seed, b))
+        X, Y = payoffs(S)
+        return S, X, Y, workspace(stop - start)
+
+    discount  = valuation.discount_factors(r, dt, L)
+    R_moments = RunningMoments()
+    V_moments = RunningMoments()
+    def add_block(X, Y, R_sigma_tau):
+        # The price of each path, as in gcc.valuation.average_stopped_payoffs
+        R_moments.add(R_sigma_tau)
+        V_moments.add(np.minimum(X[0, 0], np.maximum(Y[0, 0], R_sigma_tau)))
+
+    if "m" in lse_opts and "regression_blocks" in params:
+        # The regressions on the first blocks, which are then left out of the price
+        n_regression = params["regression_blocks"]
+        if not 0 < n_regression < len(blocks):
+            raise ValueError("regression_blocks must be positive and leave at least one block to price")
+        coefficients, stopped_payoffs = estimate_coefficients([simulate(b) for b in range(n_regression)],
+                                                              lse_opts, discount)
+        del stopped_payoffs
+
+        for b in range(n_regression, len(blocks)):
+            S, X, Y, workspace_b = simulate(b)
+            add_block(X, Y, stopped_payoffs_from_coefficients(S, X, Y, coefficients, lse_opts, discount,
+                                                              workspace_b))
+            if b == n_regression:
+                X_0, Y_0 = X[0, 0], Y[0, 0]
+    elif "m" in lse_opts:
+        with TemporaryStore(N, L, dtype, params.get("store_dir")) as (S_all, X_all, Y_all):
+            regression = []
+            for b, (start, stop) in enumerate(blocks):
+                S, X, Y, workspace_b = simulate(b, S_all[:, start:stop])
+                X_all[:, start:stop] = X
+                Y_all[:, start:stop] = Y
+                regression.append((S, X_all[:, start:stop], Y_all[:, start:stop], workspace_b))
+
+            coefficients, stopped_payoffs = estimate_coefficients(regression, lse_opts, discount)
+            for (S, X, Y, workspace_b), R_sigma_tau in zip(regression, stopped_payoffs):
+                add_block(X, Y, R_sigma_tau)
+            X_0, Y_0 = X_all[0, 0], Y_all[0, 0]
+    else:
+        for b in range(len(blocks)):
+            S, X, Y, workspace_b = simulate(b)
+            add_block(X, Y, valuation.calculate_stopped_payoffs(S, X, Y, lse_opts, discount, workspace_b, backend))
+            if b == 0:
+                X_0, Y_0 = X[0, 0], Y[0, 0]
+
+    V   = min(X_0, max(Y_0, R_moments.mean))
+    var = V_moments.sum_of_squares(V)/(V_moments.n-1)
+    dev = np.sqrt(var)
+    t1  = datetime.now()
+
+    if "diagnostics" in lse_opts:
+        params["lse_diagnostics"] = lse_opts["diagnostics"]
+
+    params.update({
+        "r":          r,
+        "T":          T,
+        "N":          N,
+        "N_priced":   V_moments.n,
+        "L":          L,
+        "seed":       seed,
+        "block_size": block_size,
+        "precision":  precision,
+        "V":          V,
+        "var":        var,
+        "dev":        dev,
+        "dt":         dt,
+        "backend":    backend,
+        "time":       str(t1 - t0),
+    })
+    return params
+
+
+def estimate_coefficients(regression, lse_opts, discount):
+    """
+    Runs the backward induction of the LSE method on several blocks of paths at once,
+    which may be memory mapped from disk, see L{TemporaryStore}.
+    At each time step, the regression on the in-the-money paths of each block is
+    reduced to an m x m triangular factor and a right-hand side, like in
+    L{gcc.valuation.lse_block_step}, and the reduced problems of all blocks are
+    solved together for the coefficients of the time step.
+
+    @type    regression:    list
+    @param   regression:    a list of tuples of the (L+1) x n-arrays C{S}, C{X} and C{Y} of each block,
+                            and a L{gcc.valuation.ValuationWorkspace} for its scratch buffers,
+    @type    lse_opts:      C{dict}
+    @param   lse_opts:      a dictionary of options for the LSE, as for L{gcc.valuation.exp_holding_value_lse},
+    @type    discount:      (L+1)-array
+    @param   discount:      the discount factor of each time step.
+
+    @return:    a tuple containing an L x m-array with the coefficients of each time step
+                in its rows, and a list with the stopped payoffs M{R(sigma_1, tau_1)} of
+                each block.
+    """
+    L = regression[0][0].shape[0] - 1
+    m = lse_opts["m"]
+
+    coefficients    = np.zeros((L, m))
+    stopped_payoffs = [Y[L, :]*discount[L] for S, X, Y, workspace in regression] # tau_L = sigma_L = L for all paths
+    for j in range(L-2,-1,-1): # j = L-1, ..., 1
+        factors = []
+        rhs     = []
+        for (S, X, Y, workspace), R_sigma_tau in zip(regression, stopped_payoffs):
+            in_the_money = np.flatnonzero(Y[j, :] != 0)
+            if in_the_money.size > 0:
+                q, factor = np.linalg.qr(valuation.regression_basis(S[j, in_the_money], lse_opts))
+                factors.append(factor)
+                rhs.append(np.dot(q.T, R_sigma_tau[in_the_money]))
+
+        # If no path is in the money, the holding value is never used
+        if factors:
+            coefficients[j] = poly.lse_coefficients(np.vstack(factors), np.concatenate(rhs),
+                                                    lse_opts["solver"], lse_opts.get("diagnostics"))
+
+        # The bases are evaluated again rather than kept, so that only one block's is held at a time
+        for (S, X, Y, workspace), R_sigma_tau in zip(regression, stopped_payoffs):
+            update_from_coefficients(R_sigma_tau, S, X, Y, j, coefficients[j], lse_opts, discount, workspace)
+
+    return coefficients, stopped_payoffs
+
+
+def stopped_payoffs_from_coefficients(S, X, Y, coefficients, lse_opts, discount, workspace):
+    """
+    Calculates the stopped payoffs M{R(sigma_1, tau_1)} of a block of paths, with
+    the expected holding values given by fixed coefficients of the LSE.
+
+    @type    S:               (L+1) x n-array
+    @param   S:               the simulated underlying paths of the block,
+    @type    X:               (L+1) x n-array
+    @param   X:               the payoffs to the option holder when the writer terminates,
+    @type    Y:               (L+1) x n-array
+    @param   Y:               the payoffs to the option holder when he exercises,
+    @type    coefficients:    L x m-array
+    @param   coefficients:    the coefficients of each time step, see L{estimate_coefficients},
+    @type    lse_opts:        C{dict}
+    @param   lse_opts:        a dictionary of options for the LSE,
+    @type    discount:        (L+1)-array
+    @param   discount:        the discount factor of each time step,
+    @type    workspace:       L{gcc.valuation.ValuationWorkspace}
+    @param   workspace:       scratch buffers for the block.
+
+    @return:    an n-array of the stopped payoffs, in a buffer of C{workspace}.
+    """
+    L           = S.shape[0] - 1
+    R_sigma_tau = np.multiply(Y[L, :], discount[L], out=workspace.R_sigma_tau)
+    for j in range(L-2,-1,-1): # j = L-1, ..., 1
+        update_from_coefficients(R_sigma_tau, S, X, Y, j, coefficients[j], lse_opts, discount, workspace)
+    return R_sigma_tau
+
+
+def update_from_coefficients(R_sigma_tau, S, X, Y, j, coefficients_j, lse_opts, discount, workspace):
+    """
+    Takes one step back in the running stopped payoff of a block, with the
+    expected holding values of its in-the-money paths at time step M{j}
+    given by the coefficients C{coefficients_j} of the LSE.
+    """
+    in_the_money      = np.flatnonzero(Y[j, :] != 0)
+    exp_holding_value = workspace.exp_holding_value
+    exp_holding_value.fill(0)
+    exp_holding_value[in_the_money] = np.dot(valuation.regression_basis(S[j, in_the_money], lse_opts),
+                                             coefficients_j)
+    update_discounted(R_sigma_tau, X, Y, j, discount, exp_holding_value, workspace)
+
+
+def update_discounted(R_sigma_tau, X, Y, j, discount, exp_holding_value, workspace):
+    """
+    Takes one step back in the running stopped payoff with
+    L{gcc.valuation.update_stopped_payoffs}, discounting the payoffs at
+    time steps M{j} and M{j+1} into the buffers of C{workspace} first.
+    """
+    valuation.update_stopped_payoffs(R_sigma_tau,
+                                     valuation.discounted_row(X, j, discount, workspace.X_j),
+                                     valuation.discounted_row(Y, j, discount, workspace.Y_j),
+                                     valuation.discounted_row(X, j+1, discount, workspace.X_next),
+                                     valuation.discounted_row(Y, j+1, discount, workspace.Y_next),
+                                     exp_holding_value, workspace)
+
+
+class RunningMoments(object):
+    """
+    The number, mean and sum of squared deviations from the mean of a stream of
+    values, which are added a block at a time. Blocks are combined with the
+    pairwise update of Chan, Golub and LeVeque, which generalises Welford's
+    algorithm, so that the variance is accurate even for many values.
+    """
+
+    def __init__(self):
+        self.n    = 0
+        self.mean = 0.0
+        self.m2   = 0.0
+
+    def add(self, values):
+        """
+        Adds a block of values.
+
+        @type    values:    array
+        @param   values:    the values.
+        """
+        n_block = values.size
+        if n_block == 0:
+            return
+        mean_block = np.mean(values)
+        m2_block   = np.sum(np.square(values - mean_block))
+
+        n     = self.n + n_block
+        delta = mean_block - self.mean
+        self.mean += delta*n_block/n
+        self.m2   += m2_block + delta*delta*self.n*n_block/n
+        self.n     = n
+
+    def variance(self):
+        """
+        @return:    the sample variance of the values.
+        """
+        return self.m2/(self.n - 1)
+
+    def sum_of_squares(self, center):
+        """
+        @type    center:    number
+        @param   center:    the point to measure the deviations of the values from.
+
+        @return:    the sum of the squared deviations of the values from C{center}.
+        """
+        return self.m2 + self.n*(self.mean - center)**2
+
+
+class TemporaryStore(object):
+    """
+    The (L+1) x N-arrays C{S}, C{X} and C{Y} of the paths and payoffs of a
+    valuation, memory mapped from temporary C{.npy} files, so that they are
+    held by the page cache of the operating system rather than in memory.
+    The files are removed by L{close}, or at the end of a C{with} statement.
+    """
+
+    def __init__(self, N, L, dtype=np.float64, directory=None):
+        """
+        @type    N:            integer
+        @param   N:            the number of paths,
+        @type    L:            integer
+        @param   L:            the number of time steps,
+        @type    dtype:        type
+        @param   dtype:        the floating-point type of the arrays, see L{gcc.precision},
+        @type    directory:    string
+        @param   directory:    where to store the arrays, defaulting to the temporary directory.
+        """
+        self.names  = []
+        self.arrays = []
+        try:
+            for name in ("S", "X", "Y"):
+                fd, filename = tempfile.mkstemp(prefix="gcc-%s-" % name, suffix=".npy", dir=directory)
+                os.close(fd)
+                self.names.append(filename)
+                self.arrays.append(np.lib.format.open_memmap(filename, mode="w+", dtype=dtype, shape=(L+1, N)))
+        except:
+            self.close()
+            raise
+
+    def close(self):
+        """
+        Removes the files of the arrays.
+        """
+        del self.arrays[:]
+        for filename in self.names:
+            if os.path.exists(filename):
+                os.remove(filename)
+
+    def __enter__(self):
+        return tuple(self.arrays)
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -7,20 +7,46 @@ Created by Daniel Eliasson on 2009-06-02.
 Copyright (c) 2009 Daniel Eliasson. All rights reserved.
 """
 
+import os
+import mmap
+import uuid
+import ctypes
+import ctypes.util
+import tempfile
 import numpy as np
+from collections import OrderedDict
 from datetime import datetime
 import polynomials as poly
+import precision as prec
+import control_variates
+import kernels
 from multiprocessing import Pool
 
 
 def value_gcc(S, X, Y, r, T, **params):
     """
     Values a GCC. This function will delegate to C{value_single_threaded} unless
-    C{params} has a key C{parallel} with value C{True}, and C{n_workers} with an
-    integer value. Please note that the parallel processing always uses the no-lse
-    method.
+    C{params} has a key C{parallel} with value C{True}, and either C{n_workers} with an
+    integer value or C{pool} with a L{ValuationPool}. Please note that the parallel
+    processing uses the no-lse method of L{value_no_lse_block} unless C{m} is set, in which
+    case the LSE method is distributed over the workers by L{value_parallel_lse}.
+
+    The C{backend} parameter picks the implementation of the per-path decisions of
+    the backward induction; C{"numba"} for the compiled kernels of L{gcc.kernels},
+    C{"numpy"} for the vectorized NumPy code, or C{"auto"} (the default) for the
+    kernels if Numba is installed, and NumPy otherwise. The C{precision} parameter
+    of L{value_single_threaded} selects single precision valuations, see L{gcc.precision}.
+
+    C{X} and C{Y} may be functions of the time steps of C{S}, as described for
+    L{value_single_threaded}. The parallel valuations build the payoff arrays from them.
+    Control variates are only applied by L{value_single_threaded}. To grow the paths until
+    the price reaches a standard error or a deadline passes, see L{value_adaptive}.
     """
     if "parallel" in params and params["parallel"] is True:
+        if params.get("controls"):
+            raise ValueError("The parallel valuations don't apply control variates")
+        if callable(X):
+            X, Y = payoff_rows(X, S, 0, S.shape[0]), payoff_rows(Y, S, 0, S.shape[0])
         return value_parallel(S, X, Y, r, T, **params)
     else:
         return value_single_threaded(S, X, Y, r, T, **params)
@@ -33,10 +59,14 @@ def value_single_threaded(S, X, Y, r, T, **params):
     @type        S:            (L+1) x N-array
     @param       S:            the simulated underlying paths. L is the number of time steps - 1
                                (timesteps are numbered 0, 1, ..., L), and N is the number of simulated paths,
-    @type        X:            (L+1) x N-array
-    @param       X:            the payoffs to the option holder when the writer terminates,
-    @type        Y:            (L+1) x N-array
-    @param       Y:            the payoffs to the option holder when he exercises,
+    @type        X:            (L+1) x N-array or function
+    @param       X:            the payoffs to the option holder when the writer terminates, or
+                               a function taking the N-array C{S[j, :]} and the time step M{j},
+                               and returning the N-array C{X[j, :]}, e.g. from the
+                               C{payoff_functions} of a claim in L{gcc.claims},
+    @type        Y:            (L+1) x N-array or function
+    @param       Y:            the payoffs to the option holder when he exercises, or a function
+                               like C{X}. C{X} and C{Y} must both be arrays or both functions,
     @type        r:            number
     @param       r:            the risk-free interest rate,
     @type        T:            number
@@ -47,9 +77,48 @@ def value_single_threaded(S, X, Y, r, T, **params):
                                the LSE method of valuation,
     @type        proj_type:    string
     @keyword     proj_type:    the type of functions in the projection subspace, as recognised
-                               by L{gcc.polynomials}; e.g. C{"hermite"} or C{"laguerre"}.
+                               by L{gcc.polynomials}; e.g. C{"hermite"} or C{"laguerre"},
+    @type        solver:       string
+    @keyword     solver:       the least squares solver of the LSE, as recognised by
+                               L{gcc.polynomials.lse_coefficients}; C{"auto"} by default,
+    @type        lse_diagnostics:    boolean
+    @keyword     lse_diagnostics:    whether to record the solver, condition number and
+                                     solve time of each regression in the output,
+    @type        stopping_times:    boolean
+    @keyword     stopping_times:    whether to materialise the optimal stopping strategies
+                                    C{sigma} and C{tau} and emit them into the output,
+    @type        stopped_payoffs:    boolean
+    @keyword     stopped_payoffs:    whether to emit the discounted stopped payoffs
+                                     M{R(sigma_1, tau_1)} of the paths into the output,
+    @type        workspace:    L{ValuationWorkspace}
+    @keyword     workspace:    scratch buffers to reuse between valuations of the same
+                               N, L and m. It is not emitted into the output,
+    @type        backend:      string
+    @keyword     backend:      C{"auto"}, C{"numba"} or C{"numpy"}, see L{gcc.kernels.resolve_backend}.
+                               The backend that was used is emitted into the output,
+    @type        precision:    string
+    @keyword     precision:    C{"double"} or C{"single"}, see L{gcc.precision}. By default, the
+                               precision of C{X}. The precision is emitted into the output,
+    @type        controls:     list of C{dict}s
+    @keyword     controls:     control variates with known expectations, as described in
+                               L{gcc.control_variates}, e.g. C{[{"type": "stock"}]}.
 
     @note:    When C{m} is set, the LSE method will be employed, otherwise not.
+    @note:    Unless C{stopping_times} is C{True}, only the running discounted stopped
+              payoff is kept, see L{calculate_stopped_payoffs}, so the working set is
+              a few N-arrays rather than two L x N-arrays. With a warm C{workspace},
+              this path allocates next to nothing beyond the least squares solves.
+    @note:    C{X} and C{Y} are left unchanged. The payoffs are discounted a row at a
+              time into the workspace as the backward induction reaches them. When
+              C{X} and C{Y} are functions, each row is computed at that point, so only
+              C{S} is held in memory as a whole, unless C{stopping_times} is set.
+    @note:    C{S}, C{X} and C{Y} may be memory mapped, e.g. from
+              L{gcc.security_simulation.open_path_store}. The rows are then read ahead
+              of the backward induction, see L{ReadAhead}, and are held by the page cache.
+    @note:    In single precision, the paths, payoffs and running stopped payoffs are
+              C{float32}, and C{sigma} and C{tau} are C{int16} for M{L < 32768}. The
+              regressions of the LSE and the averaging over the paths are done in C{float64}.
+              Arrays of the other precision are converted to copies.
     @note:    Any further parameters will be ignored, but emitted into the output,
               so they can be used to annotate the output.
     @note:    The parameters C{S}, C{X}, and C{Y} must all be NumPy arrays with their shapes properly set.
@@ -61,30 +130,157 @@ def value_single_threaded(S, X, Y, r, T, **params):
                   - C{dev}, the square root of var,
                   - C{L}, the number of time steps - 1,
                   - C{dt}, the size of a timestep, equal to T/L
+                  - C{time}, the running time of the option pricing,
+                  - C{sigma} and C{tau}, the optimal stopping strategies,
+                    if C{stopping_times} was set,
+                  - C{R_sigma_tau}, an N-array of the discounted stopped payoffs, in
+                    C{float64} and without control variates, if C{stopped_payoffs} was set,
+                  - C{lse_diagnostics}, a list with a C{dict} for each regression in the
+                    order of the backward induction, if C{lse_diagnostics} was set.
+                    See L{gcc.polynomials.lse_coefficients} for the contents,
+                  - C{control_coefficients}, C{V_uncontrolled} and C{var_uncontrolled},
+                    the coefficients of the C{controls}, and the price and variance
+                    without them, if C{controls} was set. C{V} and C{var} are then
+                    those with the control variates.
+    """
+    t0 = datetime.now()
+    L  = S.shape[0] - 1
+    N  = S.shape[1]
+    r  = np.float64(r)
+    T  = np.float64(T)
+    dt = T/L
+
+    # Use LSE method?
+    lse_opts  = lse_options(params)
+    backend   = kernels.resolve_backend(params.get("backend", "auto"))
+    precision = params.get("precision", prec.precision_of(S if callable(X) else X))
+    dtype     = prec.float_type(precision)
+
+    # Memory maps are read through plain views, which don't carry the overhead of np.memmap
+    read_ahead = ReadAhead((S, X, Y))
+    S_view     = np.asarray(S, dtype)
+    if callable(X):
+        X_view, Y_view = X, Y
+    else:
+        X_view, Y_view = np.asarray(X, dtype), np.asarray(Y, dtype)
+
+    workspace = params.pop("workspace", None)
+    if workspace is None:
+        workspace = ValuationWorkspace(N, L, lse_opts.get("m"), dtype)
+    else:
+        workspace.check_shape(N, L, lse_opts, dtype)
+    discount = workspace.discount_factors(r, dt)
+
+    control_opts = control_options(params, S_view, r, T)
+
+    if params.get("stopping_times", False):
+        # The strategies are materialised anyway, so discount whole copies of the payoffs
+        X_discounted = payoff_rows(X_view, S_view, 0, L+1)*discount[:, np.newaxis]
+        Y_discounted = payoff_rows(Y_view, S_view, 0, L+1)*discount[:, np.newaxis]
+        sigma, tau   = calculate_optimal_stopping_times(S_view, X_discounted, Y_discounted, lse_opts, backend,
+                                                        prec.index_type(L, precision))
+        V, var       = average_gcc_prices_over_paths(X_discounted, Y_discounted, sigma, tau, control_opts)
+        params.update({"sigma": sigma, "tau": tau})
+        if params.get("stopped_payoffs", False):
+            R_sigma_tau = R(X_discounted, Y_discounted, sigma, tau, 0)
+    else:
+        R_sigma_tau = calculate_stopped_payoffs(S_view, X_view, Y_view, lse_opts, discount, workspace, backend, read_ahead)
+        # Only the payoffs at time 0 are used for the price
+        V, var      = average_stopped_payoffs(payoff_rows(X_view, S_view, 0, 1), payoff_rows(Y_view, S_view, 0, 1),
+                                              R_sigma_tau, workspace, control_opts)
+    dev = np.sqrt(var)
+    t1  = datetime.now()
+
+    if "diagnostics" in lse_opts:
+        params["lse_diagnostics"] = lse_opts["diagnostics"]
+    if params.get("stopped_payoffs", False):
+        # The running stopped payoff is a workspace buffer, so emit a copy
+        params["R_sigma_tau"] = np.array(R_sigma_tau, dtype=np.float64)
+    if "coefficients" in control_opts:
+        params.update({
+            "control_coefficients": [float(b) for b in control_opts["coefficients"]],
+            "V_uncontrolled":       control_opts["V_uncontrolled"],
+            "var_uncontrolled":     control_opts["var_uncontrolled"],
+        })
+
+    params.update({
+        "S":         S,
+        "X":         X,
+        "Y":         Y,
+        "r":         r,
+        "T":         T,
+        "V":         V,
+        "var":       var,
+        "dev":       dev,
+        "dt":        dt,
+        "L":         L,
+        "backend":   backend,
+        "precision": precision,
+        "time":      str(t1 - t0),
+    })
+    return params
+
+
+def value_gcc_batch(S, X, Y, r, T, **params):
+    """
+    Values a stack of GCCs on the same simulated paths in a single backward pass.
+    The discount factors and the basis functions of the LSE are computed once
+    per time step for all contracts, and contracts that are in the money on the
+    same paths share one factorization of the regression, solved with several
+    right-hand sides.
+
+    @type        S:            (L+1) x N-array
+    @param       S:            the simulated underlying paths. L is the number of time steps - 1
+                               (timesteps are numbered 0, 1, ..., L), and N is the number of simulated paths,
+    @type        X:            C x (L+1) x N-array
+    @param       X:            the payoffs to the option holder when the writer terminates, one
+                               (L+1) x N-array per contract, e.g. as built by the C{payoffs}
+                               functions in L{gcc.claims},
+    @type        Y:            C x (L+1) x N-array
+    @param       Y:            the payoffs to the option holder when he exercises,
+    @type        r:            number
+    @param       r:            the risk-free interest rate,
+    @type        T:            number
+    @param       T:            the maturity time, measured in years,
+    @param       params:       optional parameters, as for L{value_single_threaded}.
+
+    @note:    C{X} and C{Y} are left unchanged, as in L{value_single_threaded}. The payoffs
+              are discounted a time step at a time as the backward induction reaches them.
+              Sequences of arrays are stacked into new arrays.
+
+    @return:  a C{dict} object containing all the input parameters, as well as:
+                  - C{V}, a C-array of the option prices,
+                  - C{var}, a C-array of the Monte-Carlo variances,
+                  - C{dev}, the square roots of var,
+                  - C{L}, the number of time steps - 1,
+                  - C{dt}, the size of a timestep, equal to T/L
                   - C{time}, the running time of the option pricing.
     """
     t0 = datetime.now()
+    X  = np.asarray(X)
+    Y  = np.asarray(Y)
+    C  = X.shape[0]
     L  = S.shape[0] - 1
     r  = np.float64(r)
     T  = np.float64(T)
     dt = T/L
 
     # Use LSE method?
-    lse_opts = {}
-    if "m" in params:
-        lse_opts["m"] = params["m"]
-        if "proj_type" in params:
-            lse_opts["proj_type"] = params["proj_type"]
+    lse_opts = lse_options(params)
 
-    # Discount the payoff processes
-    for j in range(1, L):
-        X[j, :] = np.exp(-r*j*dt)*X[j, :]
-        Y[j, :] = np.exp(-r*j*dt)*Y[j, :]
+    # The discount factors are shared by all contracts
+    discount = discount_factors(r, dt, L)
+
+    R_sigma_tau = calculate_stopped_payoffs_batch(S, X, Y, lse_opts, discount)
+    V   = np.empty(C)
+    var = np.empty(C)
+    for c in range(C):
+        V[c], var[c] = average_stopped_payoffs(X[c], Y[c], R_sigma_tau[c])
+    dev = np.sqrt(var)
+    t1  = datetime.now()
 
-    sigma, tau = calculate_optimal_stopping_times(S, X, Y, lse_opts)
-    V, var     = average_gcc_prices_over_paths(X, Y, sigma, tau)
-    dev        = np.sqrt(var)
-    t1         = datetime.now()
+    if "diagnostics" in lse_opts:
+        params["lse_diagnostics"] = lse_opts["diagnostics"]
 
     params.update({
         "S":    S,
@@ -102,6 +298,350 @@ def value_single_threaded(S, X, Y, r, T, **params):
     return params
 
 
+def value_rqmc(simulate, payoffs, r, T, replicates=16, **params):
+    """
+    Values a GCC by randomised quasi-Monte Carlo; as the mean of the prices on
+    several independently randomised sets of low-discrepancy paths, e.g. the
+    replicates of L{gcc.security_simulation.black_scholes_qmc}. The points of a
+    low-discrepancy set aren't independent, so the variance over the paths doesn't
+    measure the error. The error is estimated from the spread of the prices of
+    the replicates instead.
+
+    @type        simulate:      function
+    @param       simulate:      a function taking the number of a replicate, and returning
+                                an (L+1) x n-array of its paths,
+    @type        payoffs:       function
+    @param       payoffs:       a function taking an (L+1) x n-array of paths, and returning
+                                a tuple of the (L+1) x n-arrays C{X} and C{Y}; e.g. the
+                                C{payoffs} function of a claim in L{gcc.claims} with its
+                                parameters bound,
+    @type        r:             number
+    @param       r:             the risk-free interest rate,
+    @type        T:             number
+    @param       T:             the maturity time, measured in years,
+    @type        replicates:    integer
+    @param       replicates:    the number of replicates, at least 2,
+    @param       params:        optional parameters, as for L{value_gcc}, which values each replicate.
+
+    @return:  a C{dict} object containing all the input parameters except the functions,
+              as well as:
+                  - C{V}, the option price, the mean of the prices of the replicates,
+                  - C{std_error}, the standard error of C{V}, estimated from the replicates,
+                  - C{var}, the variance per path that gives the same standard error
+                    over C{N} paths, so that C{dev} is comparable with L{value_gcc},
+                  - C{dev}, the square root of var,
+                  - C{V_replicates}, the prices of the replicates,
+                  - C{N}, the number of paths of all replicates,
+                  - C{L}, the number of time steps - 1,
+                  - C{dt}, the size of a timestep, equal to T/L
+                  - C{time}, the running time of the simulation and option pricing.
+    """
+    if replicates < 2:
+        raise ValueError("The error estimate takes at least 2 replicates")
+    t0 = datetime.now()
+    r  = np.float64(r)
+    T  = np.float64(T)
+
+    # The workspace is shared by the replicates, and not emitted into the output
+    options = dict(params)
+    params.pop("workspace", None)
+
+    V_replicates = np.empty(replicates)
+    N            = 0
+    for k in range(replicates):
+        S    = simulate(k)
+        X, Y = payoffs(S)
+        L    = S.shape[0] - 1
+        N   += S.shape[1]
+        V_replicates[k] = value_gcc(S, X, Y, r, T, **dict(options))["V"]
+        del S, X, Y
+
+    dt        = T/L
+    V         = np.mean(V_replicates)
+    std_error = np.std(V_replicates, ddof=1)/np.sqrt(replicates)
+    var       = N*std_error**2
+    dev       = np.sqrt(var)
+    t1        = datetime.now()
+
+    params.update({
+        "r":            r,
+        "T":            T,
+        "N":            N,
+        "replicates":   replicates,
+        "V":            V,
+        "std_error":    std_error,
+        "var":          var,
+        "dev":          dev,
+        "V_replicates": V_replicates,
+        "dt":           dt,
+        "L":            L,
+        "time":         str(t1 - t0),
+    })
+    return params
+
+
+def value_adaptive(simulate, payoffs, r, T, tolerance=None, deadline=None, N0=1000, max_N=None, **params):
+    """
+    Values a GCC on a path set grown in increments, until the standard error of
+    the price reaches C{tolerance}, or until the next increment would pass the
+    C{deadline}, whichever comes first. Each increment is valued by L{value_gcc},
+    and the discounted stopped payoffs of all paths are pooled for the price and
+    its variance. The size of each increment is the number of paths that the
+    variance so far says are missing for the tolerance, or as many as there are
+    paths so far without a tolerance. It is at most three times the paths so far,
+    so that the time per path is measured on increments of similar size, and no
+    more than fit before the deadline at the slowest time per path so far.
+
+    @type        simulate:     function
+    @param       simulate:     a function taking a number of paths n and the number of the
+                               increment, and returning an (L+1) x n-array of new, independent
+                               paths; e.g. C{lambda n, k: black_scholes(S0, r, volatility, T, n, L)[0]},
+    @type        payoffs:      function
+    @param       payoffs:      a function taking an (L+1) x n-array of paths, and returning
+                               a tuple of the (L+1) x n-arrays C{X} and C{Y}, as for L{value_rqmc},
+    @type        r:            number
+    @param       r:            the risk-free interest rate,
+    @type        T:            number
+    @param       T:            the maturity time, measured in years,
+    @type        tolerance:    number
+    @param       tolerance:    the target standard error of the price,
+    @type        deadline:     number
+    @param       deadline:     the wall-clock time in seconds after which no more paths are
+                               simulated. At least C{tolerance} or C{deadline} must be given.
+                               The first increment is always valued, since the time per path
+                               is only known after it,
+    @type        N0:           integer
+    @param       N0:           the even number of paths of the first increment, and the
+                               fewest paths of any later increment,
+    @type        max_N:        integer
+    @param       max_N:        an optional limit on the number of paths, at least C{N0},
+    @param       params:       optional parameters, as for L{value_gcc}, which values each increment.
+
+    @note:    Every increment has its own regressions for the LSE, so the increments
+              should be large enough for them, as are the default C{N0} and the
+              increments of several times the paths so far.
+
+    @return:  a C{dict} object containing all the input parameters except the functions,
+              as well as:
+                  - C{V}, the option price on all paths,
+                  - C{var}, the Monte-Carlo variance,
+                  - C{dev}, the square root of var,
+                  - C{std_error}, the standard error of C{V}, dev/sqrt(N),
+                  - C{N}, the number of paths used,
+                  - C{increments}, the number of increments of paths,
+                  - C{converged}, whether C{std_error} reached C{tolerance},
+                  - C{L}, the number of time steps - 1,
+                  - C{dt}, the size of a timestep, equal to T/L
+                  - C{time}, the running time of the simulation and option pricing.
+    """
+    if tolerance is None and deadline is None:
+        raise ValueError("A tolerance or a deadline is needed")
+    if max_N is not None and max_N < N0:
+        raise ValueError("max_N must be at least N0")
+    t0 = datetime.now()
+    r  = np.float64(r)
+    T  = np.float64(T)
+
+    # The increments have different numbers of paths, so they can't share a workspace
+    options = dict(params)
+    options.pop("workspace", None)
+    params.pop("workspace", None)
+    options["stopped_payoffs"] = True
+
+    N      = 0
+    k      = 0
+    sums   = np.zeros(3) # The sums of the stopped payoffs, the prices and the squared prices of the paths
+    n      = N0
+    seconds_per_path = 0
+    while n > 0:
+        t_increment = datetime.now()
+        S    = simulate(n, k)
+        X, Y = payoffs(S)
+        L    = S.shape[0] - 1
+        R_sigma_tau = value_gcc(S, X, Y, r, T, **dict(options))["R_sigma_tau"]
+        X_0, Y_0    = np.float64(X[0, 0]), np.float64(Y[0, 0])
+        V_paths     = np.minimum(X_0, np.maximum(Y_0, R_sigma_tau))
+        sums       += (np.sum(R_sigma_tau), np.sum(V_paths), np.sum(np.square(V_paths)))
+        N          += n
+        k          += 1
+        del S, X, Y, R_sigma_tau, V_paths
+
+        V         = min(X_0, max(Y_0, sums[0]/N))
+        var       = (sums[2] - 2*V*sums[1] + N*V**2)/(N-1)
+        std_error = np.sqrt(var/N)
+
+        seconds_per_path = max(seconds_per_path, seconds_since(t_increment)/n)
+        seconds_left     = None if deadline is None else deadline - seconds_since(t0)
+        n = next_increment(N, std_error, tolerance, N0, seconds_left, seconds_per_path, max_N)
+
+    dt = T/L
+    t1 = datetime.now()
+
+    params.update({
+        "r":          r,
+        "T":          T,
+        "tolerance":  tolerance,
+        "deadline":   deadline,
+        "N":          N,
+        "increments": k,
+        "converged":  tolerance is not None and std_error <= tolerance,
+        "V":          V,
+        "var":        var,
+        "dev":        np.sqrt(var),
+        "std_error":  std_error,
+        "dt":         dt,
+        "L":          L,
+        "time":       str(t1 - t0),
+    })
+    return params
+
+
+def next_increment(N, std_error, tolerance, N0, seconds_left, seconds_per_path, max_N):
+    """
+    Sizes the next increment of paths of L{value_adaptive}.
+
+    @return:    the even number of paths of the next increment, at least C{N0},
+                or 0 to stop.
+    """
+    if tolerance is not None:
+        if std_error <= tolerance:
+            return 0
+        n = int(np.ceil(N*((std_error/tolerance)**2 - 1)))
+    else:
+        n = N
+    n = max(min(n, 3*N), N0)
+    if seconds_left is not None:
+        n = min(n, int(seconds_left/seconds_per_path))
+    if max_N is not None:
+        n = min(n, max_N - N)
+    n -= n % 2
+    if n < N0:
+        return 0
+    return n
+
+
+def seconds_since(t0):
+    """
+    @return:    the wall-clock seconds since the C{datetime} C{t0}.
+    """
+    return (datetime.now() - t0).total_seconds()
+
+
+def value_spot_sweep(S_unit, payoffs, S0_values, r, T, in_place=False, **params):
+    """
+    Values a GCC for several starting values of the underlying, on paths rescaled
+    from one normalised path set simulated with M{S_0 = 1}, see
+    L{gcc.security_simulation.rescale}. The prices of all starting values use the
+    same random numbers, so their differences are less noisy than with paths
+    simulated for each, and the paths are simulated once. The rescaled paths are
+    written into one buffer, and the valuations share one L{ValuationWorkspace}.
+
+    @type        S_unit:       (L+1) x N-array
+    @param       S_unit:       the normalised paths, e.g. from
+                               C{black_scholes(1, r, volatility, T, N, L)},
+    @type        payoffs:      function
+    @param       payoffs:      a function taking an (L+1) x N-array of paths, and returning
+                               a tuple of C{X} and C{Y} as expected by L{value_gcc}; the
+                               arrays of the C{payoffs} of a claim in L{gcc.claims}, or
+                               its C{payoff_functions}, which only compute the payoffs of
+                               the rescaled paths a time step at a time,
+    @type        S0_values:    sequence of numbers
+    @param       S0_values:    the starting values of the underlying,
+    @type        r:            number
+    @param       r:            the risk-free interest rate,
+    @type        T:            number
+    @param       T:            the maturity time, measured in years,
+    @type        in_place:     boolean
+    @param       in_place:     whether to rescale C{S_unit} itself rather than a copy, which
+                               saves the memory of the buffer. C{S_unit} is rescaled from one
+                               starting value to the next, and scaled back once at the end,
+                               also if a valuation fails, up to rounding in the last places,
+    @param       params:       optional parameters, as for L{value_gcc}, which values the
+                               paths of each starting value.
+
+    @return:    a list of the outputs of L{value_gcc}, one for each starting value,
+                with the starting value as C{S0}. The paths and payoffs are left out,
+                since the buffer they refer to is overwritten.
+    """
+    L = S_unit.shape[0] - 1
+    N = S_unit.shape[1]
+
+    options = dict(params)
+    if "workspace" not in options and not options.get("parallel", False):
+        dtype = prec.float_type(options.get("precision", prec.precision_of(S_unit)))
+        options["workspace"] = ValuationWorkspace(N, L, lse_options(options).get("m"), dtype)
+
+    if in_place:
+        S = S_unit
+    else:
+        S = np.empty_like(S_unit)
+
+    valuations = []
+    scale      = 1 # The starting value that S_unit is scaled to in place
+    try:
+        for S0 in S0_values:
+            if in_place:
+                S *= S0/scale
+                scale = S0
+            else:
+                np.multiply(S_unit, S0, out=S)
+            X, Y = payoffs(S)
+            valuation = value_gcc(S, X, Y, r, T, **dict(options))
+            del X, Y
+            for key in ("S", "X", "Y"):
+                valuation.pop(key, None)
+            valuation["S0"] = S0
+            valuations.append(valuation)
+    finally:
+        if scale != 1:
+            S /= scale
+    return valuations
+
+
+def lse_options(params):
+    """
+    Collects the options for the LSE from the parameters of a valuation.
+
+    @type        params:    C{dict}
+    @param       params:    the parameters, as described for L{value_single_threaded}.
+
+    @return:    a C{dict} of options for the LSE, which is empty unless C{m} is set.
+    """
+    lse_opts = {}
+    if "m" in params:
+        lse_opts["m"]      = params["m"]
+        lse_opts["solver"] = params.get("solver", "auto")
+        if "proj_type" in params:
+            lse_opts["type"] = params["proj_type"]
+        if params.get("lse_diagnostics", False):
+            lse_opts["diagnostics"] = []
+    return lse_opts
+
+
+def control_options(params, S, r, T):
+    """
+    Evaluates the control variates of a valuation on its paths.
+
+    @type        params:    C{dict}
+    @param       params:    the parameters, as described for L{value_single_threaded},
+    @type        S:         (L+1) x N-array
+    @param       S:         the simulated underlying paths,
+    @type        r:         number
+    @param       r:         the risk-free interest rate,
+    @type        T:         number
+    @param       T:         the maturity time, measured in years.
+
+    @return:    a C{dict} with the k x N-array C{Z} of the discounted payoffs of the
+                controls and the k-array C{means} of their expectations, see
+                L{gcc.control_variates.control_matrix}, which is empty unless
+                C{controls} is set.
+    """
+    control_opts = {}
+    if params.get("controls"):
+        control_opts["Z"], control_opts["means"] = control_variates.control_matrix(params["controls"], S, r, T)
+    return control_opts
+
+
 def R(X, Y, sigma, tau, j):
     """
     Calculates the payoff M{R(sigma_j,tau_j)} from the GCC at time M{j}
@@ -120,10 +660,8 @@ def R(X, Y, sigma, tau, j):
 
     @return:    an N-array containing the payoffs.
     """
-    N               = X.shape[1]
-    I_sigma_lt_tau  = np.where(np.less(sigma[j, :], tau[j, :]), 1, 0)
-    I_tau_lte_sigma = 1 - I_sigma_lt_tau
-    R_sigma_tau_j   = X[sigma[j, :], range(N)]*I_sigma_lt_tau + Y[tau[j, :], range(N)]*I_tau_lte_sigma
+    paths         = np.arange(X.shape[1])
+    R_sigma_tau_j = np.where(np.less(sigma[j, :], tau[j, :]), X[sigma[j, :], paths], Y[tau[j, :], paths])
     return R_sigma_tau_j
 
 
@@ -152,26 +690,70 @@ def exp_holding_value_lse(S, X, Y, sigma, tau, j, lse_opts):
                               the LSE method of valuation,
     @type        type:        string
     @keyword     type:        the type of functions in the projection subspace, as recognised
-                              by L{gcc.polynomials}; e.g. C{"hermite"} or C{"laguerre"}.
+                              by L{gcc.polynomials}; e.g. C{"hermite"} or C{"laguerre"},
+    @type        solver:      string
+    @keyword     solver:      the least squares solver, as recognised by
+                              L{gcc.polynomials.lse_coefficients},
+    @type        diagnostics: list
+    @keyword     diagnostics: a list to append the details of each regression to.
 
     @return:    an N-array containing the expected holding values.
     """
-    N           = S.shape[1]
     R_sigma_tau = R(X, Y, sigma, tau, j+1)
+    return project_holding_value(S[j, :], Y[j, :], R_sigma_tau, lse_opts)
+
+
+def project_holding_value(S_j, Y_j, R_sigma_tau, lse_opts, workspace=None):
+    """
+    Projects the stopped payoffs M{R(sigma_{j+1}, tau_{j+1})} onto an
+    M{m}-dimensional subspace of polynomial functions of M{S_j}.
+
+    @type        S_j:           N-array
+    @param       S_j:           the underlying at time step M{j} for all paths,
+    @type        Y_j:           N-array
+    @param       Y_j:           the exercise payoffs at time step M{j} for all paths,
+    @type        R_sigma_tau:   N-array
+    @param       R_sigma_tau:   the stopped payoffs M{R(sigma_{j+1}, tau_{j+1})},
+    @type        lse_opts:      C{dict},
+    @param       lse_opts:      a dictionary of options for the LSE, as for L{exp_holding_value_lse},
+    @type        workspace:     L{ValuationWorkspace}
+    @param       workspace:     optional scratch buffers for the compacted paths, the basis
+                                and the result.
+
+    @return:    an N-array containing the expected holding values on the paths that are
+                in the money, and zero on the out-of-the-money paths, where it isn't used.
+                When C{workspace} is given, this is a buffer of the workspace, which is
+                overwritten by the next call.
+
+    @note:    Only the in-the-money paths are regressed on. They are compacted into
+              contiguous arrays first, and C{S_j} and C{R_sigma_tau} are left unchanged.
+              The basis is evaluated in C{float64}, whatever the precision of C{S_j}.
+    """
+    m = lse_opts["m"]
+    if workspace is None:
+        workspace = ValuationWorkspace(S_j.shape[0], 1, m, R_sigma_tau.dtype)
+
+    exp_holding_value = workspace.exp_holding_value
+    exp_holding_value.fill(0)
 
     # Don't consider out-of-the-money paths
-    S_j = S[j, :]
-    for n in range(N):
-        if Y[j, n] == 0:
-            S_j[n]         = 0
-            R_sigma_tau[n] = 0
+    in_the_money = np.not_equal(Y_j, 0, out=workspace.in_the_money)
+    n_itm        = np.count_nonzero(in_the_money)
+    if n_itm == 0:
+        return exp_holding_value
 
     # Calculate expected holding value of option using LSE
     if "type" in lse_opts:
-        lse = poly.lse(S_j, R_sigma_tau, lse_opts["m"], lse_opts["type"])
+        poly_type = lse_opts["type"]
     else:
-        lse = poly.lse(S_j, R_sigma_tau, lse_opts["m"], "laguerre")
-    return lse[1]
+        poly_type = "laguerre"
+    S_itm = np.compress(in_the_money, S_j, out=workspace.S_itm[:n_itm])
+    R_itm = np.compress(in_the_money, R_sigma_tau, out=workspace.R_itm[:n_itm])
+    lse   = poly.lse(S_itm, R_itm, m, poly_type, solver=lse_opts.get("solver", "auto"),
+                     out=workspace.fit[:n_itm], basis=workspace.basis[:n_itm, :m],
+                     diagnostics=lse_opts.get("diagnostics"))
+    np.place(exp_holding_value, in_the_money, lse[1])
+    return exp_holding_value
 
 
 def exp_holding_value_no_lse(S, X, Y, sigma, tau, j, lse_opts):
@@ -200,7 +782,7 @@ def exp_holding_value_no_lse(S, X, Y, sigma, tau, j, lse_opts):
     return R_sigma_tau
 
 
-def calculate_optimal_stopping_times(S, X, Y, lse_opts={}):
+def calculate_optimal_stopping_times(S, X, Y, lse_opts={}, backend="numpy", index_type=np.int32):
     """
     Calculates optimal stopping strategies for the payoff
     M{R(sigma, tau) = X_sigma*I(sigma < tau) + Y_tau*I(tau <= sigma)}.
@@ -218,7 +800,11 @@ def calculate_optimal_stopping_times(S, X, Y, lse_opts={}):
                               using the LSE method of valuation,
     @type        type:        string
     @keyword     type:        the type of functions in the projection subspace, as recognised
-                              by L{gcc.polynomials}; e.g. C{"hermite"} or C{"laguerre"}.
+                              by L{gcc.polynomials}; e.g. C{"hermite"} or C{"laguerre"},
+    @type        backend:     string
+    @param       backend:     C{"numba"} to use the kernels of L{gcc.kernels}, or C{"numpy"},
+    @type        index_type:  type
+    @param       index_type:  the integer type of C{sigma} and C{tau}, see L{gcc.precision.index_type}.
     @note:    When C{m} is set, the LSE method will be employed, otherwise not.
 
     @return:    L x N-arrays C{sigma} and C{tau}, containing the optimal stopping strategies
@@ -227,8 +813,8 @@ def calculate_optimal_stopping_times(S, X, Y, lse_opts={}):
     """
     L     = S.shape[0] - 1
     N     = S.shape[1]
-    tau   = np.empty((L, N), dtype=np.int32)
-    sigma = np.empty((L, N), dtype=np.int32)
+    tau   = np.empty((L, N), dtype=index_type)
+    sigma = np.empty((L, N), dtype=index_type)
 
     if "m" in lse_opts:
         exp_holding_value_func = exp_holding_value_lse
@@ -243,36 +829,409 @@ def calculate_optimal_stopping_times(S, X, Y, lse_opts={}):
     """
     tau[L-1, :]   = L # tau_L = L for all paths
     sigma[L-1, :] = L
+    R_next        = np.empty(N, dtype=X.dtype)
     for j in range(L-2,-1,-1): # j = L-1, ..., 1
+        if backend == "numba":
+            kernels.gather_stopped_payoffs(X, Y, sigma, tau, j+1, R_next)
+            if "m" in lse_opts:
+                exp_holding_value = project_holding_value(S[j, :], Y[j, :], R_next, lse_opts)
+            else:
+                exp_holding_value = R_next
+            kernels.update_stopping_times(sigma, tau, X, Y, j, exp_holding_value)
+            continue
+
         # Payoff if neither buyer nor seller exercises at j,
         # i.e. if exercise is at sigma_{j+1} or tau_{j+1}
         exp_holding_value = exp_holding_value_func(S, X, Y, sigma, tau, j, lse_opts)
 
-        for n in range(N):
-            # Out-of-the-money path
-            if Y[j, n] == 0:
-                tau[j, n]   = tau[j+1, n]
-                sigma[j, n] = sigma[j+1, n]
-                continue
-
-            # Exercise value less than expected holding value
-            if Y[j, n] < exp_holding_value[n]:
-                tau[j, n] = tau[j+1, n]
-            # Exercise value greater or equal to exp. holding value
-            else:
-                tau[j, n] = j+1
+        # Out-of-the-money paths keep the stopping times from j+1
+        in_the_money = Y[j, :] != 0
 
-            # Termination value less than expected holding value
-            if X[j, n] < exp_holding_value[n]:
-                sigma[j, n] = j+1
-            # Termination value greater or equal to exp. holding value
-            else:
-                sigma[j, n] = sigma[j+1, n]
+        # Exercise value greater or equal to exp. holding value
+        exercise = in_the_money & ~(Y[j, :] < exp_holding_value)
+        # Termination value less than expected holding value
+        terminate = in_the_money & (X[j, :] < exp_holding_value)
+
+        tau[j, :]   = np.where(exercise, j+1, tau[j+1, :])
+        sigma[j, :] = np.where(terminate, j+1, sigma[j+1, :])
 
     return sigma, tau
 
 
-def average_gcc_prices_over_paths(X, Y, sigma, tau):
+def calculate_stopped_payoffs(S, X, Y, lse_opts={}, discount=None, workspace=None, backend="numpy", read_ahead=None):
+    """
+    Calculates the discounted payoff M{R(sigma_1, tau_1)} at the optimal stopping
+    strategies, without materialising the strategies themselves.
+
+    Runs the same backward induction as L{calculate_optimal_stopping_times}, but
+    keeps only the current stopped payoff M{R(sigma_{j+1}, tau_{j+1})} for each path,
+    which is updated in place as M{j} goes backwards. Whenever a path stops at M{j+1},
+    its entry is overwritten by M{X_{j+1}} or M{Y_{j+1}}, so no gathers from C{X} and
+    C{Y} by stopping time are needed.
+
+    @param       S:           the simulated underlying paths. L is the number of time steps - 1
+                              (timesteps are numbered 0, 1, ..., L), and N is the number of simulated paths,
+    @type        X:           (L+1) x N-array or function
+    @param       X:           the payoffs to the option holder when the writer terminates,
+                              or a function of the time steps, as for L{value_single_threaded},
+    @type        Y:           (L+1) x N-array or function
+    @param       Y:           the payoffs to the option holder when he exercises,
+    @type        lse_opts:    C{dict},
+    @param       lse_opts:    a dictionary of options for the LSE, as for
+                              L{calculate_optimal_stopping_times},
+    @type        discount:    (L+1)-array
+    @param       discount:    the discount factor of each time step, see
+                              L{ValuationWorkspace.discount_factors}. If it is omitted,
+                              C{X} and C{Y} must already be discounted,
+    @type        workspace:   L{ValuationWorkspace}
+    @param       workspace:   optional scratch buffers for the valuation,
+    @type        backend:     string
+    @param       backend:     C{"numba"} to use the kernels of L{gcc.kernels}, or C{"numpy"},
+    @type        read_ahead:  L{ReadAhead}
+    @param       read_ahead:  optionally reads the rows of memory mapped arrays ahead.
+
+    @return:    an N-array equal to C{R(X, Y, sigma, tau, 0)} for the C{sigma} and C{tau}
+                returned by L{calculate_optimal_stopping_times}. When C{workspace} is
+                given, this is a buffer of the workspace.
+    """
+    L = S.shape[0] - 1
+    if workspace is None:
+        workspace = ValuationWorkspace(S.shape[1], L, lse_opts.get("m"), X.dtype)
+
+    if read_ahead is None:
+        read_ahead = ReadAhead(())
+    if backend == "numba" and not callable(X):
+        return calculate_stopped_payoffs_numba(S, X, Y, lse_opts, discount, workspace, read_ahead)
+
+    R_sigma_tau    = workspace.R_sigma_tau
+    X_j, Y_j       = workspace.X_j, workspace.Y_j
+    X_next, Y_next = workspace.X_next, workspace.Y_next
+
+    np.copyto(R_sigma_tau, discounted_row(Y, L, discount, Y_next, S)) # tau_L = sigma_L = L for all paths
+    X_next = discounted_row(X, L-1, discount, X_next, S)
+    Y_next = discounted_row(Y, L-1, discount, Y_next, S)
+
+    for j in range(L-2,-1,-1): # j = L-1, ..., 1
+        read_ahead.before_row(j)
+        X_j = discounted_row(X, j, discount, X_j, S)
+        Y_j = discounted_row(Y, j, discount, Y_j, S)
+
+        # Payoff if neither buyer nor seller exercises at j,
+        # i.e. if exercise is at sigma_{j+1} or tau_{j+1}
+        if "m" in lse_opts:
+            exp_holding_value = project_holding_value(S[j, :], Y_j, R_sigma_tau, lse_opts, workspace)
+        else:
+            exp_holding_value = R_sigma_tau
+
+        if backend == "numba":
+            kernels.update_stopped_payoff_rows(R_sigma_tau, X_j, Y_j, X_next, Y_next, exp_holding_value)
+        else:
+            update_stopped_payoffs(R_sigma_tau, X_j, Y_j, X_next, Y_next, exp_holding_value, workspace)
+
+        # The rows at j are the rows at j+1 of the next step
+        X_j, X_next = X_next, X_j
+        Y_j, Y_next = Y_next, Y_j
+
+    return R_sigma_tau
+
+
+def calculate_stopped_payoffs_numba(S, X, Y, lse_opts, discount, workspace, read_ahead):
+    """
+    L{calculate_stopped_payoffs} with the kernels of L{gcc.kernels}. Without the LSE,
+    and unless rows are read ahead, the whole backward induction is a single kernel.
+    Otherwise the regression of each time step is done by L{project_holding_value},
+    and the paths are updated by a kernel, which discounts the payoffs as it reads them.
+
+    @return:    the stopped payoffs, in a buffer of C{workspace}.
+    """
+    L = S.shape[0] - 1
+    if discount is None:
+        discount = np.ones(L+1)
+    R_sigma_tau = workspace.R_sigma_tau
+
+    if "m" not in lse_opts and not read_ahead.arrays:
+        return kernels.stopped_payoffs_no_lse(X, Y, discount, R_sigma_tau)
+
+    np.multiply(Y[L, :], discount[L], out=R_sigma_tau) # tau_L = sigma_L = L for all paths
+    for j in range(L-2,-1,-1): # j = L-1, ..., 1
+        read_ahead.before_row(j)
+        if "m" in lse_opts:
+            # Only whether Y_j is zero matters to the projection, so it needn't be discounted
+            exp_holding_value = project_holding_value(S[j, :], Y[j, :], R_sigma_tau, lse_opts, workspace)
+        else:
+            exp_holding_value = R_sigma_tau
+        kernels.update_stopped_payoffs(R_sigma_tau, X, Y, j, discount, exp_holding_value)
+    return R_sigma_tau
+
+
+def discount_factors(r, dt, L, out=None):
+    """
+    The discount factors M{exp(-r*j*dt)} of the time steps M{j = 1, ..., L-1}.
+    As in the original discounting of the payoffs, the factors of the first and
+    last time steps are 1.
+
+    @type    r:      number
+    @param   r:      the risk-free interest rate,
+    @type    dt:     number
+    @param   dt:     the size of a time step,
+    @type    L:      integer
+    @param   L:      the number of time steps,
+    @type    out:    (L+1)-array
+    @param   out:    an optional array to write the discount factors into.
+
+    @return:    an (L+1)-array of the discount factors.
+    """
+    if out is None:
+        out = np.empty(L+1)
+    out[:] = 1
+    for j in range(1, L):
+        out[j] = np.exp(-r*j*dt)
+    return out
+
+
+def discounted_row(Z, j, discount, out, S=None):
+    """
+    Discounts one time step of a payoff process.
+
+    @type        Z:           (L+1) x N-array or function
+    @param       Z:           the payoff process, or a function of the time steps of C{S},
+                              as for L{value_single_threaded},
+    @type        j:           integer
+    @param       j:           the time step,
+    @type        discount:    (L+1)-array
+    @param       discount:    the discount factor of each time step, or C{None} if C{Z}
+                              is already discounted,
+    @type        out:         N-array
+    @param       out:         the array to write the discounted payoffs into,
+    @type        S:           (L+1) x N-array
+    @param       S:           the simulated underlying paths, if C{Z} is a function.
+
+    @return:    C{out}, or the row C{Z[j, :]} itself if C{discount} is C{None}.
+    """
+    if callable(Z):
+        Z_j = np.asarray(Z(S[j, :], j), dtype=out.dtype)
+        if discount is None:
+            return Z_j
+        return np.multiply(Z_j, discount[j], out=out)
+    if discount is None:
+        return Z[j, :]
+    return np.multiply(Z[j, :], discount[j], out=out)
+
+
+def payoff_rows(Z, S, start, stop):
+    """
+    The time steps M{start, ..., stop-1} of a payoff process.
+
+    @type        Z:        (L+1) x N-array or function
+    @param       Z:        the payoff process, or a function of the time steps of C{S},
+                           as for L{value_single_threaded},
+    @type        S:        (L+1) x N-array
+    @param       S:        the simulated underlying paths,
+    @type        start:    integer
+    @param       start:    the first time step,
+    @type        stop:     integer
+    @param       stop:     the time step after the last one.
+
+    @return:    a (stop-start) x N-array of the payoffs; a view of C{Z} if it is an array,
+                and otherwise of the type of C{S}.
+    """
+    if not callable(Z):
+        return Z[start:stop]
+    return np.array([Z(S[j, :], j) for j in range(start, stop)], dtype=S.dtype)
+
+
+def update_stopped_payoffs(R_sigma_tau, X_j, Y_j, X_next, Y_next, exp_holding_value, workspace=None):
+    """
+    Takes one step back in the running stopped payoff, turning
+    M{R(sigma_{j+1}, tau_{j+1})} into M{R(sigma_j, tau_j)} in place.
+    All arguments must have the same shape, which may be an N-array for
+    a single contract or a C x N-array for a stack of contracts.
+
+    @param       R_sigma_tau:          the stopped payoffs M{R(sigma_{j+1}, tau_{j+1})}, updated in place,
+    @param       X_j:                  the termination payoffs at time step M{j},
+    @param       Y_j:                  the exercise payoffs at time step M{j},
+    @param       X_next:               the termination payoffs at time step M{j+1},
+    @param       Y_next:               the exercise payoffs at time step M{j+1},
+    @param       exp_holding_value:    the expected holding values at time step M{j},
+    @type        workspace:            L{ValuationWorkspace}
+    @param       workspace:            optional scratch buffers for the masks, for N-arrays only.
+
+    @return:    nothing
+    """
+    # Out-of-the-money paths keep the stopped payoff from j+1
+    if workspace is None:
+        in_the_money = Y_j != 0
+        exercise     = in_the_money & ~(Y_j < exp_holding_value)
+        terminate    = in_the_money & (X_j < exp_holding_value)
+    else:
+        in_the_money = np.not_equal(Y_j, 0, out=workspace.in_the_money)
+        exercise     = np.less(Y_j, exp_holding_value, out=workspace.exercise)
+        np.logical_not(exercise, out=exercise)
+        np.logical_and(exercise, in_the_money, out=exercise)
+        terminate    = np.less(X_j, exp_holding_value, out=workspace.terminate)
+        np.logical_and(terminate, in_the_money, out=terminate)
+
+    # Since tau_j <= sigma_j when both stop at j+1, exercise takes precedence,
+    # by being copied last
+    np.copyto(R_sigma_tau, X_next, where=terminate)
+    np.copyto(R_sigma_tau, Y_next, where=exercise)
+
+
+def calculate_stopped_payoffs_batch(S, X, Y, lse_opts={}, discount=None):
+    """
+    Calculates the discounted payoffs M{R(sigma_1, tau_1)} at the optimal stopping
+    strategies for a stack of contracts on the same paths, as L{calculate_stopped_payoffs}
+    does for a single contract.
+
+    @param       S:           the simulated underlying paths. L is the number of time steps - 1
+                              (timesteps are numbered 0, 1, ..., L), and N is the number of simulated paths,
+    @type        X:           C x (L+1) x N-array
+    @param       X:           the payoffs to the option holder when the writer terminates,
+    @type        Y:           C x (L+1) x N-array
+    @param       Y:           the payoffs to the option holder when he exercises,
+    @type        lse_opts:    C{dict},
+    @param       lse_opts:    a dictionary of options for the LSE, as for
+                              L{calculate_optimal_stopping_times},
+    @type        discount:    (L+1)-array
+    @param       discount:    the discount factor of each time step, see L{discount_factors}.
+                              If it is omitted, C{X} and C{Y} must already be discounted.
+
+    @return:    a C x N-array of the stopped payoffs for each contract.
+
+    @note:    C{X} and C{Y} are left unchanged. Each time step is discounted into
+              a new C x N-array as the backward induction reaches it.
+    """
+    L = S.shape[0] - 1
+    if discount is None:
+        discount = np.ones(L+1)
+
+    R_sigma_tau = np.array(Y[:, L, :], dtype=np.float64) # tau_L = sigma_L = L for all paths
+    R_sigma_tau *= discount[L]
+    X_next = X[:, L-1, :]*discount[L-1]
+    Y_next = Y[:, L-1, :]*discount[L-1]
+
+    for j in range(L-2,-1,-1): # j = L-1, ..., 1
+        X_j = X[:, j, :]*discount[j]
+        Y_j = Y[:, j, :]*discount[j]
+        if "m" in lse_opts:
+            exp_holding_value = project_holding_values_batch(S[j, :], Y_j, R_sigma_tau, lse_opts)
+        else:
+            exp_holding_value = R_sigma_tau
+
+        update_stopped_payoffs(R_sigma_tau, X_j, Y_j, X_next, Y_next, exp_holding_value)
+
+        # The rows at j are the rows at j+1 of the next step
+        X_next, Y_next = X_j, Y_j
+
+    return R_sigma_tau
+
+
+def project_holding_values_batch(S_j, Y_j, R_sigma_tau, lse_opts):
+    """
+    Projects the stopped payoffs of a stack of contracts onto an M{m}-dimensional
+    subspace of polynomial functions of M{S_j}, as L{project_holding_value} does for
+    a single contract.
+
+    The basis is evaluated once for all contracts. Only the in-the-money paths of each
+    contract are regressed on, so contracts that are in the money on the same paths have
+    the same regression matrix. They are grouped and solved together as one least squares
+    problem with several right-hand sides.
+
+    @type        S_j:           N-array
+    @param       S_j:           the underlying at time step M{j} for all paths,
+    @type        Y_j:           C x N-array
+    @param       Y_j:           the exercise payoffs at time step M{j} for all contracts and paths,
+    @type        R_sigma_tau:   C x N-array
+    @param       R_sigma_tau:   the stopped payoffs M{R(sigma_{j+1}, tau_{j+1})},
+    @type        lse_opts:      C{dict},
+    @param       lse_opts:      a dictionary of options for the LSE, as for L{exp_holding_value_lse}.
+
+    @return:    a C x N-array containing the expected holding values on the paths where
+                each contract is in the money, and zero elsewhere.
+    """
+    basis        = regression_basis(S_j, lse_opts)
+    in_the_money = Y_j != 0
+
+    groups = {}
+    for c in range(Y_j.shape[0]):
+        groups.setdefault(in_the_money[c].tostring(), []).append(c)
+
+    exp_holding_value = np.zeros_like(R_sigma_tau)
+    for contracts in groups.values():
+        itm = np.flatnonzero(in_the_money[contracts[0]])
+        if itm.size == 0:
+            continue
+
+        rows    = np.ix_(contracts, itm)
+        R_group = R_sigma_tau[rows].T
+        exp_holding_value[rows] = poly.lse_from_basis(basis[itm, :], R_group, lse_opts.get("solver", "auto"),
+                                                      diagnostics=lse_opts.get("diagnostics"))[1].T
+
+    return exp_holding_value
+
+
+def regression_basis(S_j, lse_opts):
+    """
+    Evaluates the basis functions of the LSE at M{S_j}, like L{project_holding_value} does.
+
+    @type        S_j:         N-array
+    @param       S_j:         the underlying at time step M{j},
+    @type        lse_opts:    C{dict},
+    @param       lse_opts:    a dictionary of options for the LSE, as for L{exp_holding_value_lse}.
+
+    @return:    an N x m-array of the evaluated basis functions.
+    """
+    if "type" in lse_opts:
+        poly_func = poly.get_eval_func(lse_opts["type"])
+    else:
+        poly_func = poly.get_eval_func("laguerre")
+    return poly_func(S_j, lse_opts["m"])
+
+
+def average_stopped_payoffs(X, Y, R_sigma_tau, workspace=None, control_opts={}):
+    """
+    Calculates the option price at time 0 as the minimum of M{X_0}
+    and the maximum of M{Y_0} and the average of M{R(sigma_1, tau_1)} over all paths.
+    With control variates, M{R(sigma_1, tau_1)} is first corrected by
+    L{gcc.control_variates.adjust}.
+
+    @type        X:              (L+1) x N-array
+    @param       X:              the payoffs to the option holder when the writer terminates,
+    @type        Y:              (L+1) x N-array
+    @param       Y:              the payoffs to the option holder when he exercises,
+    @type        R_sigma_tau:    N-array
+    @param       R_sigma_tau:    the discounted payoffs M{R(sigma_1, tau_1)} for all paths,
+    @type        workspace:      L{ValuationWorkspace}
+    @param       workspace:      optional scratch buffers for the per-path prices,
+    @type        control_opts:   C{dict}
+    @param       control_opts:   the control variates, see L{control_options}. The
+                                 C{coefficients} of the controls, and the price
+                                 C{V_uncontrolled} and variance C{var_uncontrolled}
+                                 without them, are stored in it.
+
+    @return:    a tuple containing the option price and the sample variance.
+
+    @note:    The sums are taken in C{float64}, also in single precision.
+    """
+    if "Z" in control_opts:
+        control_opts["V_uncontrolled"], control_opts["var_uncontrolled"] = \
+            average_stopped_payoffs(X, Y, R_sigma_tau, workspace)
+        R_sigma_tau, control_opts["coefficients"] = \
+            control_variates.adjust(R_sigma_tau, control_opts["Z"], control_opts["means"])
+    N = R_sigma_tau.shape[0]
+    V = np.min(np.array([X[0, 0], np.max(np.array([Y[0, 0], np.sum(R_sigma_tau, dtype=np.float64)/N]))]))
+    if workspace is None:
+        V_paths = np.asarray(np.minimum(X[0, 0], np.maximum(Y[0, 0], R_sigma_tau)), dtype=np.float64)
+        var     = np.sum(np.power(V_paths - V, 2))/(N-1)
+    else:
+        V_paths = np.maximum(Y[0, 0], R_sigma_tau, out=workspace.V_paths)
+        np.minimum(X[0, 0], V_paths, out=V_paths)
+        V_paths -= V
+        var     = np.sum(np.square(V_paths, out=V_paths))/(N-1)
+    return V, var
+
+
+def average_gcc_prices_over_paths(X, Y, sigma, tau, control_opts={}):
     """
     Calculates the option price at time 0 as the minimum of M{X_0}
     and the maximum of M{Y_0} and the average of M{R(sigma_1, tau_1)} over all paths.
@@ -285,15 +1244,13 @@ def average_gcc_prices_over_paths(X, Y, sigma, tau):
     @param       sigma:      the optimal stopping strategy for the writer of the option,
     @type        tau:        (L+1) x N-array
     @param       tau:        the optimal stopping strategy for the holder of the option,
+    @type        control_opts:    C{dict}
+    @param       control_opts:    the control variates, as for L{average_stopped_payoffs}.
 
     @return:    a tuple containing the option price and the sample variance.
     """
-    N           = Y.shape[1]
     R_sigma_tau = R(X, Y, sigma, tau, 0) # R at optimal stops for all paths
-    V_paths     = np.minimum(X[0, 0], np.maximum(Y[0, 0], R_sigma_tau))
-    V           = np.min(np.array([X[0, 0], np.max(np.array([Y[0, 0], np.sum(R_sigma_tau)/N]))]))
-    var         = np.sum(np.power(V_paths - V, 2))/(N-1)
-    return V, var
+    return average_stopped_payoffs(X, Y, R_sigma_tau, control_opts=control_opts)
 
 
 def value_parallel(S, X, Y, r, T, **params):
@@ -317,9 +1274,28 @@ def value_parallel(S, X, Y, r, T, **params):
                                the LSE method of valuation,
     @type        proj_type:    string
     @keyword     proj_type:    the type of functions in the projection subspace, as recognised
-                               by L{gcc.polynomials}; e.g. C{"hermite"} or C{"laguerre"}.
+                               by L{gcc.polynomials}; e.g. C{"hermite"} or C{"laguerre"},
+    @type        pool:         L{ValuationPool}
+    @keyword     pool:         a pool of worker processes to use; if not given, a pool with
+                               C{n_workers} processes is created and shut down for this valuation,
+    @type        n_workers:    integer
+    @keyword     n_workers:    the number of worker processes, if no C{pool} is given,
+    @type        chunk_size:   integer
+    @keyword     chunk_size:   the number of paths in each task, overriding the chunk size of the pool,
+    @type        transport:    string
+    @keyword     transport:    how the payoffs are handed to the workers; C{"shared"} (the default)
+                               writes them once to shared memory, see L{SharedArray}, and
+                               C{"pickle"} sends a copy of each block with its task. The LSE
+                               method keeps the stopped payoffs of the workers in shared memory
+                               between time steps, so it only supports C{"shared"},
+    @type        backend:      string
+    @keyword     backend:      C{"auto"}, C{"numba"} or C{"numpy"}, see L{gcc.kernels.resolve_backend}.
+                               It applies to the no-lse method only.
 
     @note:    When C{m} is set, the LSE method will be employed, otherwise not.
+    @note:    C{X} and C{Y} are left unchanged. The workers discount the payoffs as they
+              reach them and return the discounted stopped payoffs of their blocks, which
+              are averaged by L{average_stopped_payoffs}, as in L{value_single_threaded}.
     @note:    Any further parameters will be ignored, but emitted into the output,
               so they can be used to annotate the output.
     @note:    The parameters C{S}, C{X}, and C{Y} must all be NumPy arrays with their shapes properly set.
@@ -333,6 +1309,9 @@ def value_parallel(S, X, Y, r, T, **params):
                   - C{dt}, the size of a timestep, equal to T/L
                   - C{time}, the running time of the option pricing.
     """
+    if "m" in params:
+        return value_parallel_lse(S, X, Y, r, T, **params)
+
     t0 = datetime.now()
     L  = S.shape[0] - 1
     N  = S.shape[1]
@@ -340,21 +1319,129 @@ def value_parallel(S, X, Y, r, T, **params):
     T  = np.float64(T)
     dt = T/L
 
-    # Create list of parameter dictionaries to parallelise computation
-    parameters = [(X[:, n], Y[:, n], L, n) for n in range(0, N-1)]
+    backend  = kernels.resolve_backend(params.get("backend", "auto"))
+    discount = discount_factors(r, dt, L)
 
-    # Create a pool of processes
-    pool = Pool(params["n_workers"])
+    # Use the shared pool if there is one, so it isn't started for every valuation
+    pool     = params.pop("pool", None)
+    own_pool = pool is None
+    if own_pool:
+        pool = ValuationPool(params["n_workers"])
 
-    # Calculate valuations from each path
-    valuations = pool.map(value_no_lse, parameters)
+    shared = []
+    try:
+        # Split the paths into blocks, one task per block
+        blocks = pool.blocks(N, params.get("chunk_size"))
 
-    # Calculate average valuation and the variance
-    V   = np.mean(valuations)
-    var = np.var(valuations)
-    dev = np.sqrt(var)
+        # Calculate the discounted stopped payoffs of each path
+        if params.get("transport", "shared") == "shared":
+            shared      = [SharedArray(X), SharedArray(Y)]
+            parameters  = [(shared[0].name, shared[1].name, discount, start, stop, backend) for start, stop in blocks]
+            R_sigma_tau = np.concatenate(pool.map(value_no_lse_shared, parameters))
+        else:
+            parameters  = [(X[:, start:stop], Y[:, start:stop], discount, backend) for start, stop in blocks]
+            R_sigma_tau = np.concatenate(pool.map(value_no_lse_block, parameters))
+    finally:
+        for shared_array in shared:
+            shared_array.close()
+        if own_pool:
+            pool.close()
 
-    t1  = datetime.now()
+    V, var = average_stopped_payoffs(X, Y, R_sigma_tau)
+    dev    = np.sqrt(var)
+    t1     = datetime.now()
+
+    params.update({
+        "S":       S,
+        "X":       X,
+        "Y":       Y,
+        "r":       r,
+        "T":       T,
+        "V":       V,
+        "var":     var,
+        "dev":     dev,
+        "dt":      dt,
+        "L":       L,
+        "backend": backend,
+        "time":    str(t1 - t0),
+    })
+    return params
+
+
+def value_parallel_lse(S, X, Y, r, T, **params):
+    """
+    Values a GCC with the LSE method, distributing the paths over the workers of
+    a L{ValuationPool}. Gives the same valuation as L{value_single_threaded}, up to
+    floating-point differences in the regressions.
+
+    The paths are split into blocks, and each worker keeps the running stopped
+    payoffs of its blocks in shared memory. At each time step, every block reduces
+    its part of the regression to an m x m triangular factor of its Gram matrix and
+    the matching right-hand side. The parent solves the reduced least squares problem
+    for the coefficients, which are broadcast back with the tasks of the next step.
+
+    @param       params:       optional parameters, as for L{value_parallel}. C{m}
+                               must be set, and C{transport}, if given, must be C{"shared"}.
+
+    @note:    C{X} and C{Y} are left unchanged, as in L{value_single_threaded}. The
+              workers discount the rows of their blocks as they read them.
+
+    @return:  the same C{dict} as L{value_single_threaded}.
+    """
+    t0 = datetime.now()
+    L  = S.shape[0] - 1
+    N  = S.shape[1]
+    r  = np.float64(r)
+    T  = np.float64(T)
+    dt = T/L
+
+    if params.get("transport", "shared") != "shared":
+        raise ValueError("The parallel LSE valuation only supports the shared transport")
+
+    lse_opts = lse_options(params)
+    discount = discount_factors(r, dt, L)
+
+    pool     = params.pop("pool", None)
+    own_pool = pool is None
+    if own_pool:
+        pool = ValuationPool(params["n_workers"])
+
+    shared = []
+    try:
+        blocks = pool.blocks(N, params.get("chunk_size"))
+        shared = [SharedArray(S), SharedArray(X), SharedArray(Y),
+                  SharedArray(np.array(Y[L, :]*discount[L], dtype=np.float64))] # tau_L = sigma_L = L for all paths
+        names  = tuple(shared_array.name for shared_array in shared)
+
+        # Each round of tasks takes step j with the coefficients for j,
+        # and reduces the regression for step j-1
+        block_opts   = dict((k, v) for k, v in lse_opts.items() if k != "diagnostics")
+        coefficients = None
+        for j in range(L-1,-1,-1): # j = L-1, ..., 1
+            parameters = [names + (start, stop, j, coefficients, block_opts, discount) for start, stop in blocks]
+            factors    = pool.map(lse_block_step, parameters)
+            if j > 0:
+                factor = np.vstack([f[0] for f in factors])
+                rhs    = np.concatenate([f[1] for f in factors])
+                if factor.shape[0] > 0:
+                    coefficients = poly.lse_coefficients(factor, rhs, lse_opts["solver"], lse_opts.get("diagnostics"))
+                else:
+                    # No path is in the money, so the holding value is never used
+                    coefficients = np.zeros(lse_opts["m"])
+
+        R_sigma_tau = np.array(attach_shared_array(names[3]))
+    finally:
+        for shared_array in shared:
+            shared_array.close()
+        if own_pool:
+            pool.close()
+
+    V, var = average_stopped_payoffs(X, Y, R_sigma_tau)
+    dev    = np.sqrt(var)
+    t1     = datetime.now()
+
+    if "diagnostics" in lse_opts:
+        params["lse_diagnostics"] = lse_opts["diagnostics"]
 
     params.update({
         "S":    S,
@@ -372,21 +1459,387 @@ def value_parallel(S, X, Y, r, T, **params):
     return params
 
 
-def value_no_lse(params):
-    X_n               = params[0]
-    Y_n               = params[1]
-    L                 = params[2]
-    n                 = params[3]
-    exp_holding_value = Y_n[L]
-    for j_p in range(L-1, -1, -1): # j = L-1, ..., 1
-        if Y_n[j_p] == 0:
-            continue
+def lse_block_step(params):
+    """
+    Takes one step of the distributed LSE valuation for a block of paths, see
+    L{value_parallel_lse}. With coefficients for step M{j}, the running stopped payoffs
+    of the block are updated to M{R(sigma_j, tau_j)}. Then the regression of these
+    payoffs on the basis at step M{j-1} is reduced to a triangular factor M{F} and a
+    right-hand side M{z}, such that M{F^T F} and M{F^T z} are the block's parts of the
+    normal equations, without squaring their condition number.
 
-        if Y_n[j_p] > exp_holding_value:
-            exp_holding_value = Y_n[j_p]
-            continue
+    @param      params:    a tuple containing the names of the L{SharedArray}s holding
+                           C{S}, C{X}, C{Y} and the stopped payoffs, the first and one
+                           past the last path of the block, the time step C{j}, the
+                           coefficients for step C{j} or C{None}, the LSE options, and
+                           the discount factors, see L{discount_factors}. C{X} and C{Y}
+                           are discounted as they are read.
+
+    @return:    a tuple of the factor M{F} and the right-hand side M{z}, or
+                C{None} after the last step.
+    """
+    S           = attach_shared_array(params[0])
+    X           = attach_shared_array(params[1])
+    Y           = attach_shared_array(params[2])
+    start, stop = params[4], params[5]
+    R_sigma_tau = attach_shared_array(params[3], writable=True)[start:stop]
+    j           = params[6]
+    coefs       = params[7]
+    lse_opts    = params[8]
+    discount    = params[9]
 
-        if X_n[j_p] < exp_holding_value:
-            exp_holding_value = X_n[j_p]
+    if coefs is not None:
+        in_the_money      = np.flatnonzero(Y[j, start:stop] != 0)
+        exp_holding_value = np.zeros(stop - start)
+        exp_holding_value[in_the_money] = np.dot(regression_basis(S[j, start:stop][in_the_money], lse_opts), coefs)
+        update_stopped_payoffs(R_sigma_tau, X[j, start:stop]*discount[j], Y[j, start:stop]*discount[j],
+                               X[j+1, start:stop]*discount[j+1], Y[j+1, start:stop]*discount[j+1],
+                               exp_holding_value)
+    j -= 1
+    if j < 0:
+        return None
 
-    return exp_holding_value
+    # Don't consider out-of-the-money paths
+    in_the_money = np.flatnonzero(Y[j, start:stop] != 0)
+    if in_the_money.size == 0:
+        return np.empty((0, lse_opts["m"])), np.empty(0)
+    basis     = regression_basis(S[j, start:stop][in_the_money], lse_opts)
+    q, factor = np.linalg.qr(basis)
+    return factor, np.dot(q.T, R_sigma_tau[in_the_money])
+
+
+def value_no_lse_block(params):
+    """
+    Calculates the discounted stopped payoffs M{R(sigma_1, tau_1)} of a block of
+    paths with the no-lse method, giving the same result for each path as
+    L{calculate_stopped_payoffs}.
+
+    @param      params:    a tuple containing the (L+1) x n-arrays C{X} and C{Y}
+                           for a block of n paths, the (L+1)-array of discount
+                           factors, see L{discount_factors}, and optionally the
+                           backend, C{"numba"} or C{"numpy"}.
+
+    @return:    an n-array of the discounted stopped payoffs of each path.
+    """
+    X_block  = params[0]
+    Y_block  = params[1]
+    discount = params[2]
+    if len(params) > 3 and params[3] == "numba":
+        return kernels.block_stopped_payoffs_no_lse(X_block, Y_block, discount,
+                                                    np.empty(X_block.shape[1], dtype=X_block.dtype))
+
+    # Without the LSE, the paths are only used for their shape, which is that of the payoffs
+    return calculate_stopped_payoffs(X_block, X_block, Y_block, discount=discount)
+
+
+def value_no_lse_shared(params):
+    """
+    Calculates the discounted stopped payoffs of a block of paths, like L{value_no_lse_block},
+    reading the payoffs from shared memory.
+
+    @param      params:    a tuple containing the names of the L{SharedArray}s holding
+                           C{X} and C{Y}, the discount factors, the first and one
+                           past the last path of the block, and the backend.
+
+    @return:    an n-array of the discounted stopped payoffs of each path.
+    """
+    X           = attach_shared_array(params[0])
+    Y           = attach_shared_array(params[1])
+    discount    = params[2]
+    start, stop = params[3], params[4]
+    return value_no_lse_block((X[:, start:stop], Y[:, start:stop], discount, params[5]))
+
+
+def shared_memory_dir():
+    """
+    @return:    the directory used for L{SharedArray}s; C{/dev/shm} where it
+                exists, so that the arrays are kept in memory, and otherwise
+                the temporary directory.
+    """
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+# The shared arrays each worker process is attached to, most recently used last. A
+# valuation runs on one pool at a time, and its tasks attach to at most four arrays;
+# the X and Y pair of the no-lse method, or S, X, Y and the stopped payoffs of the
+# LSE. So four attachments keep a valuation's arrays mapped across all its tasks,
+# and those of earlier valuations, which have been removed, are released.
+attached_shared_arrays     = OrderedDict()
+max_attached_shared_arrays = 4
+
+
+def attach_shared_array(name, writable=False):
+    """
+    Attaches to an array written by L{SharedArray}, without copying it.
+    Each process keeps its last few attachments open, so that the tasks of
+    a valuation don't have to map the array again.
+
+    @type    name:        string
+    @param   name:        the name of the shared array,
+    @type    writable:    boolean
+    @param   writable:    whether writes to the view should go to the shared array.
+
+    @return:    a view of the array, read-only unless C{writable} is set.
+    """
+    key = (name, writable)
+    if key in attached_shared_arrays:
+        array = attached_shared_arrays.pop(key)
+    else:
+        # A plain ndarray view avoids the np.memmap overhead on every operation
+        array = np.load(name, mmap_mode="r+" if writable else "r").view(np.ndarray)
+        while len(attached_shared_arrays) >= max_attached_shared_arrays:
+            attached_shared_arrays.popitem(last=False)
+    attached_shared_arrays[key] = array
+    return array
+
+
+class SharedArray(object):
+    """
+    A copy of a NumPy array in shared memory, which worker processes can attach
+    to by name with L{attach_shared_array}, instead of having the array pickled
+    and sent to them. The array is stored as an C{.npy} file in
+    L{shared_memory_dir}, and is removed by L{close}.
+    """
+
+    def __init__(self, array, directory=None):
+        """
+        @type    array:        NumPy array
+        @param   array:        the array to share,
+        @type    directory:    string
+        @param   directory:    where to store the array, defaulting to L{shared_memory_dir}.
+        """
+        if directory is None:
+            directory = shared_memory_dir()
+        # Names are never reused, since workers may still be attached to removed arrays
+        fd, self.name = tempfile.mkstemp(prefix="gcc-%s-" % uuid.uuid4().hex, suffix=".npy", dir=directory)
+        os.close(fd)
+
+        view      = np.lib.format.open_memmap(self.name, mode="w+", dtype=array.dtype, shape=array.shape)
+        view[...] = array
+        view.flush()
+        del view
+
+    def close(self):
+        """
+        Removes the shared array. Processes that are still attached keep their
+        views, and the memory is released when they detach.
+        """
+        if os.path.exists(self.name):
+            os.remove(self.name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ValuationPool(object):
+    """
+    A long-lived pool of worker processes, which can be shared between
+    valuations by passing it as the C{pool} parameter of L{value_gcc}.
+    The paths are handed to the workers in blocks of C{chunk_size} paths,
+    rather than one task per path.
+
+    The pool should be shut down with L{close} when it is no longer needed,
+    or used in a C{with} statement.
+    """
+
+    def __init__(self, n_workers=None, chunk_size=1000):
+        """
+        @type    n_workers:     integer
+        @param   n_workers:     the number of worker processes, defaulting to the number of CPUs,
+        @type    chunk_size:    integer
+        @param   chunk_size:    the default number of paths in each task.
+        """
+        self.n_workers  = n_workers
+        self.chunk_size = chunk_size
+        self.pool       = Pool(n_workers)
+
+    def blocks(self, N, chunk_size=None):
+        """
+        Splits M{N} paths into consecutive blocks.
+
+        @type    N:             integer
+        @param   N:             the number of paths,
+        @type    chunk_size:    integer
+        @param   chunk_size:    the number of paths in each block, defaulting to the chunk size of the pool.
+
+        @return:    a list of C{(start, stop)} tuples, one for each block.
+        """
+        if chunk_size is None:
+            chunk_size = self.chunk_size
+        return [(start, min(start + chunk_size, N)) for start in range(0, N, chunk_size)]
+
+    def map(self, func, tasks):
+        """
+        Applies C{func} to each task in the worker processes.
+
+        @return:    a list of the results, in the order of C{tasks}.
+        """
+        return self.pool.map(func, tasks)
+
+    def close(self):
+        """
+        Shuts down the worker processes once they have finished their tasks.
+        """
+        self.pool.close()
+        self.pool.join()
+
+    def terminate(self):
+        """
+        Stops the worker processes immediately, discarding any outstanding tasks.
+        """
+        self.pool.terminate()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.terminate()
+
+
+class ValuationWorkspace(object):
+    """
+    Scratch buffers for the backward induction of L{value_single_threaded}, which
+    can be passed as its C{workspace} parameter to reuse them between valuations
+    of the same number of paths M{N}, time steps M{L} and basis functions M{m}.
+
+    The workspace also caches the discount factors of the last M{r} and M{dt}
+    it was used with. A workspace must not be shared between threads.
+    """
+
+    def __init__(self, N, L, m=None, dtype=np.float64):
+        """
+        @type    N:        integer
+        @param   N:        the number of paths,
+        @type    L:        integer
+        @param   L:        the number of time steps - 1,
+        @type    m:        integer
+        @param   m:        the largest number of basis functions of the LSE, or C{None}
+                           if the LSE method will not be used,
+        @type    dtype:    type
+        @param   dtype:    the floating-point type of the paths and payoffs, see L{gcc.precision}.
+        """
+        self.N     = N
+        self.L     = L
+        self.m     = m
+        self.dtype = np.dtype(dtype)
+
+        # The running stopped payoff, and the discounted payoffs at time steps j and j+1
+        self.R_sigma_tau = np.empty(N, dtype)
+        self.X_j         = np.empty(N, dtype)
+        self.Y_j         = np.empty(N, dtype)
+        self.X_next      = np.empty(N, dtype)
+        self.Y_next      = np.empty(N, dtype)
+        self.V_paths     = np.empty(N)
+
+        self.in_the_money = np.empty(N, dtype=bool)
+        self.exercise     = np.empty(N, dtype=bool)
+        self.terminate    = np.empty(N, dtype=bool)
+
+        # The LSE regresses on the leading rows of these, one per in-the-money path.
+        # The basis, the fit and the holding values are float64 in any precision.
+        if m is not None:
+            self.exp_holding_value = np.empty(N)
+            self.S_itm             = np.empty(N, dtype)
+            self.R_itm             = np.empty(N, dtype)
+            self.fit               = np.empty(N)
+            self.basis             = np.empty((N, m))
+
+        # Discounting in the precision of the payoffs keeps the discounted rows in it
+        self.discount      = np.empty(L+1, dtype)
+        self.discount_rate = None
+
+    def discount_factors(self, r, dt):
+        """
+        The discount factors of L{discount_factors}, computed once for each M{r} and M{dt}.
+
+        @type    r:     number
+        @param   r:     the risk-free interest rate,
+        @type    dt:    number
+        @param   dt:    the size of a time step.
+
+        @return:    an (L+1)-array of the discount factors, owned by the workspace.
+        """
+        if self.discount_rate != (r, dt):
+            discount_factors(r, dt, self.L, self.discount)
+            self.discount_rate = (r, dt)
+        return self.discount
+
+    def check_shape(self, N, L, lse_opts, dtype=np.float64):
+        """
+        Raises a C{ValueError} unless the workspace fits a valuation of M{N} paths
+        and M{L} time steps with the given LSE options and floating-point type.
+        """
+        if N != self.N or L != self.L:
+            raise ValueError("Workspace is for N = %i, L = %i, not N = %i, L = %i" % (self.N, self.L, N, L))
+        if np.dtype(dtype) != self.dtype:
+            raise ValueError("Workspace is for %s, not %s" % (self.dtype, np.dtype(dtype)))
+        if "m" in lse_opts and (self.m is None or lse_opts["m"] > self.m):
+            raise ValueError("Workspace is for m = %s, not m = %i" % (self.m, lse_opts["m"]))
+
+
+class ReadAhead(object):
+    """
+    Asks the operating system to read the rows of memory mapped arrays ahead of the
+    backward induction. The page cache reads ahead by itself when a file is read
+    forwards, but the time steps are visited backwards, so without this every few
+    rows would wait for the disk.
+
+    Arrays that aren't backed by a file are ignored, as is everything on systems
+    without C{madvise}.
+    """
+
+    def __init__(self, arrays, rows=32):
+        """
+        @type    arrays:    sequence
+        @param   arrays:    the (L+1) x N-arrays of the valuation,
+        @type    rows:      integer
+        @param   rows:      the number of rows to read ahead at a time.
+        """
+        self.arrays = [a for a in arrays if isinstance(a, np.memmap) and a.filename is not None
+                       and a.flags.c_contiguous and madvise is not None]
+        self.rows   = rows
+        self.lowest = None
+
+    def before_row(self, j):
+        """
+        Called before row M{j} is read. When M{j} is halfway through the rows that
+        have been read ahead, the next C{rows} rows below M{j} are read ahead.
+        """
+        if not self.arrays:
+            return
+        if self.lowest is not None and j - self.rows/2 >= self.lowest:
+            return
+        start = max(0, j - self.rows)
+        stop  = j+1 if self.lowest is None else self.lowest
+        for array in self.arrays:
+            if start < stop:
+                will_need(array[start:stop])
+        self.lowest = start
+
+
+def will_need(array):
+    """
+    Advises the operating system that the memory of a contiguous array
+    will be needed soon, so the pages of a memory map are read into the page cache.
+    """
+    address = array.__array_interface__["data"][0]
+    offset  = address % mmap.PAGESIZE
+    madvise(ctypes.c_void_p(address - offset), ctypes.c_size_t(array.nbytes + offset), MADV_WILLNEED)
+
+
+# madvise from the C library, if there is one
+MADV_WILLNEED = 3
+try:
+    madvise          = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True).madvise
+    madvise.argtypes = [ctypes.c_void_p, ctypes.c_size_t, ctypes.c_int]
+except (OSError, AttributeError, TypeError):
+    madvise = None